@@ -0,0 +1,630 @@
+#!/usr/bin/env python
+
+"""
+Performance benchmarks, with regression tracking.
+
+Each benchmark case times a workload (best of several runs), then runs it once
+more under tracemalloc to measure the peak memory allocated. The rates are
+reported per unit of work:
+
+    steps: integration steps (the stored samples of the trajectory),
+           quadrature sample points, elimination steps and determinants,
+           iterations of the iterative linear solvers, or target points of
+           the batch and tree electrostatics
+    evals: calls of the function being integrated (ODE right-hand side or
+           integrand)
+
+Usage:
+
+    python benchmarks/bench.py run [-o results.json] [--scale S]
+                                   [--repeat R] [--filter TEXT]
+                                   [--baseline baseline.json]
+    python benchmarks/bench.py compare baseline.json results.json
+                                       [--tolerance T] [--memory-tolerance M]
+
+The scale multiplies the problem sizes: the number of steps of the fixed-step
+integrators (over the same time span), the number of quadrature points, the
+sizes of the linear systems (Gaussian elimination, LU decomposition, matrix
+products, the sparse Poisson problems and the tridiagonal systems), and the
+numbers of charges and points in the batch and tree electrostatics. Small
+scales are clamped to minimum sizes that still give valid, stable problems;
+only the cases selected by --filter build their data. The adaptive
+integrators are driven by their tolerances, and the cost of the determinant
+by minors grows factorially, so those are not scaled.
+
+"compare" exits with status 1 if any case got slower, or used more memory,
+than the baseline by more than the tolerance (a fraction).
+"""
+
+import argparse
+import datetime
+import functools
+import gc
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from souffle.datatypes import BandedMatrix, Matrix, SparseMatrix
+from souffle.math import chaos, integral, linalg, lineq, odeint
+from souffle.physics import astro, elecstat, oscillators
+
+#### Workloads
+
+class CountingRHS(object):
+    """
+    Wraps a function, counting its calls.
+
+    @type  f: function
+    @param f: function to wrap
+    """
+    def __init__(self, f):
+        self.f = f
+        self.n_calls = 0
+
+    def __call__(self, *args, **kwargs):
+        self.n_calls += 1
+        return self.f(*args, **kwargs)
+
+# The bundled ODE functions: function, initial time, initial state, kwargs,
+# time span, tolerances of RK4Adaptive and of the Bulirsch-Stoer integrators,
+# and the indices of the components for RK4Adaptive's error estimate (the
+# mass of stellar_structure is integrated exactly by RK4)
+ODE_PROBLEMS = {
+    "lorenz": (chaos.lorenz_attractor, 0.0, [1.0, 1.0, 1.0],
+               {"sigma": 10.0, "rho": 28.0, "beta": 8.0 / 3}, 10.0,
+               1e-6, 1e-6, [0, 1, 2]),
+    "vanderpol": (oscillators.vanderpol, 0.0, [1.0, 0.0],
+                  {"mu": 5.0, "omega": 1.0}, 20.0, 1e-6, 1e-6, [0, 1]),
+    "orbit_1body": (astro.orbit_1body, 0.0, [1.496e11, 0.0, 0.0, 29780.0],
+                    {}, 3.156e7, 1e-4, 1e-4, [0, 1, 2, 3]),
+    "stellar_structure": (astro.stellar_structure, 1e6, [0.0, 1.0],
+                          {"mu": 2.0, "T": 500.0}, 5e8, 1e-14, 1e3, [1]),
+}
+
+# Number of steps of the fixed-step integrators (at scale 1); Bulirsch-Stoer
+# takes fewer, longer steps
+N_STEPS = 2000
+N_STEPS_BULSTO = 200
+# Fewest steps at small scales: with much fewer, Euler and RK4 blow up on
+# the van der Pol problem, and Bulirsch-Stoer steps need huge numbers of
+# substeps to converge
+MIN_STEPS = 500
+MIN_STEPS_BULSTO = 50
+# BulStoAdaptive integrates the span in this many intervals, since it starts
+# by attempting each interval in a single step
+N_INTERVALS_BULSTO_ADAPTIVE = 20
+
+def _size(n, scale, minimum=2):
+    """
+    Returns a problem size multiplied by the scale, but no smaller than a
+    minimum, so that small scales still give valid problems.
+
+    @type        n: number
+    @param       n: problem size at scale 1
+    @type    scale: number
+    @param   scale: problem size multiplier
+    @type  minimum: number
+    @param minimum: smallest size allowed
+
+    @rtype: number
+    @return: the scaled size
+    """
+    return max(minimum, int(n * scale))
+
+def _ode_case(integrator, problem, scale):
+    """
+    Returns a run of an integrator on one of the ODE problems.
+
+    @type  integrator: string
+    @param integrator: name of the integrator class in odeint
+    @type     problem: string
+    @param    problem: name of the ODE problem
+    @type       scale: number
+    @param      scale: problem size multiplier
+
+    @rtype: function
+    @return: run() returning the number of steps and evaluations
+    """
+    (f, t0, X0, kwargs, span, delta_rk4, delta,
+     indices) = ODE_PROBLEMS[problem]
+
+    def run():
+        rhs = CountingRHS(f)
+        if integrator in ("Euler", "RK4"):
+            n_steps = _size(N_STEPS, scale, MIN_STEPS)
+            ode = getattr(odeint, integrator)(rhs, t0, X0, **kwargs)
+            ode.integrate(span / n_steps, n_steps)
+        elif integrator == "RK4Adaptive":
+            ode = odeint.RK4Adaptive(rhs, t0, X0, **kwargs)
+            ode.integrate(span, span / N_STEPS, delta_rk4, indices)
+        elif integrator == "BulSto":
+            n_steps = _size(N_STEPS_BULSTO, scale, MIN_STEPS_BULSTO)
+            ode = odeint.BulSto(rhs, t0, X0, **kwargs)
+            ode.integrate(span / n_steps, n_steps, delta)
+        elif integrator == "BulStoAdaptive":
+            ode = odeint.BulStoAdaptive(rhs, **kwargs)
+            dt = span / N_INTERVALS_BULSTO_ADAPTIVE
+            ode.integrate(dt, delta, t0=t0, X0=X0)
+            for i in range(N_INTERVALS_BULSTO_ADAPTIVE - 1):
+                ode.integrate(dt, delta, t0=ode.t_cur, X0=ode.X_cur)
+        else:
+            raise ValueError("Unknown integrator: %s" % integrator)
+        return len(ode.t) - 1, rhs.n_calls
+
+    return run
+
+def _quadrature_case(method, scale):
+    """
+    Returns a run of a quadrature rule.
+
+    @type  method: string
+    @param method: name of the rule in integral
+    @type   scale: number
+    @param  scale: problem size multiplier
+
+    @rtype: function
+    @return: run() returning the number of steps and evaluations
+    """
+    n = _size(100000, scale)
+
+    def run():
+        f = CountingRHS(lambda x: 9.0 + 8.0 * x + 7.0 * x**2 + 6.0 * x**3)
+        getattr(integral, method)(f, 0.12, 3.45, n)
+        return n, f.n_calls
+
+    return run
+
+def _random_matrix(n, seed):
+    """
+    Returns a random, diagonally dominant n x n matrix, as a list of rows.
+
+    @type     n: number
+    @param    n: size of the matrix
+    @type  seed: number
+    @param seed: seed of the random number generator
+
+    @rtype: list
+    @return: rows of the matrix
+    """
+    rng = random.Random(seed)
+    return [[rng.uniform(-1.0, 1.0) + (n if i == j else 0.0)
+             for j in range(n)] for i in range(n)]
+
+def _gauss_elim_case(n, scale):
+    """
+    Returns a run of Gaussian elimination.
+
+    @type      n: number
+    @param     n: size of the system (at scale 1)
+    @type  scale: number
+    @param scale: problem size multiplier
+
+    @rtype: function
+    @return: run() returning the number of steps and evaluations
+    """
+    n = _size(n, scale)
+    rows = _random_matrix(n, n)
+    b = [1.0] * n
+
+    def run():
+        # gauss_elim works in place, so it gets a fresh copy
+        lineq.gauss_elim(Matrix([list(row) for row in rows]), b)
+        return n, 0
+
+    return run
+
+def _poisson_matrix(m):
+    """
+    Returns the sparse matrix of the 5-point discrete Laplacian (negated) on
+    an m x m grid, with zero boundary values.
+
+    @type  m: number
+    @param m: number of grid points along each side
+
+    @rtype: SparseMatrix
+    @return: the m^2 x m^2 matrix
+    """
+    rows = []
+    cols = []
+    values = []
+    for i in range(m):
+        for j in range(m):
+            k = i * m + j
+            rows.append(k)
+            cols.append(k)
+            values.append(4.0)
+            for i2, j2 in ((i - 1, j), (i + 1, j), (i, j - 1), (i, j + 1)):
+                if 0 <= i2 < m and 0 <= j2 < m:
+                    rows.append(k)
+                    cols.append(i2 * m + j2)
+                    values.append(-1.0)
+    return SparseMatrix(m * m, m * m, rows, cols, values)
+
+def _sparse_case(method, m, scale):
+    """
+    Returns a run of an iterative method on the 2-D Poisson equation.
+
+    @type  method: string
+    @param method: name of the method in lineq
+    @type       m: number
+    @param      m: number of grid points along each side (at scale 1)
+    @type   scale: number
+    @param  scale: problem size multiplier
+
+    @rtype: function
+    @return: run() returning the number of steps and evaluations
+    """
+    m = _size(m, scale)
+    A = _poisson_matrix(m)
+    b = [1.0] * (m * m)
+    solve = getattr(lineq, method)
+
+    def run():
+        x, n_iter = solve(A, b, delta=1e-8)
+        return n_iter, 0
+
+    return run
+
+def _banded_case(method, n, scale):
+    """
+    Returns a run of a tridiagonal solver on the 1-D diffusion equation (one
+    step of the backward Euler scheme).
+
+    @type  method: string
+    @param method: "thomas" or "banded_lu"
+    @type       n: number
+    @param      n: number of grid points (at scale 1)
+    @type   scale: number
+    @param  scale: problem size multiplier
+
+    @rtype: function
+    @return: run() returning the number of steps and evaluations
+    """
+    n = _size(n, scale)
+    lower = [-1.0] * (n - 1)
+    diag = [3.0] * n
+    b = [1.0] * n
+    A = BandedMatrix.from_diagonals([lower, diag, lower], [-1, 0, 1])
+
+    def run():
+        if method == "thomas":
+            lineq.thomas(lower, diag, lower, b)
+        else:
+            lineq.lu_factor(A).solve(b)
+        return n, 0
+
+    return run
+
+def _determinant_case(n, scale):
+    """
+    Returns a run of the determinant by expansion in minors.
+
+    @type      n: number
+    @param     n: size of the matrix
+    @type  scale: number
+    @param scale: problem size multiplier (unused: the cost is factorial)
+
+    @rtype: function
+    @return: run() returning the number of steps and evaluations
+    """
+    A = Matrix(_random_matrix(n, n))
+
+    def run():
+        linalg.determinant_minors(A)
+        return 1, 0
+
+    return run
+
+def _lu_case(function, n, scale):
+    """
+    Returns a run of a linalg function based on LU decomposition.
+
+    @type  function: string
+    @param function: name of the function in linalg
+    @type         n: number
+    @param        n: size of the matrix (at scale 1)
+    @type     scale: number
+    @param    scale: problem size multiplier
+
+    @rtype: function
+    @return: run() returning the number of steps and evaluations
+    """
+    n = _size(n, scale)
+    A = Matrix(_random_matrix(n, n))
+    function = getattr(linalg, function)
+
+    def run():
+        function(A)
+        return n, 0
+
+    return run
+
+def _matmul_case(n, scale):
+    """
+    Returns a run of the (pure-Python) matrix product.
+
+    @type      n: number
+    @param     n: size of the matrices (at scale 1)
+    @type  scale: number
+    @param scale: problem size multiplier
+
+    @rtype: function
+    @return: run() returning the number of steps and evaluations
+    """
+    n = _size(n, scale)
+    A = Matrix(_random_matrix(n, n))
+    B = Matrix(_random_matrix(n, n + 1))
+
+    def run():
+        linalg.matmul(A, B, use_numpy=False)
+        return n, 0
+
+    return run
+
+def _elecstat_case(function, backend, n, scale):
+    """
+    Returns a run of a batch or tree evaluation of the potential or field of
+    random point charges at random points in 3-D.
+
+    @type  function: string
+    @param function: name of the function in elecstat
+    @type   backend: string
+    @param  backend: "python" or "numpy"
+    @type         n: number
+    @param        n: number of sources and of targets (at scale 1)
+    @type     scale: number
+    @param    scale: problem size multiplier
+
+    @rtype: function
+    @return: run() returning the number of steps and evaluations
+    """
+    n = _size(n, scale)
+    rng = random.Random(n)
+    charges = [rng.uniform(-1.0, 1.0) for i in range(n)]
+    sources = [[rng.uniform(-1.0, 1.0) for i in range(n)] for j in range(3)]
+    targets = [[rng.uniform(-1.0, 1.0) for i in range(n)] for j in range(3)]
+    function = getattr(elecstat, function)
+
+    def run():
+        function(charges, sources, targets, backend=backend)
+        return n, 0
+
+    return run
+
+def cases(scale):
+    """
+    Returns the benchmark cases.
+
+    @type  scale: number
+    @param scale: problem size multiplier
+
+    @rtype: list
+    @return: (name, setup) pairs; setup() prepares the data of the case and
+             returns its run, so that only the cases actually run pay for it
+    """
+    partial = functools.partial
+    result = []
+    for integrator in ("Euler", "RK4", "RK4Adaptive", "BulSto",
+                       "BulStoAdaptive"):
+        for problem in sorted(ODE_PROBLEMS):
+            result.append(("odeint.%s/%s" % (integrator, problem),
+                           partial(_ode_case, integrator, problem, scale)))
+    for method in ("simpsons", "trapezoidal"):
+        result.append(("integral.%s" % method,
+                       partial(_quadrature_case, method, scale)))
+    for n in (25, 50, 100):
+        result.append(("lineq.gauss_elim/%d" % n,
+                       partial(_gauss_elim_case, n, scale)))
+    for method in ("conjugate_gradient", "bicgstab", "gauss_seidel"):
+        result.append(("lineq.%s/poisson" % method,
+                       partial(_sparse_case, method, 20, scale)))
+    for method in ("thomas", "banded_lu"):
+        result.append(("lineq.%s/10000" % method,
+                       partial(_banded_case, method, 10000, scale)))
+    for function in ("determinant", "inverse"):
+        for n in (12, 50):
+            result.append(("linalg.%s/%d" % (function, n),
+                           partial(_lu_case, function, n, scale)))
+    for n in (25, 50, 100):
+        result.append(("linalg.matmul/%d" % n,
+                       partial(_matmul_case, n, scale)))
+    for function, n in (("potential_batch", 500), ("field_batch", 500),
+                        ("field_tree", 2000)):
+        for backend in ["python"] + (["numpy"] if elecstat.numpy else []):
+            result.append(("elecstat.%s/%s" % (function, backend),
+                           partial(_elecstat_case, function, backend, n,
+                                   scale)))
+    for n in (6, 7, 8):
+        result.append(("linalg.determinant_minors/%d" % n,
+                       partial(_determinant_case, n, scale)))
+    return result
+
+#### Measurement
+
+def measure(run, repeat):
+    """
+    Times a run (best of repeat), and measures its peak memory.
+
+    @type     run: function
+    @param    run: run() returning the number of steps and evaluations
+    @type  repeat: number
+    @param repeat: number of timed runs
+
+    @rtype: dictionary
+    @return: time [s], steps, evals, rates [s^-1] and peak memory [KiB]
+    """
+    best = None
+    for i in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        steps, evals = run()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+
+    gc.collect()
+    tracemalloc.start()
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    best = max(best, 1e-9)
+    return {"time": best,
+            "steps": steps,
+            "evals": evals,
+            "steps_per_sec": steps / best,
+            "evals_per_sec": evals / best,
+            "peak_kib": peak / 1024.0}
+
+def run_benchmarks(scale=1.0, repeat=3, name_filter=None, out=sys.stdout):
+    """
+    Runs the benchmarks, printing a line per case.
+
+    @type        scale: number
+    @param       scale: problem size multiplier
+    @type       repeat: number
+    @param      repeat: number of timed runs per case
+    @type  name_filter: string
+    @param name_filter: only run the cases whose name contains this
+    @type          out: file
+    @param         out: where to print the results
+
+    @rtype: dictionary
+    @return: metadata and results, as saved to JSON
+    """
+    results = {}
+    out.write("%-42s %10s %12s %12s %10s\n"
+              % ("case", "time [s]", "steps/s", "evals/s", "peak [KiB]"))
+    for name, setup in cases(scale):
+        if name_filter and name_filter not in name:
+            continue
+        result = measure(setup(), repeat)
+        results[name] = result
+        out.write("%-42s %10.4f %12.1f %12.1f %10.1f\n"
+                  % (name, result["time"], result["steps_per_sec"],
+                     result["evals_per_sec"], result["peak_kib"]))
+        out.flush()
+
+    meta = {"date": datetime.datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "machine": platform.machine(),
+            "scale": scale,
+            "repeat": repeat}
+    return {"meta": meta, "results": results}
+
+def compare(baseline, current, tolerance=0.1, memory_tolerance=0.1,
+            out=sys.stdout):
+    """
+    Compares results against a baseline, printing the relative change of
+    each case in common.
+
+    The speed is compared through the time per step, so that runs at
+    different scales remain comparable for the fixed-step cases.
+
+    @type          baseline: dictionary
+    @param         baseline: baseline results
+    @type           current: dictionary
+    @param          current: results to check
+    @type         tolerance: number
+    @param        tolerance: allowed relative slowdown
+    @type  memory_tolerance: number
+    @param memory_tolerance: allowed relative increase of peak memory
+    @type               out: file
+    @param              out: where to print the comparison
+
+    @rtype: list
+    @return: names of the cases that regressed
+    """
+    if baseline["meta"].get("scale") != current["meta"].get("scale"):
+        out.write("Warning: comparing results at different scales\n")
+
+    regressions = []
+    out.write("%-42s %10s %10s\n" % ("case", "speed", "memory"))
+    for name in sorted(baseline["results"]):
+        if name not in current["results"]:
+            continue
+        old = baseline["results"][name]
+        new = current["results"][name]
+        # Relative change of time per step (positive is slower)
+        slowdown = old["steps_per_sec"] / new["steps_per_sec"] - 1
+        growth = new["peak_kib"] / max(old["peak_kib"], 1e-9) - 1
+        flags = []
+        if slowdown > tolerance:
+            flags.append("SLOWER")
+        if growth > memory_tolerance:
+            flags.append("MORE MEMORY")
+        if flags:
+            regressions.append(name)
+        out.write("%-42s %+9.1f%% %+9.1f%% %s\n"
+                  % (name, 100 * slowdown, 100 * growth, " ".join(flags)))
+
+    missing = sorted(set(baseline["results"]) - set(current["results"]))
+    if missing:
+        out.write("Not run: %s\n" % ", ".join(missing))
+    out.write("%d regression(s)\n" % len(regressions))
+    return regressions
+
+#### Command line
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="souffle benchmarks")
+    commands = parser.add_subparsers(dest="command")
+
+    run_parser = commands.add_parser("run", help="run the benchmarks")
+    run_parser.add_argument("-o", "--output",
+                            help="save the results to this JSON file")
+    run_parser.add_argument("--scale", type=float, default=1.0,
+                            help="problem size multiplier [default=1]")
+    run_parser.add_argument("--repeat", type=int, default=3,
+                            help="timed runs per case [default=3]")
+    run_parser.add_argument("--filter",
+                            help="only run cases whose name contains this")
+    run_parser.add_argument("--baseline",
+                            help="compare the results to this JSON file")
+    run_parser.add_argument("--tolerance", type=float, default=0.1,
+                            help="allowed relative slowdown [default=0.1]")
+    run_parser.add_argument("--memory-tolerance", type=float, default=0.1,
+                            help="allowed relative increase of peak memory "
+                                 "[default=0.1]")
+
+    compare_parser = commands.add_parser(
+        "compare", help="compare results to a baseline")
+    compare_parser.add_argument("baseline", help="baseline JSON file")
+    compare_parser.add_argument("current", help="JSON file to check")
+    compare_parser.add_argument("--tolerance", type=float, default=0.1,
+                                help="allowed relative slowdown "
+                                     "[default=0.1]")
+    compare_parser.add_argument("--memory-tolerance", type=float,
+                                default=0.1,
+                                help="allowed relative increase of peak "
+                                     "memory [default=0.1]")
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        current = run_benchmarks(args.scale, args.repeat, args.filter)
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(current, f, indent=2, sort_keys=True)
+        if args.baseline:
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+            if compare(baseline, current, args.tolerance,
+                       args.memory_tolerance):
+                return 1
+    elif args.command == "compare":
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+        if compare(baseline, current, args.tolerance, args.memory_tolerance):
+            return 1
+    else:
+        parser.print_help()
+        return 2
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,18 +5,24 @@ Provides generic datatypes.
 ERR_INPUT_NOT_LIST_TUPLE = "Input data is not list or tuple"
 ERR_INPUT_BAD_DIMS = "Input data has incompatible dimensions"
 ERR_KEY_NOT_INT_LIST_TUPLE = "Key is not int, list or tuple"
+ERR_KEY_NOT_INT_SLICE = "Key is not int, slice or pair of them"
 ERR_KEY_OUT_OF_BOUNDS = "Key is out of bounds"
 ERR_OP_BAD_DIMS = "Operand has incompatible dimensions for element-wise operation"
 ERR_OP_NOT_VEC = "Operand is not Vector"
 ERR_OP_NOT_MAT = "Operand is not Matrix"
 ERR_INPUT_INVALID = "Input data is invalid"
 
+import array
+import bisect
+import operator
 import souffle.math.linalg
 
 class Vector(object):
     """
     The generic vector class.
     """
+    __slots__ = ("data", "n_elems")
+
     def __init__(self, data=None):
         """
         @type  data: iterable
@@ -72,6 +78,24 @@ class Vector(object):
         else:
             raise ValueError(ERR_KEY_NOT_INT_LIST_TUPLE)
 
+    def __len__(self):
+        """
+        Returns the number of elements in the Vector.
+
+        @rtype: integer
+        @return: the number of elements
+        """
+        return len(self.data)
+
+    def __iter__(self):
+        """
+        Returns an iterator over the elements of the Vector.
+
+        @rtype: iterator
+        @return: iterator over the elements
+        """
+        return iter(self.data)
+
     #### Unary operators
 
     def __pos__(self):
@@ -81,7 +105,7 @@ class Vector(object):
         @rtype: Vector
         @return: the Vector with all elements positive
         """
-        return Vector([+elem for elem in self.data])
+        return self.__class__([+elem for elem in self.data])
 
     def __neg__(self):
         """
@@ -90,7 +114,7 @@ class Vector(object):
         @rtype: Vector
         @return: the Vector with all elements negated
         """
-        return Vector([-elem for elem in self.data])
+        return self.__class__([-elem for elem in self.data])
 
     def __abs__(self):
         """
@@ -99,7 +123,7 @@ class Vector(object):
         @rtype: Vector
         @return: the Vector containing the absolute value of all elements
         """
-        return Vector([abs(elem) for elem in self.data])
+        return self.__class__([abs(elem) for elem in self.data])
 
     #### Comparisons
 
@@ -212,7 +236,8 @@ class Vector(object):
         if not (self.n_elems == other.n_elems):
             raise ValueError(ERR_OP_BAD_DIMS)
         
-        return Vector([self[i] + other[i] for i in range(self.n_elems)])
+        return self.__class__([self[i] + other[i]
+                               for i in range(self.n_elems)])
 
     def __sub__(self, other):
         """
@@ -229,7 +254,8 @@ class Vector(object):
         if not (self.n_elems == other.n_elems):
             raise ValueError(ERR_OP_BAD_DIMS)
         
-        return Vector([self[i] - other[i] for i in range(self.n_elems)])
+        return self.__class__([self[i] - other[i]
+                               for i in range(self.n_elems)])
 
     def __mul__(self, other):
         """
@@ -246,7 +272,8 @@ class Vector(object):
         if not (self.n_elems == other.n_elems):
             raise ValueError(ERR_OP_BAD_DIMS)
                              
-        return Vector([self[i] * other[i] for i in range(self.n_elems)])
+        return self.__class__([self[i] * other[i]
+                               for i in range(self.n_elems)])
 
     def __truediv__(self, other):
         """
@@ -263,7 +290,8 @@ class Vector(object):
         if not (self.n_elems == other.n_elems):
             raise ValueError(ERR_OP_BAD_DIMS)
                              
-        return Vector([self[i] / other[i] for i in range(self.n_elems)])
+        return self.__class__([self[i] / other[i]
+                               for i in range(self.n_elems)])
 
     #### Type conversion
 
@@ -291,7 +319,7 @@ class Vector(object):
         @rtype: Vector
         @return: the resulting Vector
         """
-        return Vector([elem + value for elem in self.data])
+        return self.__class__([elem + value for elem in self.data])
     
     def sub_scalar(self, value):
         """
@@ -303,7 +331,7 @@ class Vector(object):
         @rtype: Vector
         @return: the resulting Vector
         """
-        return Vector([elem - value for elem in self.data])
+        return self.__class__([elem - value for elem in self.data])
     
     def mul_scalar(self, value):
         """
@@ -315,7 +343,7 @@ class Vector(object):
         @rtype: Vector
         @return: the resulting Vector
         """
-        return Vector([elem * value for elem in self.data])
+        return self.__class__([elem * value for elem in self.data])
     
     def div_scalar(self, value):
         """
@@ -327,8 +355,151 @@ class Vector(object):
         @rtype: Vector
         @return: the resulting Vector
         """
-        return Vector([elem / value for elem in self.data])
+        return self.__class__([elem / value for elem in self.data])
     
+    #### In-place arithmetic
+    # These write into the existing Vector instead of building a new one, and
+    # return it so that calls can be chained, e.g. y.assign(x).axpy(a, z).
+
+    def assign(self, other):
+        """
+        Overwrites every element with the corresponding element of another
+        Vector of the same length.
+
+        @type  other: Vector
+        @param other: the Vector to copy from
+
+        @rtype: Vector
+        @return: this Vector
+        """
+        if not isinstance(other, Vector):
+            raise ValueError(ERR_OP_NOT_VEC)
+        if not (self.n_elems == other.n_elems):
+            raise ValueError(ERR_OP_BAD_DIMS)
+
+        data = self.data
+        if (isinstance(data, array.array)
+            and not isinstance(other.data, array.array)):
+            # Arrays only accept slice assignment from other arrays
+            for i, elem in enumerate(other.data):
+                data[i] = elem
+        else:
+            data[:] = other.data
+        return self
+
+    def copy(self):
+        """
+        Returns a copy of the Vector.
+
+        @rtype: Vector
+        @return: the copied Vector
+        """
+        return self.__class__(self.data)
+
+    def iadd(self, other):
+        """
+        Adds another Vector element-wise, in place.
+
+        @type  other: Vector
+        @param other: the Vector to add
+
+        @rtype: Vector
+        @return: this Vector
+        """
+        if not isinstance(other, Vector):
+            raise ValueError(ERR_OP_NOT_VEC)
+        if not (self.n_elems == other.n_elems):
+            raise ValueError(ERR_OP_BAD_DIMS)
+
+        data = self.data
+        for i, elem in enumerate(other.data):
+            data[i] += elem
+        return self
+
+    def isub(self, other):
+        """
+        Subtracts another Vector element-wise, in place.
+
+        @type  other: Vector
+        @param other: the Vector to subtract
+
+        @rtype: Vector
+        @return: this Vector
+        """
+        if not isinstance(other, Vector):
+            raise ValueError(ERR_OP_NOT_VEC)
+        if not (self.n_elems == other.n_elems):
+            raise ValueError(ERR_OP_BAD_DIMS)
+
+        data = self.data
+        for i, elem in enumerate(other.data):
+            data[i] -= elem
+        return self
+
+    def imul_scalar(self, value):
+        """
+        Multiplies every element by the input value, in place.
+
+        @type  value: number
+        @param value: the value to multiply each element
+
+        @rtype: Vector
+        @return: this Vector
+        """
+        data = self.data
+        for i in range(self.n_elems):
+            data[i] *= value
+        return self
+
+    def idiv_scalar(self, value):
+        """
+        Divides every element by the input value, in place.
+
+        @type  value: number
+        @param value: the value to divide each element
+
+        @rtype: Vector
+        @return: this Vector
+        """
+        data = self.data
+        for i in range(self.n_elems):
+            data[i] /= value
+        return self
+
+    def axpy(self, a, x):
+        """
+        Adds a scalar multiple of another Vector, in place (self += a * x).
+
+        @type  a: number
+        @param a: the scalar multiplying x
+        @type  x: Vector
+        @param x: the Vector to add
+
+        @rtype: Vector
+        @return: this Vector
+        """
+        if not isinstance(x, Vector):
+            raise ValueError(ERR_OP_NOT_VEC)
+        if not (self.n_elems == x.n_elems):
+            raise ValueError(ERR_OP_BAD_DIMS)
+
+        data = self.data
+        for i, elem in enumerate(x.data):
+            data[i] += a * elem
+        return self
+
+    def __iadd__(self, other):
+        """
+        Implements behaviour for +=, adding in place.
+        """
+        return self.iadd(other)
+
+    def __isub__(self, other):
+        """
+        Implements behaviour for -=, subtracting in place.
+        """
+        return self.isub(other)
+
     #### Vector operations
 
     def dot_product(self, other):
@@ -404,267 +575,759 @@ class Vector(object):
         """ 
         return self.data[idx_start : idx_end]
 
-class Matrix(object):
+class FloatVector(Vector):
     """
-    The generic matrix class.
+    A Vector of floats, stored contiguously in an array.array('d') buffer
+    instead of a list. Elements are kept as unboxed C doubles, and the buffer
+    can be exported without copying (see buffer()).
+
+    Arithmetic on FloatVectors returns FloatVectors; element-wise comparisons
+    still return generic Vectors of booleans.
     """
+    __slots__ = ()
+
     def __init__(self, data=None):
         """
-        @type  data: a 2-dimensional combination of lists and/or tuples
-        @param data: the data to load into the Matrix
+        @type  data: iterable
+        @param data: the data to load into the FloatVector
         """
-        self.data = []
-        if data == None:
+        if data is None:
+            self.data = array.array("d")
+            self.n_elems = 0
             return
+        if isinstance(data, Vector):
+            data = data.data
         try:
-            self.data = [[elem for elem in row] for row in data]
-            self.n_rows = len(self.data)
-            self.n_cols = len(self.data[0])
+            self.data = array.array("d", data)
         except:
             raise ValueError(ERR_INPUT_INVALID)
-        row_lens = [len(row) for row in self.data]
-        if row_lens[1:] != row_lens[:-1]:
-            raise ValueError("Row lengths are not all equal")
-   
-    #### Representations
-
-    def __str__(self):
-        """
-        Returns the string representation of the Matrix.
-
-        @rtype: string
-        @return: the string representation of the Matrix
-        """
-        output = "["
-        for i, row in enumerate(self.data):
-            if i != 0:
-                output += " "
-            output += "[{}]".format(" ".join([str(elem) for elem in row]))
-            if i != self.n_rows - 1:
-                output += "\n"
-        output += "]"
-        return output
-
-    #### Container methods
-
-    # TODO    
-    def __getitem__(self):
-        raise NotImplementedError
-
-    #### Unary operators
-
-    def __pos__(self):
-        """
-        Implements behaviour for unary positive.
-
-        @rtype: Matrix
-        @return: the Matrix with all elements positive
-        """
-        return Matrix([[+elem for elem in row] for row in self.data])
+        self.n_elems = len(self.data)
 
-    def __neg__(self):
+    @classmethod
+    def zeros(cls, n_elems):
         """
-        Implements behaviour for unary negation.
+        Returns a new FloatVector of zeros.
 
-        @rtype: Matrix
-        @return: the Matrix with all elements negated
-        """
-        return Matrix([[-elem for elem in row] for row in self.data])
+        @type  n_elems: integer
+        @param n_elems: number of elements
 
-    def __abs__(self):
+        @rtype: FloatVector
+        @return: the zero FloatVector
         """
-        Implements behaviour for absolute value (not modulus).
+        return cls(bytes(array.array("d").itemsize * int(n_elems)))
 
-        @rtype: Matrix
-        @return: the Matrix containing the absolute value of all elements
-        """
-        return Matrix([[abs(elem) for elem in row] for row in self.data])
-    
-    #### Comparisons
+    #### Buffer export
 
-    def __eq__(self, other):
+    def buffer(self):
         """
-        Compares two Matrix by element to determine equality.
-
-        @type  other: Matrix
-        @param other: the Matrix to compare
+        Returns a zero-copy view of the underlying buffer. Note that the
+        FloatVector cannot change size while the view is alive.
 
-        @rtype: boolean
-        @return: whether the Matrices are equal
+        @rtype: memoryview
+        @return: view of the elements, with format 'd'
         """
-        if not isinstance(other, Matrix):
-            raise ValueError(ERR_OP_NOT_MAT)
-        if self.n_rows != other.n_rows and self.n_cols != other.n_cols:
-            raise ValueError(ERR_OP_BAD_DIMS)
-
-        for i in range(self.n_rows):
-            for j in range(self.n_cols):
-                if self.data[i][j] != other.data[i][j]:
-                    return False
-        return True
+        return memoryview(self.data)
 
-    def __lt__(self, other):
+    def __buffer__(self, flags):
         """
-        Returns a boolean Matrix containing the results of element-wise
-        less-than comparisons.
-
-        @type  other: Matrix
-        @param other: the Matrix to compare
-
-        @rtype: Matrix of booleans
-        @return: the comparison result for each element
+        Implements the buffer protocol (Python 3.12+), so that the
+        FloatVector can be passed directly to memoryview() and friends.
         """
-        if not isinstance(other, Matrix):
-            raise ValueError(ERR_OP_NOT_MAT)
-        if self.n_rows != other.n_rows and self.n_cols != other.n_cols:
-            raise ValueError(ERR_OP_BAD_DIMS)
+        return memoryview(self.data)
 
-        return Matrix(
-            [[self.data[i][j] < other.data[i][j]
-              for j in range(self.n_cols)]
-             for i in range(self.n_rows)]
-        )
+    #### Container methods
 
-    def __gt__(self, other):
+    def __getitem__(self, key=None):
         """
-        Returns a boolean Matrix containing the results of element-wise
-        greater-than comparisons.
-
-        @type  other: Matrix
-        @param other: the Matrix to compare
+        Returns the element(s) specified by the index/indices in key. Supports
+        backwards indexing.
 
-        @rtype: Matrix of booleans
-        @return: the comparison result for each element
-        """
-        raise NotImplementedError
+        @type  key: integer, list or tuple
+        @param key: the index/indices of the element(s) to access
 
-    def __le__(self, other):
+        @return: the element(s) specified by the given index/indices
         """
-        Returns a boolean Matrix containing the results of element-wise
-        less-than-or-equal comparisons.
-
-        @type  other: Matrix
-        @param other: the Matrix to compare
+        if isinstance(key, int):
+            return self.data[key]
+        return Vector.__getitem__(self, key)
 
-        @rtype: Matrix of booleans
-        @return: the comparison result for each element
-        """
-        raise NotImplementedError
+    #### Unary operators
 
-    def __ge__(self, other):
+    def __neg__(self):
         """
-        Returns a boolean Matrix containing the results of element-wise
-        greater-than-or-equal comparisons.
-
-        @type  other: Matrix
-        @param other: the Matrix to compare
+        Implements behaviour for unary negation.
 
-        @rtype: Matrix of booleans
-        @return: the comparison result for each element
+        @rtype: FloatVector
+        @return: the FloatVector with all elements negated
         """
-        raise NotImplementedError
+        return FloatVector(map(operator.neg, self.data))
 
     #### Element-wise arithmetic
 
     def __add__(self, other):
         """
-        Perform element-wise addition of one Matrix by another.
+        Perform element-wise addition of one Vector by another.
 
-        @type  other: Matrix
-        @param other: the Matrix to add
+        @type  other: Vector
+        @param other: the Vector to add
 
-        @rtype: Matrix
+        @rtype: FloatVector
         @return: the element-wise sum of the operands
         """
-        if not isinstance(other, Matrix):
-            raise ValueError(ERR_OP_NOT_MAT)
-        if not (self.n_rows == other.n_rows and self.n_cols == other.n_cols):
+        if not isinstance(other, Vector):
+            raise ValueError(ERR_OP_NOT_VEC)
+        if not (self.n_elems == other.n_elems):
             raise ValueError(ERR_OP_BAD_DIMS)
 
-        # TODO: use __getitem__() after implemented, e.g. self[i, j] (?)
-        return Matrix([[self.data[row][col] + other.data[row][col]
-                        for col in range(self.n_cols)]
-                       for row in range(self.n_rows)])
+        return FloatVector(map(operator.add, self.data, other.data))
 
     def __sub__(self, other):
         """
-        Perform element-wise subtraction of one Matrix by another.
+        Perform element-wise subtraction of one Vector by another.
 
-        @type  other: Matrix
-        @param other: the Matrix to subtract
+        @type  other: Vector
+        @param other: the Vector to subtract
 
-        @rtype: Matrix
+        @rtype: FloatVector
         @return: the element-wise difference of the operands
         """
-        if not isinstance(other, Matrix):
-            raise ValueError(ERR_OP_NOT_MAT)
-        if not (self.n_rows == other.n_rows and self.n_cols == other.n_cols):
+        if not isinstance(other, Vector):
+            raise ValueError(ERR_OP_NOT_VEC)
+        if not (self.n_elems == other.n_elems):
             raise ValueError(ERR_OP_BAD_DIMS)
 
-        # TODO: use __getitem__() after implemented, e.g. self[i, j] (?)
-        return Matrix([[self.data[row][col] - other.data[row][col]
-                        for col in range(self.n_cols)]
-                       for row in range(self.n_rows)])
+        return FloatVector(map(operator.sub, self.data, other.data))
 
     def __mul__(self, other):
         """
-        Perform element-wise multiplication of one Matrix by another.
+        Perform element-wise multiplication of one Vector by another.
 
-        @type  other: Matrix
-        @param other: the Matrix to multiply
+        @type  other: Vector
+        @param other: the Vector to multiply
 
-        @rtype: Matrix
+        @rtype: FloatVector
         @return: the element-wise product of the operands
         """
-        if not isinstance(other, Matrix):
-            raise ValueError(ERR_OP_NOT_MAT)
-        if not (self.n_rows == other.n_rows and self.n_cols == other.n_cols):
+        if not isinstance(other, Vector):
+            raise ValueError(ERR_OP_NOT_VEC)
+        if not (self.n_elems == other.n_elems):
             raise ValueError(ERR_OP_BAD_DIMS)
 
-        # TODO: use __getitem__() after implemented, e.g. self[i, j] (?)
-        return Matrix([[self.data[row][col] * other.data[row][col]
-                        for col in range(self.n_cols)]
-                       for row in range(self.n_rows)])
+        return FloatVector(map(operator.mul, self.data, other.data))
 
-    def __div__(self, other):
+    def __truediv__(self, other):
         """
-        Perform element-wise division of one Matrix by another.
+        Perform element-wise division of one Vector by another.
 
-        @type  other: Matrix
-        @param other: the Matrix to divide by
+        @type  other: Vector
+        @param other: the Vector to divide by
 
-        @rtype: Matrix
+        @rtype: FloatVector
         @return: the element-wise quotient of the operands
         """
-        if not isinstance(other, Matrix):
-            raise ValueError(ERR_OP_NOT_MAT)
-        if not (self.n_rows == other.n_rows and self.n_cols == other.n_cols):
+        if not isinstance(other, Vector):
+            raise ValueError(ERR_OP_NOT_VEC)
+        if not (self.n_elems == other.n_elems):
             raise ValueError(ERR_OP_BAD_DIMS)
 
-        # TODO: use __getitem__() after implemented, e.g. self[i, j] (?)
-        return Matrix([[self.data[row][col] / other.data[row][col]
-                        for col in range(self.n_cols)]
-                       for row in range(self.n_rows)])
+        return FloatVector(map(operator.truediv, self.data, other.data))
 
-    #### Type conversion
+    #### Scalar arithmetic
 
-    def typecasted(self, ttype):
+    def mul_scalar(self, value):
         """
-        Returns a new Matrix with each value casted to the input type.
+        Returns a new FloatVector with every element multiplied by the input
+        value.
 
-        @type  ttype: type
-        @param ttype: the type to which all elements should be casted
+        @type  value: number
+        @param value: the value to multiply each element
 
-        @rtype: Matrix
-        @return: the Matrix with all values casted to the input type
+        @rtype: FloatVector
+        @return: the resulting FloatVector
         """
-        return Matrix([map(ttype, row) for row in self.data])
-
-    #### Scalar arithmetic
+        value = float(value)
+        return FloatVector([elem * value for elem in self.data])
 
-    def add_scalar(self, value):
+    def div_scalar(self, value):
         """
-        Returns a new Matrix with the input value added to every element.
+        Returns a new FloatVector with every element divided by the input
+        value.
+
+        @type  value: number
+        @param value: the value to divide each element
+
+        @rtype: FloatVector
+        @return: the resulting FloatVector
+        """
+        value = float(value)
+        return FloatVector([elem / value for elem in self.data])
+
+def linear_combination(coeffs, vectors, out=None):
+    """
+    Computes the linear combination sum(coeffs[k] * vectors[k]) element by
+    element, without building intermediate Vectors. The output may be one of
+    the input vectors.
+
+    @type  coeffs: iterable
+    @param coeffs: the scalar coefficients
+    @type vectors: iterable
+    @param vectors: the Vectors to combine (all of the same length)
+    @type     out: Vector
+    @param    out: if specified, the Vector into which to write the result
+
+    @rtype: Vector
+    @return: the linear combination (out, if given; else a new FloatVector)
+    """
+    terms = [(float(c), v.data) for c, v in zip(coeffs, vectors)]
+    n_elems = len(terms[0][1])
+    for c, data in terms:
+        if len(data) != n_elems:
+            raise ValueError(ERR_OP_BAD_DIMS)
+    if out is None:
+        out = FloatVector.zeros(n_elems)
+    elif out.n_elems != n_elems:
+        raise ValueError(ERR_OP_BAD_DIMS)
+
+    out_data = out.data
+    for i in range(n_elems):
+        result = 0.0
+        for c, data in terms:
+            result += c * data[i]
+        out_data[i] = result
+    return out
+
+class Matrix(object):
+    """
+    The generic matrix class.
+
+    The elements are stored as floats in a single flat array of doubles,
+    together with the shape and the strides of the Matrix: element (i, j) is
+    data[offset + i * strides[0] + j * strides[1]]. Slicing (e.g.
+    m[1:3, ::2]) and transpose() return views, sharing the storage of the
+    original Matrix, so that assigning to a view changes the original too;
+    use copy() for an independent Matrix. Contiguous matrices can be exported
+    without copying (see buffer()).
+    """
+    __slots__ = ("data", "n_rows", "n_cols", "strides", "offset")
+
+    def __init__(self, data=None):
+        """
+        @type  data: a 2-dimensional combination of lists and/or tuples
+        @param data: the data to load into the Matrix
+        """
+        self.data = array.array("d")
+        self.n_rows = 0
+        self.n_cols = 0
+        self.strides = (0, 1)
+        self.offset = 0
+        if data is None:
+            return
+        try:
+            rows = [array.array("d", row) for row in data]
+            n_cols = len(rows[0])
+        except:
+            raise ValueError(ERR_INPUT_INVALID)
+        for row in rows:
+            if len(row) != n_cols:
+                raise ValueError("Row lengths are not all equal")
+            self.data.extend(row)
+        self.n_rows = len(rows)
+        self.n_cols = n_cols
+        self.strides = (n_cols, 1)
+
+    @classmethod
+    def zeros(cls, n_rows, n_cols):
+        """
+        Returns a new Matrix of zeros.
+
+        @type  n_rows: integer
+        @param n_rows: number of rows
+        @type  n_cols: integer
+        @param n_cols: number of columns
+
+        @rtype: Matrix
+        @return: the zero Matrix
+        """
+        n_rows = int(n_rows)
+        n_cols = int(n_cols)
+        return cls.from_flat(
+            array.array("d", bytes(array.array("d").itemsize
+                                   * n_rows * n_cols)),
+            n_rows, n_cols)
+
+    @classmethod
+    def from_flat(cls, data, n_rows, n_cols):
+        """
+        Returns a Matrix with the given elements, in row-major order. An
+        array of doubles is used as the storage without copying.
+
+        @type    data: iterable
+        @param   data: the elements, row by row
+        @type  n_rows: integer
+        @param n_rows: number of rows
+        @type  n_cols: integer
+        @param n_cols: number of columns
+
+        @rtype: Matrix
+        @return: the Matrix
+        """
+        if not (isinstance(data, array.array) and data.typecode == "d"):
+            try:
+                data = array.array("d", data)
+            except:
+                raise ValueError(ERR_INPUT_INVALID)
+        if len(data) != n_rows * n_cols:
+            raise ValueError(ERR_INPUT_BAD_DIMS)
+        return cls._view(data, n_rows, n_cols, (n_cols, 1), 0)
+
+    @classmethod
+    def _view(cls, data, n_rows, n_cols, strides, offset):
+        """
+        Returns a Matrix on the given storage, without copying.
+
+        @type     data: array.array
+        @param    data: the storage
+        @type   n_rows: integer
+        @param  n_rows: number of rows
+        @type   n_cols: integer
+        @param  n_cols: number of columns
+        @type  strides: tuple
+        @param strides: distances between consecutive rows and columns
+        @type   offset: integer
+        @param  offset: index of the first element in the storage
+
+        @rtype: Matrix
+        @return: the view
+        """
+        view = cls.__new__(cls)
+        view.data = data
+        view.n_rows = n_rows
+        view.n_cols = n_cols
+        view.strides = strides
+        view.offset = offset
+        return view
+
+    #### Representations
+
+    def __str__(self):
+        """
+        Returns the string representation of the Matrix.
+
+        @rtype: string
+        @return: the string representation of the Matrix
+        """
+        output = "["
+        for i, row in enumerate(self):
+            if i != 0:
+                output += " "
+            output += "[{}]".format(" ".join([str(elem) for elem in row]))
+            if i != self.n_rows - 1:
+                output += "\n"
+        output += "]"
+        return output
+
+    def tolist(self):
+        """
+        Returns the elements of the Matrix as a list of rows.
+
+        @rtype: list
+        @return: the rows, as lists
+        """
+        return [self._row(i).tolist() for i in range(self.n_rows)]
+
+    def to_array(self):
+        """
+        Returns a copy of the elements of the Matrix, in row-major order.
+
+        @rtype: array.array
+        @return: the elements
+        """
+        if self.is_contiguous():
+            return self.data[self.offset:
+                             self.offset + self.n_rows * self.n_cols]
+        result = array.array("d")
+        for i in range(self.n_rows):
+            result.extend(self._row(i))
+        return result
+
+    #### Buffer export
+
+    @property
+    def shape(self):
+        """
+        The number of rows and columns of the Matrix.
+        """
+        return self.n_rows, self.n_cols
+
+    def is_contiguous(self):
+        """
+        Returns whether the elements are stored row by row, without gaps.
+
+        @rtype: boolean
+        @return: whether the Matrix is contiguous
+        """
+        return (self.n_rows * self.n_cols == 0
+                or ((self.strides[1] == 1 or self.n_cols == 1)
+                    and (self.strides[0] == self.n_cols or self.n_rows == 1)))
+
+    def buffer(self):
+        """
+        Returns a zero-copy view of the underlying buffer, with shape
+        (n_rows, n_cols). Note that the storage cannot change size while the
+        view is alive. Views with gaps (e.g. transposes) must be copied first.
+
+        @rtype: memoryview
+        @return: 2-dimensional view of the elements, with format 'd'
+        """
+        if not self.is_contiguous():
+            raise ValueError("Matrix is not contiguous; copy() it first")
+        n_elems = self.n_rows * self.n_cols
+        view = memoryview(self.data)[self.offset:self.offset + n_elems]
+        return view.cast("B").cast("d", (self.n_rows, self.n_cols))
+
+    def __buffer__(self, flags):
+        """
+        Implements the buffer protocol (Python 3.12+), so that the Matrix can
+        be passed directly to memoryview() and friends.
+        """
+        return self.buffer()
+
+    #### Container methods
+
+    def _index(self, idx, n):
+        """
+        Resolves an integer or slice index along an axis of length n.
+
+        @type  idx: integer or slice
+        @param idx: the index
+        @type    n: integer
+        @param   n: the length of the axis
+
+        @rtype: integer, integer, integer
+        @return: the first index, the number of indices, and the step
+        """
+        if isinstance(idx, int):
+            if idx < 0:
+                # Negative index: count from end of axis
+                idx += n
+            if not 0 <= idx < n:
+                raise IndexError(ERR_KEY_OUT_OF_BOUNDS)
+            return idx, 1, 1
+        if isinstance(idx, slice):
+            start, stop, step = idx.indices(n)
+            if step < 1:
+                raise ValueError("Slice steps must be positive")
+            return start, len(range(start, stop, step)), step
+        raise ValueError(ERR_KEY_NOT_INT_SLICE)
+
+    def _row(self, i):
+        """
+        Returns a copy of a row.
+
+        @type  i: integer
+        @param i: the (non-negative) index of the row
+
+        @rtype: array.array
+        @return: the row
+        """
+        start = self.offset + i * self.strides[0]
+        step = self.strides[1]
+        return self.data[start:start + self.n_cols * step:step]
+
+    def __getitem__(self, key):
+        """
+        Returns the element specified by the indices in key, e.g. m[i, j], or
+        a view of the rows and columns specified by integers and slices, e.g.
+        m[i, :] (a 1 x n_cols Matrix) or m[1:3, ::2]. A single index selects
+        rows. Supports backwards indexing.
+
+        @type  key: tuple, integer or slice
+        @param key: the row and column indices
+
+        @return: the element, or a Matrix viewing the selected elements
+        """
+        if not isinstance(key, tuple):
+            key = (key, slice(None))
+        if len(key) != 2:
+            raise ValueError(ERR_KEY_NOT_INT_SLICE)
+        i, n_i, step_i = self._index(key[0], self.n_rows)
+        j, n_j, step_j = self._index(key[1], self.n_cols)
+        offset = self.offset + i * self.strides[0] + j * self.strides[1]
+        if isinstance(key[0], int) and isinstance(key[1], int):
+            return self.data[offset]
+        return Matrix._view(self.data, n_i, n_j,
+                            (self.strides[0] * step_i,
+                             self.strides[1] * step_j),
+                            offset)
+
+    def __setitem__(self, key, value):
+        """
+        Sets the element specified by the indices in key, e.g. m[i, j] = x,
+        or the elements of the selected rows and columns (see __getitem__())
+        from a number, a Matrix or a list of rows.
+
+        @type    key: tuple, integer or slice
+        @param   key: the row and column indices
+        @type  value: number, Matrix or list
+        @param value: the new value(s)
+        """
+        if (isinstance(key, tuple) and len(key) == 2
+                and isinstance(key[0], int) and isinstance(key[1], int)):
+            i = self._index(key[0], self.n_rows)[0]
+            j = self._index(key[1], self.n_cols)[0]
+            self.data[self.offset + i * self.strides[0]
+                      + j * self.strides[1]] = value
+        else:
+            self[key].assign(value)
+
+    def assign(self, other):
+        """
+        Copies the elements of another Matrix (or list of rows) into this
+        one, in place; a number is copied into every element.
+
+        @type  other: Matrix, list or number
+        @param other: the source
+        """
+        if isinstance(other, int) or isinstance(other, float):
+            rows = [array.array("d", [other]) * self.n_cols] * self.n_rows
+        else:
+            if not isinstance(other, Matrix):
+                other = Matrix(other)
+            if other.shape != self.shape:
+                raise ValueError(ERR_OP_BAD_DIMS)
+            if other.data is self.data:
+                # Views of the same storage may overlap
+                other = other.copy()
+            rows = [other._row(i) for i in range(other.n_rows)]
+        step = self.strides[1]
+        for i, row in enumerate(rows):
+            start = self.offset + i * self.strides[0]
+            self.data[start:start + self.n_cols * step:step] = row
+
+    def __len__(self):
+        """
+        Returns the number of rows in the Matrix.
+
+        @rtype: integer
+        @return: the number of rows
+        """
+        return self.n_rows
+
+    def __iter__(self):
+        """
+        Returns an iterator over the rows of the Matrix, as lists.
+
+        @rtype: iterator
+        @return: iterator over the rows
+        """
+        return iter(self.tolist())
+
+    #### Unary operators
+
+    def _map(self, func):
+        """
+        Returns a new Matrix with a function applied to every element.
+
+        @type  func: function
+        @param func: the function of an element
+
+        @rtype: Matrix
+        @return: the resulting Matrix
+        """
+        return Matrix.from_flat(array.array("d", map(func, self.to_array())),
+                                self.n_rows, self.n_cols)
+
+    def _zip(self, other, func):
+        """
+        Returns a new Matrix with a function applied to every pair of
+        corresponding elements of two matrices.
+
+        @type  other: Matrix
+        @param other: the second operand
+        @type   func: function
+        @param  func: the function of two elements
+
+        @rtype: Matrix
+        @return: the resulting Matrix
+        """
+        if not isinstance(other, Matrix):
+            raise ValueError(ERR_OP_NOT_MAT)
+        if self.shape != other.shape:
+            raise ValueError(ERR_OP_BAD_DIMS)
+        return Matrix.from_flat(
+            array.array("d", map(func, self.to_array(), other.to_array())),
+            self.n_rows, self.n_cols)
+
+    def __pos__(self):
+        """
+        Implements behaviour for unary positive.
+
+        @rtype: Matrix
+        @return: the Matrix with all elements positive
+        """
+        return self._map(operator.pos)
+
+    def __neg__(self):
+        """
+        Implements behaviour for unary negation.
+
+        @rtype: Matrix
+        @return: the Matrix with all elements negated
+        """
+        return self._map(operator.neg)
+
+    def __abs__(self):
+        """
+        Implements behaviour for absolute value (not modulus).
+
+        @rtype: Matrix
+        @return: the Matrix containing the absolute value of all elements
+        """
+        return self._map(abs)
+
+    #### Comparisons
+
+    def __eq__(self, other):
+        """
+        Compares two Matrix by element to determine equality.
+
+        @type  other: Matrix
+        @param other: the Matrix to compare
+
+        @rtype: boolean
+        @return: whether the Matrices are equal
+        """
+        if not isinstance(other, Matrix):
+            raise ValueError(ERR_OP_NOT_MAT)
+        if self.shape != other.shape:
+            raise ValueError(ERR_OP_BAD_DIMS)
+
+        return self.to_array() == other.to_array()
+
+    def __lt__(self, other):
+        """
+        Returns a Matrix containing the results of element-wise less-than
+        comparisons (1.0 for true, 0.0 for false).
+
+        @type  other: Matrix
+        @param other: the Matrix to compare
+
+        @rtype: Matrix
+        @return: the comparison result for each element
+        """
+        return self._zip(other, operator.lt)
+
+    def __gt__(self, other):
+        """
+        Returns a Matrix containing the results of element-wise greater-than
+        comparisons (1.0 for true, 0.0 for false).
+
+        @type  other: Matrix
+        @param other: the Matrix to compare
+
+        @rtype: Matrix
+        @return: the comparison result for each element
+        """
+        return self._zip(other, operator.gt)
+
+    def __le__(self, other):
+        """
+        Returns a Matrix containing the results of element-wise
+        less-than-or-equal comparisons (1.0 for true, 0.0 for false).
+
+        @type  other: Matrix
+        @param other: the Matrix to compare
+
+        @rtype: Matrix
+        @return: the comparison result for each element
+        """
+        return self._zip(other, operator.le)
+
+    def __ge__(self, other):
+        """
+        Returns a Matrix containing the results of element-wise
+        greater-than-or-equal comparisons (1.0 for true, 0.0 for false).
+
+        @type  other: Matrix
+        @param other: the Matrix to compare
+
+        @rtype: Matrix
+        @return: the comparison result for each element
+        """
+        return self._zip(other, operator.ge)
+
+    #### Element-wise arithmetic
+
+    def __add__(self, other):
+        """
+        Perform element-wise addition of one Matrix by another.
+
+        @type  other: Matrix
+        @param other: the Matrix to add
+
+        @rtype: Matrix
+        @return: the element-wise sum of the operands
+        """
+        return self._zip(other, operator.add)
+
+    def __sub__(self, other):
+        """
+        Perform element-wise subtraction of one Matrix by another.
+
+        @type  other: Matrix
+        @param other: the Matrix to subtract
+
+        @rtype: Matrix
+        @return: the element-wise difference of the operands
+        """
+        return self._zip(other, operator.sub)
+
+    def __mul__(self, other):
+        """
+        Perform element-wise multiplication of one Matrix by another.
+
+        @type  other: Matrix
+        @param other: the Matrix to multiply
+
+        @rtype: Matrix
+        @return: the element-wise product of the operands
+        """
+        return self._zip(other, operator.mul)
+
+    def __truediv__(self, other):
+        """
+        Perform element-wise division of one Matrix by another.
+
+        @type  other: Matrix
+        @param other: the Matrix to divide by
+
+        @rtype: Matrix
+        @return: the element-wise quotient of the operands
+        """
+        return self._zip(other, operator.truediv)
+
+    __div__ = __truediv__
+
+    #### Type conversion
+
+    def typecasted(self, ttype):
+        """
+        Returns a new Matrix with each value casted to the input type (and
+        stored as a float again, e.g. int truncates the values).
+
+        @type  ttype: type
+        @param ttype: the type to which all elements should be casted
+
+        @rtype: Matrix
+        @return: the Matrix with all values casted to the input type
+        """
+        return self._map(ttype)
+
+    #### Scalar arithmetic
+
+    def add_scalar(self, value):
+        """
+        Returns a new Matrix with the input value added to every element.
 
         @type  value: number
         @param value: the value to be added to each element
@@ -672,10 +1335,8 @@ class Matrix(object):
         @rtype: Matrix
         @return: the resulting Matrix
         """
-        return Matrix([[self.data[row][col] + value
-                        for col in range(self.n_cols)]
-                       for row in range(self.n_rows)])
-    
+        return self._map(lambda elem: elem + value)
+
     def sub_scalar(self, value):
         """
         Returns a new Matrix with the input value subtracted from every element.
@@ -683,41 +1344,35 @@ class Matrix(object):
         @type  value: number
         @param value: the value to be subtracted from each element
 
-        @rtype: Vector
-        @return: the resulting Vector
+        @rtype: Matrix
+        @return: the resulting Matrix
         """
-        return Matrix([[self.data[row][col] - value
-                        for col in range(self.n_cols)]
-                       for row in range(self.n_rows)])
-    
+        return self._map(lambda elem: elem - value)
+
     def mul_scalar(self, value):
         """
-        Returns a new Vector with every element multiplied by the input value.
+        Returns a new Matrix with every element multiplied by the input value.
 
         @type  value: number
         @param value: the value to multiply each element
 
-        @rtype: Vector
-        @return: the resulting Vector
+        @rtype: Matrix
+        @return: the resulting Matrix
         """
-        return Matrix([[self.data[row][col] * value
-                        for col in range(self.n_cols)]
-                       for row in range(self.n_rows)])
-    
+        return self._map(lambda elem: elem * value)
+
     def div_scalar(self, value):
         """
-        Returns a new Vector with every element divided by the input value.
+        Returns a new Matrix with every element divided by the input value.
 
         @type  value: number
         @param value: the value to divide each element
 
-        @rtype: Vector
-        @return: the resulting Vector
+        @rtype: Matrix
+        @return: the resulting Matrix
         """
-        return Matrix([[self.data[row][col] / value
-                        for col in range(self.n_cols)]
-                       for row in range(self.n_rows)])
-    
+        return self._map(lambda elem: elem / value)
+
     #### Matrix operations
 
     def mul_matrix(self, other):
@@ -732,18 +1387,60 @@ class Matrix(object):
         """
         if not isinstance(other, Matrix):
             raise ValueError(ERR_OP_NOT_MAT)
+        if self.n_cols != other.n_rows:
+            raise ValueError(ERR_OP_BAD_DIMS)
+
+        return souffle.math.linalg.matmul(self, other)
+
+    def mul_vector(self, other):
+        """
+        Returns the product of the Matrix and a vector.
+
+        @type  other: Vector
+        @param other: the vector (Vector, list or tuple) to multiply
+
+        @rtype: FloatVector
+        @return: the matrix-vector product
+        """
+        if len(other) != self.n_cols:
+            raise ValueError(ERR_OP_BAD_DIMS)
+        if isinstance(other, Vector):
+            other = other.data
 
-        return Matrix([[souffle.math.linalg.dot_product(self.data[row],
-                                                        list(zip(*other.data))[col])
-                        for col in range(other.n_cols)]
-                       for row in range(self.n_rows)])
+        mul = operator.mul
+        return FloatVector([sum(map(mul, self._row(i), other))
+                            for i in range(self.n_rows)])
 
-    # TODO
     def inverse(self):
-        raise NotImplementedError
+        """
+        Returns the inverse of the (square) Matrix.
+
+        @rtype: Matrix
+        @return: the inverse
+        """
+        return souffle.math.linalg.inverse(self)
+
+    def transpose(self):
+        """
+        Returns the transpose of the Matrix, as a view sharing its storage.
+
+        @rtype: Matrix
+        @return: the transpose
+        """
+        return Matrix._view(self.data, self.n_cols, self.n_rows,
+                            (self.strides[1], self.strides[0]), self.offset)
+
+    def copy(self):
+        """
+        Returns a contiguous copy of the Matrix, with its own storage.
+
+        @rtype: Matrix
+        @return: the copied Matrix
+        """
+        return Matrix.from_flat(self.to_array(), self.n_rows, self.n_cols)
 
     ### Accessing elements
-    
+
     def get_row(self, row_idx):
         """
         Returns the row specified by the given index.
@@ -751,10 +1448,10 @@ class Matrix(object):
         @type  row_idx: integer
         @param row_idx: the index of the row to return
 
-        @rtype: iterable
+        @rtype: list
         @return: the row specified by the given index
         """
-        return self.data[row_idx]
+        return self._row(self._index(row_idx, self.n_rows)[0]).tolist()
 
     def get_col(self, col_idx):
         """
@@ -763,13 +1460,32 @@ class Matrix(object):
         @type  col_idx: integer
         @param col_idx: the index of the column to return
 
-        @rtype: iterable
+        @rtype: list
         @return: the column specified by the given index
         """
-        return [self.data[row][col_idx] for row in range(self.n_rows)]
+        return self.transpose().get_row(col_idx)
 
     #### Adding/removing elements
-    
+
+    def _set_rows(self, rows, n_cols):
+        """
+        Replaces the elements of the Matrix with the given rows, in new
+        storage (detached from any views).
+
+        @type    rows: list
+        @param   rows: the new rows
+        @type  n_cols: integer
+        @param n_cols: the new number of columns
+        """
+        data = array.array("d")
+        for row in rows:
+            data.extend(row)
+        self.data = data
+        self.n_rows = len(rows)
+        self.n_cols = n_cols
+        self.strides = (n_cols, 1)
+        self.offset = 0
+
     def append_row(self, row):
         """
         Adds the input row to the bottom of the Matrix.
@@ -777,11 +1493,7 @@ class Matrix(object):
         @type  row: iterable
         @param row: the row to append to the matrix
         """
-        if len(row) != self.n_cols and self.n_rows != 0:
-            raise ValueError(ERR_INPUT_BAD_DIMS)
-        
-        self.data.append(row)
-        self.n_rows = len(self.data)
+        self.insert_row(row, self.n_rows)
 
     def append_col(self, col):
         """
@@ -790,12 +1502,7 @@ class Matrix(object):
         @type  col: iterable
         @param col: the column to append to the Matrix
         """
-        if len(col) != self.n_rows and self.n_cols != 0:
-            raise ValueError(ERR_INPUT_BAD_DIMS)
-
-        for i in range(self.n_rows):
-            self.data[i].append(col[i])
-        self.n_cols = len(self.data[0])
+        self.insert_col(col, self.n_cols)
 
     def remove_row(self, row_idx):
         """
@@ -804,8 +1511,9 @@ class Matrix(object):
         @type  row_idx: integer
         @param row_idx: the index of the row to remove
         """
-        del self.data[row_idx]
-        self.n_rows -= 1
+        rows = [self._row(i) for i in range(self.n_rows)]
+        del rows[row_idx]
+        self._set_rows(rows, self.n_cols)
 
     def remove_col(self, col_idx):
         """
@@ -814,14 +1522,459 @@ class Matrix(object):
         @type  col_idx: integer
         @param col_idx: the index of the column to remove
         """
-        for row in range(self.n_rows):
-            del self.data[row][col_idx]
-        self.n_cols -= 1
+        col_idx = self._index(col_idx, self.n_cols)[0]
+        rows = self.tolist()
+        for row in rows:
+            del row[col_idx]
+        self._set_rows(rows, self.n_cols - 1)
 
     def insert_row(self, row, idx):
-        # TODO
-        raise NotImplementedError
-    
+        """
+        Inserts the input row before the row specified by the given index.
+        The Matrix gets new storage, so any views of it no longer follow it.
+
+        @type  row: iterable
+        @param row: the row to insert
+        @type  idx: integer
+        @param idx: the index of the row to insert before
+        """
+        row = array.array("d", row)
+        if len(row) != self.n_cols and self.n_rows != 0:
+            raise ValueError(ERR_INPUT_BAD_DIMS)
+
+        rows = [self._row(i) for i in range(self.n_rows)]
+        rows.insert(idx, row)
+        self._set_rows(rows, len(row))
+
     def insert_col(self, col, idx):
-        # TODO
-        raise NotImplementedError
\ No newline at end of file
+        """
+        Inserts the input column before the column specified by the given
+        index. The Matrix gets new storage, so any views of it no longer
+        follow it.
+
+        @type  col: iterable
+        @param col: the column to insert
+        @type  idx: integer
+        @param idx: the index of the column to insert before
+        """
+        col = list(col)
+        if len(col) != self.n_rows and self.n_cols != 0:
+            raise ValueError(ERR_INPUT_BAD_DIMS)
+
+        if self.n_rows == 0:
+            rows = [[elem] for elem in col]
+        else:
+            rows = self.tolist()
+            for row, elem in zip(rows, col):
+                row.insert(idx, elem)
+        self._set_rows(rows, self.n_cols + 1)
+
+class SparseMatrix(object):
+    """
+    A sparse matrix of floats, in compressed sparse row (CSR) form: the
+    nonzero elements of row i are values[indptr[i]:indptr[i + 1]], in the
+    columns indices[indptr[i]:indptr[i + 1]] (in increasing order). Memory,
+    and the time of a matrix-vector product, scale with the number of
+    nonzeros.
+
+    It is built from coordinate (COO) triplets, i.e. the rows, columns and
+    values of the nonzero elements, in any order; duplicate entries are
+    summed, which is convenient for assembling discretised equations.
+    """
+    __slots__ = ("n_rows", "n_cols", "values", "indices", "indptr")
+
+    def __init__(self, n_rows, n_cols, rows=(), cols=(), values=()):
+        """
+        @type  n_rows: integer
+        @param n_rows: number of rows
+        @type  n_cols: integer
+        @param n_cols: number of columns
+        @type    rows: iterable
+        @param   rows: row of each entry
+        @type    cols: iterable
+        @param   cols: column of each entry
+        @type  values: iterable
+        @param values: value of each entry
+        """
+        self.n_rows = int(n_rows)
+        self.n_cols = int(n_cols)
+        try:
+            rows = list(map(int, rows))
+            cols = list(map(int, cols))
+            values = list(map(float, values))
+        except:
+            raise ValueError(ERR_INPUT_INVALID)
+        if not len(rows) == len(cols) == len(values):
+            raise ValueError(ERR_INPUT_BAD_DIMS)
+        entries = sorted(zip(rows, cols, values))
+
+        self.values = array.array("d")
+        self.indices = array.array("l")
+        self.indptr = array.array("l", [0] * (self.n_rows + 1))
+        last = None
+        for i, j, value in entries:
+            if not (0 <= i < self.n_rows and 0 <= j < self.n_cols):
+                raise IndexError(ERR_KEY_OUT_OF_BOUNDS)
+            if (i, j) == last:
+                self.values[-1] += value
+                continue
+            last = (i, j)
+            self.values.append(value)
+            self.indices.append(j)
+            self.indptr[i + 1] += 1
+        for i in range(self.n_rows):
+            self.indptr[i + 1] += self.indptr[i]
+
+    @classmethod
+    def from_dense(cls, data):
+        """
+        Returns a SparseMatrix with the nonzero elements of a dense matrix.
+
+        @type  data: Matrix, or a 2-dimensional combination of lists and/or
+                     tuples
+        @param data: the dense matrix
+
+        @rtype: SparseMatrix
+        @return: the SparseMatrix
+        """
+        if not isinstance(data, Matrix):
+            data = Matrix(data)
+        rows = []
+        cols = []
+        values = []
+        for i, row in enumerate(data):
+            for j, value in enumerate(row):
+                if value != 0.0:
+                    rows.append(i)
+                    cols.append(j)
+                    values.append(value)
+        return cls(data.n_rows, data.n_cols, rows, cols, values)
+
+    #### Representations
+
+    def __str__(self):
+        """
+        Returns the string representation of the SparseMatrix, one nonzero
+        element per line.
+
+        @rtype: string
+        @return: the string representation of the SparseMatrix
+        """
+        rows, cols, values = self.to_coo()
+        return "\n".join(["({}, {}) {}".format(i, j, value)
+                          for i, j, value in zip(rows, cols, values)])
+
+    def to_coo(self):
+        """
+        Returns the nonzero elements as coordinate triplets, row by row.
+
+        @rtype: tuple
+        @return: rows, columns and values of the nonzero elements
+        """
+        rows = array.array("l")
+        for i in range(self.n_rows):
+            rows.extend(array.array("l", [i])
+                        * (self.indptr[i + 1] - self.indptr[i]))
+        return rows, self.indices[:], self.values[:]
+
+    def to_dense(self):
+        """
+        Returns the SparseMatrix as a dense Matrix.
+
+        @rtype: Matrix
+        @return: the dense Matrix
+        """
+        result = Matrix.zeros(self.n_rows, self.n_cols)
+        data = result.data
+        for i in range(self.n_rows):
+            for k in range(self.indptr[i], self.indptr[i + 1]):
+                data[i * self.n_cols + self.indices[k]] = self.values[k]
+        return result
+
+    #### Container methods
+
+    @property
+    def shape(self):
+        """
+        The number of rows and columns of the SparseMatrix.
+        """
+        return self.n_rows, self.n_cols
+
+    @property
+    def nnz(self):
+        """
+        The number of stored (nonzero) elements.
+        """
+        return len(self.values)
+
+    def __getitem__(self, key):
+        """
+        Returns the element specified by the indices in key, e.g. m[i, j]
+        (zero if it is not stored). Supports backwards indexing.
+
+        @type  key: tuple
+        @param key: the row and column indices
+
+        @rtype: number
+        @return: the element
+        """
+        if not (isinstance(key, tuple) and len(key) == 2):
+            raise ValueError(ERR_KEY_NOT_INT_SLICE)
+        i, j = key
+        if i < 0:
+            i += self.n_rows
+        if j < 0:
+            j += self.n_cols
+        if not (0 <= i < self.n_rows and 0 <= j < self.n_cols):
+            raise IndexError(ERR_KEY_OUT_OF_BOUNDS)
+        start, end = self.indptr[i], self.indptr[i + 1]
+        k = bisect.bisect_left(self.indices, j, start, end)
+        if k < end and self.indices[k] == j:
+            return self.values[k]
+        return 0.0
+
+    def diagonal(self):
+        """
+        Returns the elements on the main diagonal.
+
+        @rtype: list
+        @return: the diagonal elements
+        """
+        return [self[i, i] for i in range(min(self.n_rows, self.n_cols))]
+
+    #### Matrix operations
+
+    def mul_vector(self, other):
+        """
+        Returns the product of the SparseMatrix and a vector.
+
+        @type  other: Vector
+        @param other: the vector (Vector, list or tuple) to multiply
+
+        @rtype: FloatVector
+        @return: the matrix-vector product
+        """
+        if len(other) != self.n_cols:
+            raise ValueError(ERR_OP_BAD_DIMS)
+        if isinstance(other, Vector):
+            other = other.data
+
+        mul = operator.mul
+        values = self.values
+        indices = self.indices
+        indptr = self.indptr
+        x = other.__getitem__
+        return FloatVector([sum(map(mul, values[indptr[i]:indptr[i + 1]],
+                                    map(x, indices[indptr[i]:indptr[i + 1]])))
+                            for i in range(self.n_rows)])
+
+    def transpose(self):
+        """
+        Returns the transpose of the SparseMatrix.
+
+        @rtype: SparseMatrix
+        @return: the transpose
+        """
+        rows, cols, values = self.to_coo()
+        return SparseMatrix(self.n_cols, self.n_rows, cols, rows, values)
+
+class BandedMatrix(object):
+    """
+    A square band matrix of floats, whose nonzero elements lie on the main
+    diagonal, the first n_lower subdiagonals and the first n_upper
+    superdiagonals. The band is stored row by row in a flat array: element
+    (i, j) is data[i * (n_lower + n_upper + 1) + j - i + n_lower], so memory
+    and the time of a matrix-vector product scale with n * bandwidth.
+    """
+    __slots__ = ("n_rows", "n_lower", "n_upper", "data")
+
+    def __init__(self, n_rows, n_lower, n_upper):
+        """
+        Creates a BandedMatrix of zeros.
+
+        @type   n_rows: integer
+        @param  n_rows: number of rows (and columns)
+        @type  n_lower: integer
+        @param n_lower: number of subdiagonals
+        @type  n_upper: integer
+        @param n_upper: number of superdiagonals
+        """
+        self.n_rows = int(n_rows)
+        self.n_lower = int(n_lower)
+        self.n_upper = int(n_upper)
+        if self.n_rows < 0 or self.n_lower < 0 or self.n_upper < 0:
+            raise ValueError(ERR_INPUT_INVALID)
+        self.data = array.array("d", bytes(
+            array.array("d").itemsize * self.n_rows * self.width))
+
+    @classmethod
+    def from_diagonals(cls, diagonals, offsets):
+        """
+        Returns a BandedMatrix with the given diagonals, e.g. a tridiagonal
+        matrix from_diagonals([lower, diag, upper], [-1, 0, 1]). The diagonal
+        at offset k (negative below the main diagonal) has n - |k| elements.
+
+        @type  diagonals: list
+        @param diagonals: the diagonals
+        @type    offsets: list
+        @param   offsets: the offset of each diagonal
+
+        @rtype: BandedMatrix
+        @return: the BandedMatrix
+        """
+        if len(diagonals) != len(offsets) or len(diagonals) == 0:
+            raise ValueError(ERR_INPUT_BAD_DIMS)
+        k = offsets[0]
+        n_rows = len(diagonals[0]) + abs(k)
+        result = cls(n_rows, max(0, -min(offsets)), max(0, max(offsets)))
+        for diagonal, k in zip(diagonals, offsets):
+            if len(diagonal) != n_rows - abs(k):
+                raise ValueError(ERR_INPUT_BAD_DIMS)
+            i0 = max(0, -k)
+            for idx, value in enumerate(diagonal):
+                result[i0 + idx, i0 + idx + k] = value
+        return result
+
+    #### Container methods
+
+    @property
+    def width(self):
+        """
+        The number of stored elements per row (the bandwidth).
+        """
+        return self.n_lower + self.n_upper + 1
+
+    @property
+    def n_cols(self):
+        """
+        The number of columns of the BandedMatrix.
+        """
+        return self.n_rows
+
+    @property
+    def shape(self):
+        """
+        The number of rows and columns of the BandedMatrix.
+        """
+        return self.n_rows, self.n_rows
+
+    def _position(self, key):
+        """
+        Returns the position in the storage of the element specified by the
+        indices in key, or None if it lies outside the band.
+
+        @type  key: tuple
+        @param key: the row and column indices
+
+        @rtype: integer
+        @return: the position of the element
+        """
+        if not (isinstance(key, tuple) and len(key) == 2):
+            raise ValueError(ERR_KEY_NOT_INT_SLICE)
+        i, j = key
+        if i < 0:
+            i += self.n_rows
+        if j < 0:
+            j += self.n_rows
+        if not (0 <= i < self.n_rows and 0 <= j < self.n_rows):
+            raise IndexError(ERR_KEY_OUT_OF_BOUNDS)
+        if not -self.n_lower <= j - i <= self.n_upper:
+            return None
+        return i * self.width + j - i + self.n_lower
+
+    def __getitem__(self, key):
+        """
+        Returns the element specified by the indices in key, e.g. m[i, j]
+        (zero outside the band). Supports backwards indexing.
+
+        @type  key: tuple
+        @param key: the row and column indices
+
+        @rtype: number
+        @return: the element
+        """
+        pos = self._position(key)
+        if pos is None:
+            return 0.0
+        return self.data[pos]
+
+    def __setitem__(self, key, value):
+        """
+        Sets the element specified by the indices in key, e.g. m[i, j] = x,
+        which must lie inside the band.
+
+        @type    key: tuple
+        @param   key: the row and column indices
+        @type  value: number
+        @param value: the new value
+        """
+        pos = self._position(key)
+        if pos is None:
+            raise IndexError("Element is outside the band")
+        self.data[pos] = value
+
+    def diagonal(self, offset=0):
+        """
+        Returns the elements of a diagonal.
+
+        @type  offset: integer
+        @param offset: offset of the diagonal (negative below the main
+                       diagonal)
+
+        @rtype: list
+        @return: the diagonal elements
+        """
+        if not -self.n_lower <= offset <= self.n_upper:
+            return [0.0] * max(0, self.n_rows - abs(offset))
+        i0 = max(0, -offset)
+        i1 = self.n_rows - max(0, offset)
+        if i1 <= i0:
+            return []
+        width = self.width
+        start = i0 * width + offset + self.n_lower
+        return self.data[start:(i1 - 1) * width + offset + self.n_lower + 1:
+                         width].tolist()
+
+    def to_dense(self):
+        """
+        Returns the BandedMatrix as a dense Matrix.
+
+        @rtype: Matrix
+        @return: the dense Matrix
+        """
+        n = self.n_rows
+        result = Matrix.zeros(n, n)
+        for i in range(n):
+            for j in range(max(0, i - self.n_lower),
+                           min(n, i + self.n_upper + 1)):
+                result.data[i * n + j] = self[i, j]
+        return result
+
+    #### Matrix operations
+
+    def mul_vector(self, other):
+        """
+        Returns the product of the BandedMatrix and a vector.
+
+        @type  other: Vector
+        @param other: the vector (Vector, list or tuple) to multiply
+
+        @rtype: FloatVector
+        @return: the matrix-vector product
+        """
+        if len(other) != self.n_rows:
+            raise ValueError(ERR_OP_BAD_DIMS)
+        if isinstance(other, Vector):
+            other = other.data
+
+        mul = operator.mul
+        data = self.data
+        width = self.width
+        result = []
+        for i in range(self.n_rows):
+            j_start = max(0, i - self.n_lower)
+            j_end = min(self.n_rows, i + self.n_upper + 1)
+            start = i * width + j_start - i + self.n_lower
+            result.append(sum(map(mul, data[start:start + j_end - j_start],
+                                  other[j_start:j_end])))
+        return FloatVector(result)
@@ -42,3 +42,45 @@ def lorenz_attractor(t, X, **kwargs):
 
     X_dot = [x_dot, y_dot, z_dot]
     return dtt.Vector(X_dot)
+
+class _LorenzAttractor(object):
+    """
+    The Lorenz attractor with bound parameters (see make_lorenz_attractor()).
+    """
+    accepts_out = True
+
+    def __init__(self, sigma, rho, beta):
+        self.sigma = float(sigma)
+        self.rho = float(rho)
+        self.beta = float(beta)
+
+    def __call__(self, t, X, out=None):
+        x, y, z = X.data if isinstance(X, dtt.Vector) else X
+        if out is None:
+            out = dtt.FloatVector.zeros(3)
+        data = out.data
+        data[0] = self.sigma * (y - x)
+        data[1] = x * (self.rho - z) - y
+        data[2] = x * y - self.beta * z
+        return out
+
+def make_lorenz_attractor(sigma=LORENZ_SIGMA, rho=LORENZ_RHO,
+                          beta=LORENZ_BETA):
+    """
+    Returns the Lorenz attractor with its parameters bound, as a callable
+    f(t, X, out=None) writing the derivative into the output vector out
+    (allocating one if not given). Unlike lorenz_attractor(), it does not
+    look up its parameters on every call, and the integrators in
+    souffle.math.odeint give it preallocated buffers.
+
+    @type  sigma: number
+    @param sigma: Prandtl number
+    @type    rho: number
+    @param   rho: Rayleigh number
+    @type   beta: number
+    @param  beta: geometric factor
+
+    @rtype: function
+    @return: ODE function f(t, X, out=None)
+    """
+    return _LorenzAttractor(sigma, rho, beta)
@@ -4,6 +4,8 @@ Evaluating derivatives.
 # TODO:
 #     Include error estimates for each method?
 
+import souffle.datatypes as dt
+
 def forward_difference(f, x, h):
     """
     Evaluates the first derivative at x, with step size h, using a forward
@@ -131,6 +133,43 @@ def central_difference_order(f, x, h, n):
     n = int(n)
     raise NotImplementedError
 
+def jacobian(f, x, h, f0=None):
+    """
+    Evaluates the Jacobian matrix J[i][j] = df_i/dx_j of a vector function at
+    x, using a forward difference scheme. The step size for each component is
+    h scaled by the magnitude of the component (if greater than 1).
+
+    @type   f: function
+    @param  f: vector function f(x) to differentiate
+    @type   x: vector
+    @param  x: position at which to evaluate
+    @type   h: number
+    @param  h: relative step size
+    @type  f0: vector
+    @param f0: f(x), if already known
+
+    @rtype: Matrix
+    @return: Jacobian matrix of f evaluated at x
+    """
+    h = float(h)
+    X = dt.FloatVector(x)
+    if f0 is None:
+        f0 = f(X)
+    # Copy, in case f returns its input
+    f0 = [float(elem) for elem in f0]
+
+    cols = []
+    for j in range(X.n_elems):
+        xj = X.data[j]
+        hj = h * max(1.0, abs(xj))
+        X.data[j] = xj + hj
+        # Make the step exactly representable
+        hj = X.data[j] - xj
+        cols.append([(f1 - f0_i) / hj for f1, f0_i in zip(f(X), f0)])
+        X.data[j] = xj
+
+    return dt.Matrix([list(row) for row in zip(*cols)])
+
 # TODO
 def partial():
     raise NotImplementedError
@@ -0,0 +1,478 @@
+"""
+Integration of ensembles of systems of ordinary differential equations, with
+many initial conditions and parameter values advanced in lockstep.
+
+The state of an ensemble of N members, each with n_dims components, is kept
+as a structure of arrays: one column per component, holding that component
+for all members. The ODE function is called once per stage for the whole
+ensemble, with the "vectorised" calling convention
+
+    f(t, X, **kwargs)
+
+where X is a sequence of n_dims columns, and each keyword argument is either
+a constant shared by all members or a column with one value per member. It
+returns the derivative as a sequence of n_dims columns (or constants).
+
+With the NumPy backend, the columns are NumPy arrays, so that ODE functions
+written with plain arithmetic (such as chaos.lorenz_attractor) work unchanged.
+Without NumPy, the columns are zero-copy views of a flat array of floats; any
+ODE function for a single system can be adapted with vectorize().
+"""
+
+import array
+import souffle.datatypes as dtt
+import souffle.math.odeint as odeint
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+def vectorize(f):
+    """
+    Adapts an ODE function f(t, X, **kwargs) for a single system to the
+    vectorised calling convention, by calling it for each member of the
+    ensemble in turn. Keyword arguments given as sequences are passed to the
+    members element by element.
+
+    This makes any ODE function usable with an ensemble, but still costs one
+    call per member; functions written for whole columns are much faster.
+
+    @type  f: function
+    @param f: vector function f(t, X) solving a system of ODEs
+
+    @rtype: function
+    @return: vectorised ODE function
+    """
+    def f_vectorized(t, X, **kwargs):
+        n_members = len(X[0])
+        columns = {}
+        for key, value in kwargs.items():
+            if _is_column(value):
+                columns[key] = value
+        rows = []
+        for k in range(n_members):
+            member_kwargs = dict(kwargs)
+            for key, value in columns.items():
+                member_kwargs[key] = value[k]
+            rows.append(f(t, dtt.Vector([col[k] for col in X]),
+                          **member_kwargs))
+        return [list(col) for col in zip(*rows)]
+    return f_vectorized
+
+def _is_column(value):
+    """
+    Returns whether a keyword argument holds one value per member.
+
+    @type  value: object
+    @param value: keyword argument
+
+    @rtype: boolean
+    @return: whether value is a sequence
+    """
+    if isinstance(value, str):
+        return False
+    return hasattr(value, "__len__") and hasattr(value, "__getitem__")
+
+class _PythonBackend(object):
+    """
+    Pure-Python storage of the ensemble state: a flat dtt.FloatVector with
+    the components one after another, exposed as memoryview columns.
+
+    @type  n_members: number
+    @param n_members: number of members of the ensemble
+    """
+    name = "python"
+
+    def __init__(self, n_members):
+        self.n_members = n_members
+
+    def from_states(self, X0):
+        """
+        Converts the initial states of the members to a state of the
+        ensemble.
+
+        @type  X0: list
+        @param X0: initial states of the members
+
+        @rtype: dtt.FloatVector
+        @return: state of the ensemble
+        """
+        data = array.array("d")
+        for col in zip(*X0):
+            data.extend(map(float, col))
+        return dtt.FloatVector(data)
+
+    def param(self, value):
+        """
+        Converts a per-member parameter to a column.
+
+        @type  value: sequence
+        @param value: one value per member
+
+        @rtype: array.array
+        @return: column of values
+        """
+        return array.array("d", map(float, value))
+
+    def columns(self, state):
+        """
+        Returns the columns of a state of the ensemble, without copying.
+
+        @type  state: dtt.FloatVector
+        @param state: state of the ensemble
+
+        @rtype: sequence
+        @return: one column per component
+        """
+        view = state.buffer()
+        n = self.n_members
+        return [view[i:i + n] for i in range(0, len(view), n)]
+
+    def derivative(self, F):
+        """
+        Converts the columns returned by the ODE function to a state of the
+        ensemble. Constant components are broadcast to all members.
+
+        @type  F: sequence
+        @param F: one column (or constant) per component
+
+        @rtype: dtt.FloatVector
+        @return: derivative of the ensemble
+        """
+        n = self.n_members
+        data = array.array("d")
+        for col in F:
+            if _is_column(col):
+                data.extend(col)
+            else:
+                data.extend(array.array("d", [float(col)]) * n)
+        return dtt.FloatVector(data)
+
+    def combine(self, coeffs, states):
+        """
+        Computes a linear combination of states of the ensemble.
+
+        @type  coeffs: tuple
+        @param coeffs: the scalar coefficients
+        @type  states: tuple
+        @param states: the states to combine
+
+        @rtype: dtt.FloatVector
+        @return: the linear combination
+        """
+        return dtt.linear_combination(coeffs, states)
+
+    def member(self, state, k):
+        """
+        Extracts the state of one member.
+
+        @type  state: dtt.FloatVector
+        @param state: state of the ensemble
+        @type      k: number
+        @param     k: index of the member
+
+        @rtype: dtt.FloatVector
+        @return: state of the member
+        """
+        return dtt.FloatVector(state.data[k::self.n_members])
+
+class _NumpyBackend(object):
+    """
+    NumPy storage of the ensemble state: an array of shape
+    (n_dims, n_members), whose rows are the columns of the ensemble.
+
+    @type  n_members: number
+    @param n_members: number of members of the ensemble
+    """
+    name = "numpy"
+
+    def __init__(self, n_members):
+        self.n_members = n_members
+
+    def from_states(self, X0):
+        """
+        Converts the initial states of the members to a state of the
+        ensemble.
+
+        @type  X0: list
+        @param X0: initial states of the members
+
+        @rtype: numpy.ndarray
+        @return: state of the ensemble
+        """
+        return numpy.array([list(map(float, X)) for X in X0]).T.copy()
+
+    def param(self, value):
+        """
+        Converts a per-member parameter to a column.
+
+        @type  value: sequence
+        @param value: one value per member
+
+        @rtype: numpy.ndarray
+        @return: column of values
+        """
+        return numpy.asarray(value, dtype=float)
+
+    def columns(self, state):
+        """
+        Returns the columns of a state of the ensemble, without copying.
+
+        @type  state: numpy.ndarray
+        @param state: state of the ensemble
+
+        @rtype: sequence
+        @return: one column per component
+        """
+        return state
+
+    def derivative(self, F):
+        """
+        Converts the columns returned by the ODE function to a state of the
+        ensemble. Constant components are broadcast to all members.
+
+        @type  F: sequence
+        @param F: one column (or constant) per component
+
+        @rtype: numpy.ndarray
+        @return: derivative of the ensemble
+        """
+        shape = (self.n_members,)
+        return numpy.array([numpy.broadcast_to(col, shape) for col in F],
+                           dtype=float)
+
+    def combine(self, coeffs, states):
+        """
+        Computes a linear combination of states of the ensemble.
+
+        @type  coeffs: tuple
+        @param coeffs: the scalar coefficients
+        @type  states: tuple
+        @param states: the states to combine
+
+        @rtype: numpy.ndarray
+        @return: the linear combination
+        """
+        result = coeffs[0] * states[0]
+        for c, state in zip(coeffs[1:], states[1:]):
+            result += c * state
+        return result
+
+    def member(self, state, k):
+        """
+        Extracts the state of one member.
+
+        @type  state: numpy.ndarray
+        @param state: state of the ensemble
+        @type      k: number
+        @param     k: index of the member
+
+        @rtype: dtt.FloatVector
+        @return: state of the member
+        """
+        return dtt.FloatVector(state[:, k].tolist())
+
+class EnsembleRK4(object):
+    """
+    Integrates an ensemble of systems of ODEs in lockstep, using the
+    4th-order Runge-Kutta method. Each stage costs one call to the ODE
+    function for the whole ensemble, so the interpreter overhead of a step is
+    paid once per ensemble rather than once per member.
+
+    @type        f: function
+    @param       f: vectorised vector function f(t, X) solving a system of
+                    ODEs (see the module documentation)
+    @type       t0: number
+    @param      t0: initial time
+    @type       X0: list
+    @param      X0: initial states of the members
+    @type  backend: string
+    @param  backend: "numpy" or "python" (default="numpy" if NumPy is
+                     installed, else "python")
+    @type   kwargs: dictionary
+    @param  kwargs: constants to pass to the ODE function; sequences give one
+                    value per member
+    """
+    def __init__(self, f, t0=0.0, X0=[], backend=None, **kwargs):
+        if len(X0) == 0:
+            raise ValueError("ERROR: must give the initial state of each "
+                             "member of the ensemble")
+        if backend is None:
+            backend = "numpy" if numpy is not None else "python"
+        if backend == "numpy":
+            if numpy is None:
+                raise ValueError("NumPy backend requested, but NumPy is not "
+                                 "installed")
+            self._backend = _NumpyBackend(len(X0))
+        elif backend == "python":
+            self._backend = _PythonBackend(len(X0))
+        else:
+            raise ValueError("Unknown backend: %s" % backend)
+
+        n_dims = len(X0[0])
+        for X in X0:
+            if len(X) != n_dims:
+                raise ValueError("Initial states must all have the same "
+                                 "number of dimensions")
+
+        self.f = f
+        self.n_members = len(X0)
+        self.n_dims = n_dims
+        self.kwargs = {}
+        for key, value in kwargs.items():
+            if _is_column(value):
+                if len(value) != self.n_members:
+                    raise ValueError("Parameter %s must have one value per "
+                                     "member" % key)
+                value = self._backend.param(value)
+            self.kwargs[key] = value
+
+        self.t_cur = float(t0)
+        self.X_cur = self._backend.from_states(X0)
+        self.t = array.array("d")
+        self._snapshots = []
+        self._record(self.t_cur, self.X_cur)
+
+    @property
+    def backend(self):
+        """
+        The name of the backend in use.
+        """
+        return self._backend.name
+
+    def _record(self, t, X, store=True):
+        """
+        Makes (t, X) the current state, and stores it.
+
+        @type      t: number
+        @param     t: time
+        @type      X: state
+        @param     X: state of the ensemble
+        @type  store: boolean
+        @param store: whether to store the state
+        """
+        self.t_cur = t
+        self.X_cur = X
+        if store:
+            self.t.append(t)
+            self._snapshots.append(X)
+
+    def _derivative(self, t, X):
+        """
+        Evaluates the ODE function for the whole ensemble.
+
+        @type  t: number
+        @param t: time
+        @type  X: state
+        @param X: state of the ensemble
+
+        @rtype: state
+        @return: derivative of the ensemble
+        """
+        backend = self._backend
+        return backend.derivative(self.f(t, backend.columns(X),
+                                         **self.kwargs))
+
+    def step(self, dt):
+        """
+        Integrates a single step for all members.
+
+        @type  dt: number
+        @param dt: length of time step
+
+        @rtype: number, state
+        @return: updated time and state of the ensemble
+        """
+        t = self.t_cur
+        X = self.X_cur
+        combine = self._backend.combine
+
+        F1 = self._derivative(t, X)
+        F2 = self._derivative(t + dt / 2, combine((1.0, dt / 2), (X, F1)))
+        F3 = self._derivative(t + dt / 2, combine((1.0, dt / 2), (X, F2)))
+        F4 = self._derivative(t + dt, combine((1.0, dt), (X, F3)))
+
+        t_new = t + dt
+        X_new = combine((1.0, dt / 6, dt / 3, dt / 3, dt / 6),
+                        (X, F1, F2, F3, F4))
+
+        return t_new, X_new
+
+    def iterate(self, dt, n_steps, store=True):
+        """
+        Integrates over multiple steps, lazily yielding the state after each
+        step.
+
+        @type       dt: number
+        @param      dt: length of time step
+        @type  n_steps: number
+        @param n_steps: number of integration steps
+        @type    store: boolean
+        @param   store: store each state; if False, only the current state is
+                        kept [default=True]
+
+        @rtype: generator
+        @return: (time, state of the ensemble) after each step
+        """
+        dt = float(dt)
+        n_steps = int(n_steps)
+
+        for i in range(n_steps):
+            t_new, X_new = self.step(dt)
+            self._record(t_new, X_new, store)
+            yield t_new, X_new
+
+    def integrate(self, dt, n_steps, verbose=False, store=True):
+        """
+        Integrates over multiple steps.
+
+        @type       dt: number
+        @param      dt: length of time step
+        @type  n_steps: number
+        @param n_steps: number of integration steps
+        @type  verbose: boolean
+        @param verbose: print the time at each step [default=False]
+        @type    store: boolean
+        @param   store: store each state [default=True]
+        """
+        for t_new, X_new in self.iterate(dt, n_steps, store):
+            if verbose:
+                print(t_new)
+
+    def columns(self):
+        """
+        Returns the current state of the ensemble, one column per component.
+
+        @rtype: list
+        @return: columns (NumPy arrays, or memoryviews)
+        """
+        return list(self._backend.columns(self.X_cur))
+
+    def state(self, k):
+        """
+        Returns the current state of a member.
+
+        @type  k: number
+        @param k: index of the member
+
+        @rtype: dtt.FloatVector
+        @return: state of the member
+        """
+        return self._backend.member(self.X_cur, k)
+
+    def trajectory(self, k):
+        """
+        Collects the stored states of a member.
+
+        @type  k: number
+        @param k: index of the member
+
+        @rtype: odeint.Trajectory
+        @return: trajectory of the member
+        """
+        trajectory = odeint.Trajectory(self.n_dims,
+                                       capacity=max(1, len(self.t)))
+        for t, X in zip(self.t, self._snapshots):
+            trajectory.append(t, self._backend.member(X, k))
+        return trajectory
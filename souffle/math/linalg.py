@@ -1,10 +1,24 @@
 """
 Provides fundamental linear algebra operations (Euclidean).
 """
+import array
 import math
+import operator
 # Need absolute import here due to circular dependency with souffle.constants
 # TODO: refactor code?
 import souffle.datatypes
+import souffle.math.lineq
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Number of columns per strip of the product in matrix multiplication
+MATMUL_BLOCK = 64
+# Number of multiply-adds above which matrix products are handed to NumPy
+# (if installed), for which converting the operands is then cheap
+NUMPY_MIN_OPS = 4096
 
 def dot_product(A, B):
     """
@@ -39,11 +53,155 @@ def cross_product(A, B):
     """
     return
 
-# TODO:
+def _flat(A):
+    """
+    Converts a matrix to flat row-major storage.
+
+    @type A: matrix (souffle.datatypes.Matrix, or list of rows)
+
+    @rtype: array.array, number, number
+    @return: elements, number of rows, number of columns
+    """
+    if isinstance(A, souffle.datatypes.Matrix):
+        return A.to_array(), A.n_rows, A.n_cols
+    n_rows = len(A)
+    n_cols = len(A[0]) if n_rows > 0 else 0
+    data = array.array("d")
+    for row in A:
+        if len(row) != n_cols:
+            raise ValueError("Row lengths are not all equal")
+        data.extend(map(float, row))
+    return data, n_rows, n_cols
+
+def _matmul_flat(a, b, n, m, p, block_size=MATMUL_BLOCK, use_numpy=None):
+    """
+    Multiplies an n x m matrix by an m x p matrix, both stored flat in
+    row-major order.
+
+    The right operand is transposed once, so that each element of the product
+    is the dot product of two contiguous arrays. The product is computed in
+    strips of block_size columns, each strip being swept over every row of
+    the left operand while its columns are still in cache; the inner
+    dimension is not blocked, so that each dot product stays a single call.
+    Large products go to NumPy, if installed.
+
+    @type           a: array.array
+    @param          a: left operand
+    @type           b: array.array
+    @param          b: right operand
+    @type           n: number
+    @param          n: number of rows of the left operand
+    @type           m: number
+    @param          m: number of columns of the left operand
+    @type           p: number
+    @param          p: number of columns of the right operand
+    @type  block_size: number
+    @param block_size: number of columns per strip of the product
+    @type   use_numpy: boolean
+    @param  use_numpy: use NumPy (default=if installed, for large products)
+
+    @rtype: array.array
+    @return: product, stored flat in row-major order
+    """
+    if use_numpy is None:
+        use_numpy = numpy is not None and n * m * p >= NUMPY_MIN_OPS
+    if use_numpy:
+        if numpy is None:
+            raise ValueError("NumPy requested, but NumPy is not installed")
+        c = numpy.dot(numpy.frombuffer(a).reshape(n, m),
+                      numpy.frombuffer(b).reshape(m, p))
+        return array.array("d", c.tobytes())
+
+    mul = operator.mul
+    rows = [a[i * m:(i + 1) * m] for i in range(n)]
+    cols = [b[j::p] for j in range(p)]
+    c = array.array("d", bytes(8 * n * p))
+    for j_start in range(0, p, block_size):
+        j_end = min(j_start + block_size, p)
+        strip = cols[j_start:j_end]
+        for i in range(n):
+            row = rows[i]
+            c[i * p + j_start:i * p + j_end] = array.array(
+                "d", [sum(map(mul, row, col)) for col in strip])
+    return c
+
+def matmul(A, B, block_size=MATMUL_BLOCK, use_numpy=None):
+    """
+    Computes the matrix product of A and B.
+
+    @type           A: matrix
+    @param          A: left operand, n x m
+    @type           B: matrix
+    @param          B: right operand, m x p
+    @type  block_size: number
+    @param block_size: number of columns per strip of the product
+    @type   use_numpy: boolean
+    @param  use_numpy: use NumPy (default=if installed, for large products)
+
+    @rtype: matrix
+    @return: product of A and B, n x p
+    """
+    a, n, m = _flat(A)
+    b, m_b, p = _flat(B)
+    if m != m_b:
+        raise ValueError("Operands have incompatible dimensions for matrix "
+                         "multiplication")
+    c = _matmul_flat(a, b, n, m, p, block_size, use_numpy)
+    return souffle.datatypes.Matrix.from_flat(c, n, p)
+
+def matvec(A, x):
+    """
+    Computes the product of the matrix A and the vector x.
+
+    @type A: matrix
+    @type x: vector
+
+    @rtype: vector
+    @return: product of A and x
+    """
+    if isinstance(A, souffle.datatypes.Matrix):
+        return A.mul_vector(x)
+    if isinstance(x, souffle.datatypes.Vector):
+        x = x.data
+    mul = operator.mul
+    for row in A:
+        if len(row) != len(x):
+            raise ValueError("Operands have incompatible dimensions for "
+                             "matrix-vector multiplication")
+    return souffle.datatypes.FloatVector(
+        [float(sum(map(mul, row, x))) for row in A])
+
+def determinant(A):
+    """
+    Computes the determinant of a square matrix A by LU decomposition with
+    partial pivoting, in O(n^3) operations.
+
+    @type A: square matrix
+
+    @rtype: number
+    @return: determinant of A
+    """
+    return souffle.math.lineq.lu_factor(A).det()
+
+def log_determinant(A):
+    """
+    Computes the sign and the natural logarithm of the absolute value of the
+    determinant of a square matrix A, by LU decomposition. Unlike
+    determinant(), this does not overflow (or underflow) for large matrices.
+
+    @type A: square matrix
+
+    @rtype: number, number
+    @return: sign of the determinant (1, -1, or 0 if A is singular), and
+             log |det(A)| (-inf if A is singular)
+    """
+    return souffle.math.lineq.lu_factor(A).log_det()
+
 def determinant_minors(A):
     """
     Recursively computes the determinant of a square matrix A using expansion
-    by minors.
+    by minors. This takes O(n!) operations, and is only kept as a reference;
+    use determinant() instead.
 
     @type A: square matrix
 
@@ -60,40 +218,43 @@ def determinant_minors(A):
 
     # Check for trivial 1x1 case
     if n == 1:
-        result = A.data[0][0]
+        result = A[0, 0]
         return result
 
     # Check for 2x2 case
     if n == 2:
-        result = A.data[0][0] * A.data[1][1] - A.data[1][0] * A.data[0][1]
+        result = A[0, 0] * A[1, 1] - A[1, 0] * A[0, 1]
         return result
 
     result = 0.0
     for j1 in range(n):
-        m = [[0.0 for i in range(n - 1)] for j in range(n - 1)]
-        M = souffle.datatypes.Matrix(m)
+        M = souffle.datatypes.Matrix.zeros(n - 1, n - 1)
         for i in range(n):
             j2 = 0
             for j in range(n):
                 if j == j1:
                     continue
-                M.data[i - 1][j2] = A.data[i][j]
+                M[i - 1, j2] = A[i, j]
                 j2 += 1
-        result += (math.pow(-1, 1 + j1 + 1) * A.data[0][j1]
+        result += (math.pow(-1, 1 + j1 + 1) * A[0, j1]
                    * determinant_minors(M))
     return result
 
-# TODO:
 def inverse(A):
     """
-    Returns the inverse of a square matrix A.
+    Returns the inverse of a square matrix A, by LU decomposition with
+    partial pivoting, solving for the columns of the identity matrix.
 
     @type A: square matrix
 
     @rtype: matrix
     @return: inverse of A
     """
-    return
+    lu = souffle.math.lineq.lu_factor(A)
+    n = lu.n
+    cols = lu.solve([[1.0 if i == j else 0.0 for i in range(n)]
+                     for j in range(n)])
+    return souffle.datatypes.Matrix([list(row) for row in zip(*cols)])
 
 if __name__ == "__main__":
     A = [1, 2, 3]
@@ -106,3 +267,5 @@ if __name__ == "__main__":
          [ 0.74854304,  0.91927404,  0.13369317,  0.77294559],
          [ 0.54023376,  0.64533939,  0.97845268,  0.17995442]])
     print(determinant_minors(C))
+    print(determinant(C))
+    print(inverse(C))
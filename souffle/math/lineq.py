@@ -5,6 +5,8 @@ Solving systems of linear equations.
 # TODO:
 #     Modify gauss_elim() to use Matrix class
 
+import math
+import operator
 import souffle.datatypes as dt
 
 def gauss_elim(A, b):
@@ -27,7 +29,7 @@ def gauss_elim(A, b):
         raise ValueError("b is not list or tuple")
 
     if isinstance(A, dt.Matrix):
-        A = A.data
+        A = A.tolist()
     b = list(map(float, b))
 
     n_rows = len(A)
@@ -38,12 +40,13 @@ def gauss_elim(A, b):
     for i in range(n_rows):
         #---- Do partial pivoting
         # Check if this row needs to be swapped
-        # Get the i-th column
-        tmp = [A[j][i] for j in range(n_rows)]
+        # Get the i-th column, from the i-th row down (the rows above have
+        # already been eliminated)
+        tmp = [A[j][i] for j in range(i, n_rows)]
         # Get distance of each element from zero along the i-th column
         diffs = [abs(elem) for elem in tmp]
         # Get the row index of the pivot element (farthest from zero)
-        pivot_idx = diffs.index(max(diffs))
+        pivot_idx = i + diffs.index(max(diffs))
         # If the pivot element is not in the i-th row and not in a higher row
         if pivot_idx > i:
             # Swap the i-th row with the pivot row
@@ -73,3 +76,709 @@ def gauss_elim(A, b):
             x[i] -= A[i][j] * x[j]
 
     return x
+
+class LUFactor(object):
+    """
+    LU decomposition with partial pivoting, PA = LU, of a square matrix A.
+    The factorisation costs O(n^3) once; each solve then costs O(n^2), and
+    the determinant comes for free.
+
+    L (unit lower triangular) and U are stored together, as a list of rows;
+    the permutation is kept as the original index of each row.
+
+    @type  A: matrix
+    @param A: square matrix (dt.Matrix, or list of rows); it is not modified
+    """
+    def __init__(self, A):
+        if isinstance(A, dt.Matrix):
+            A = A.tolist()
+        if not (isinstance(A, list) or isinstance(A, tuple)):
+            raise ValueError("A is not Matrix, list or tuple")
+        n = len(A)
+        for row in A:
+            if len(row) != n:
+                raise ValueError("A is not square")
+
+        lu = [[float(elem) for elem in row] for row in A]
+        perm = list(range(n))
+        sign = 1
+        singular = False
+        for k in range(n):
+            #---- Partial pivoting: bring up the row with the largest element
+            # in the k-th column, from the k-th row down
+            col = [abs(lu[i][k]) for i in range(k, n)]
+            p = k + col.index(max(col))
+            if lu[p][k] == 0.0:
+                # Nothing to eliminate in this column
+                singular = True
+                continue
+            if p != k:
+                lu[k], lu[p] = lu[p], lu[k]
+                perm[k], perm[p] = perm[p], perm[k]
+                sign = -sign
+            #---- Eliminate the k-th column below the pivot, keeping the
+            # multipliers in place of the eliminated elements
+            row_k = lu[k]
+            pivot = row_k[k]
+            tail_k = row_k[k + 1:]
+            for i in range(k + 1, n):
+                row_i = lu[i]
+                l = row_i[k] / pivot
+                row_i[k] = l
+                if l != 0.0:
+                    row_i[k + 1:] = [a - l * b for a, b
+                                     in zip(row_i[k + 1:], tail_k)]
+
+        self.n = n
+        self.lu = lu
+        self.perm = perm
+        self.sign = sign
+        self.singular = singular
+
+    def solve(self, b):
+        """
+        Solves Ax = b by forward and back substitution. A batch of right-hand
+        sides may be given as a sequence of vectors.
+
+        @type  b: vector
+        @param b: RHS vector of length n, or sequence of RHS vectors
+
+        @rtype: list
+        @return: solution vector (list of solution vectors for a batch)
+        """
+        if self.singular:
+            raise ValueError("Matrix is singular")
+        if isinstance(b, dt.Vector):
+            b = b.data
+        if len(b) > 0 and hasattr(b[0], "__len__"):
+            return [self._solve(rhs.data if isinstance(rhs, dt.Vector)
+                                else rhs)
+                    for rhs in b]
+        return self._solve(b)
+
+    def _solve(self, b):
+        """
+        Solves Ax = b for a single right-hand side.
+
+        @type  b: sequence
+        @param b: RHS vector of length n
+
+        @rtype: list
+        @return: solution vector
+        """
+        n = self.n
+        lu = self.lu
+        if len(b) != n:
+            raise ValueError("b must have %d elements" % n)
+
+        # Forward substitution, L y = P b
+        y = [0.0] * n
+        for i in range(n):
+            row = lu[i]
+            s = float(b[self.perm[i]])
+            for j in range(i):
+                s -= row[j] * y[j]
+            y[i] = s
+        # Back substitution, U x = y
+        x = [0.0] * n
+        for i in range(n - 1, -1, -1):
+            row = lu[i]
+            s = y[i]
+            for j in range(i + 1, n):
+                s -= row[j] * x[j]
+            x[i] = s / row[i]
+        return x
+
+    def det(self):
+        """
+        Returns the determinant of A, the signed product of the pivots.
+
+        @rtype: number
+        @return: determinant
+        """
+        if self.singular:
+            return 0.0
+        result = float(self.sign)
+        for i in range(self.n):
+            result *= self.lu[i][i]
+        return result
+
+    def log_det(self):
+        """
+        Returns the sign and the natural logarithm of the absolute value of
+        the determinant of A, which do not overflow or underflow where the
+        determinant itself would.
+
+        @rtype: number, number
+        @return: sign (1, -1, or 0 if A is singular), and log |det(A)|
+                 (-inf if A is singular)
+        """
+        if self.singular:
+            return 0.0, float("-inf")
+        sign = float(self.sign)
+        result = 0.0
+        for i in range(self.n):
+            pivot = self.lu[i][i]
+            if pivot < 0.0:
+                sign = -sign
+            result += math.log(abs(pivot))
+        return sign, result
+
+class BandedLUFactor(LUFactor):
+    """
+    LU decomposition with partial pivoting of a band matrix, PA = LU, in
+    O(n * n_lower * (n_lower + n_upper)) operations; each solve then costs
+    O(n * (n_lower + n_upper)).
+
+    Pivoting lets U fill in up to n_lower + n_upper superdiagonals. U is kept
+    row by row, aligned on the diagonal; the multipliers of L are kept per
+    column, and the row interchanges are applied to the RHS one step at a
+    time, as they were made.
+
+    @type  A: dt.BandedMatrix
+    @param A: band matrix; it is not modified
+    """
+    def __init__(self, A):
+        if not isinstance(A, dt.BandedMatrix):
+            raise ValueError("A is not BandedMatrix")
+        n = A.n_rows
+        l = A.n_lower
+        # Row i holds columns i - l to i + u + l, at indices 0 to width - 1
+        width = 2 * l + A.n_upper + 1
+        reach = A.n_upper + l
+        lu = [0.0] * (n * width)
+        for i in range(n):
+            start = i * A.width
+            lu[i * width:i * width + A.width] = A.data[start:start + A.width]
+        mult = [0.0] * (n * l)
+        piv = [0] * n
+        sign = 1
+        singular = False
+
+        for k in range(n):
+            last = min(k + l, n - 1)
+            end = min(k + reach, n - 1)
+            #---- Partial pivoting among the rows reaching column k; from
+            # here on they only have nonzeros in columns k to end
+            col = [abs(lu[i * width + k - i + l]) for i in range(k, last + 1)]
+            p = k + col.index(max(col))
+            piv[k] = p
+            if lu[p * width + k - p + l] == 0.0:
+                singular = True
+                continue
+            if p != k:
+                a = k * width + l
+                b = p * width + k - p + l
+                n_cols = end - k + 1
+                lu[a:a + n_cols], lu[b:b + n_cols] = (lu[b:b + n_cols],
+                                                      lu[a:a + n_cols])
+                sign = -sign
+            #---- Eliminate column k below the pivot
+            pivot = lu[k * width + l]
+            tail_k = lu[k * width + l + 1:k * width + l + 1 + end - k]
+            for i in range(k + 1, last + 1):
+                a = i * width + k - i + l
+                m = lu[a] / pivot
+                lu[a] = 0.0
+                mult[k * l + i - k - 1] = m
+                if m != 0.0:
+                    lu[a + 1:a + 1 + end - k] = [
+                        x - m * y for x, y in zip(lu[a + 1:a + 1 + end - k],
+                                                  tail_k)]
+
+        self.n = n
+        self.n_lower = l
+        self.reach = reach
+        self.width = width
+        self.lu = lu
+        self.mult = mult
+        self.piv = piv
+        self.sign = sign
+        self.singular = singular
+
+    def _solve(self, b):
+        """
+        Solves Ax = b for a single right-hand side.
+
+        @type  b: sequence
+        @param b: RHS vector of length n
+
+        @rtype: list
+        @return: solution vector
+        """
+        n = self.n
+        l = self.n_lower
+        width = self.width
+        lu = self.lu
+        mult = self.mult
+        if len(b) != n:
+            raise ValueError("b must have %d elements" % n)
+
+        # Forward substitution, applying the interchanges as they were made
+        x = [float(elem) for elem in b]
+        for k in range(n):
+            p = self.piv[k]
+            if p != k:
+                x[k], x[p] = x[p], x[k]
+            x_k = x[k]
+            if x_k != 0.0:
+                for t in range(min(l, n - 1 - k)):
+                    x[k + 1 + t] -= mult[k * l + t] * x_k
+        # Back substitution
+        for i in range(n - 1, -1, -1):
+            start = i * width + l
+            end = min(i + self.reach, n - 1)
+            s = x[i] - sum(map(operator.mul, lu[start + 1:start + 1 + end - i],
+                               x[i + 1:end + 1]))
+            x[i] = s / lu[start]
+        return x
+
+    def det(self):
+        """
+        Returns the determinant of A, the signed product of the pivots.
+
+        @rtype: number
+        @return: determinant
+        """
+        if self.singular:
+            return 0.0
+        result = float(self.sign)
+        for i in range(self.n):
+            result *= self.lu[i * self.width + self.n_lower]
+        return result
+
+    def log_det(self):
+        """
+        Returns the sign and the natural logarithm of the absolute value of
+        the determinant of A (see LUFactor.log_det()).
+
+        @rtype: number, number
+        @return: sign (1, -1, or 0 if A is singular), and log |det(A)|
+                 (-inf if A is singular)
+        """
+        if self.singular:
+            return 0.0, float("-inf")
+        sign = float(self.sign)
+        result = 0.0
+        for i in range(self.n):
+            pivot = self.lu[i * self.width + self.n_lower]
+            if pivot < 0.0:
+                sign = -sign
+            result += math.log(abs(pivot))
+        return sign, result
+
+def lu_factor(A):
+    """
+    Computes the LU decomposition, with partial pivoting, of a square matrix,
+    for repeated solves with the same matrix. Band matrices keep their band
+    structure.
+
+    @type  A: matrix
+    @param A: square matrix (dt.Matrix, dt.BandedMatrix or list of rows)
+
+    @rtype: LUFactor or BandedLUFactor
+    @return: the factorisation
+    """
+    if isinstance(A, dt.BandedMatrix):
+        return BandedLUFactor(A)
+    return LUFactor(A)
+
+def thomas(lower, diag, upper, rhs):
+    """
+    Solves a tridiagonal system by the Thomas algorithm, i.e. Gaussian
+    elimination without pivoting, in O(n) operations. It is stable for
+    diagonally dominant (or symmetric positive-definite) matrices, such as
+    those of implicit schemes for diffusion problems.
+
+    @type  lower: vector
+    @param lower: subdiagonal, A[i + 1][i] (n - 1 elements)
+    @type   diag: vector
+    @param  diag: main diagonal, A[i][i] (n elements)
+    @type  upper: vector
+    @param upper: superdiagonal, A[i][i + 1] (n - 1 elements)
+    @type    rhs: vector
+    @param   rhs: RHS vector (n elements)
+
+    @rtype: list
+    @return: solution vector
+    """
+    n = len(diag)
+    if not (len(lower) == len(upper) == n - 1 and len(rhs) == n):
+        raise ValueError("Diagonals and RHS have incompatible lengths")
+
+    # Forward sweep, normalising each row by its pivot
+    c = [0.0] * n
+    d = [0.0] * n
+    pivot = float(diag[0])
+    if pivot == 0.0:
+        raise ValueError("Zero pivot; use lu_factor() instead")
+    if n > 1:
+        c[0] = upper[0] / pivot
+    d[0] = rhs[0] / pivot
+    for i in range(1, n):
+        a_i = lower[i - 1]
+        pivot = diag[i] - a_i * c[i - 1]
+        if pivot == 0.0:
+            raise ValueError("Zero pivot; use lu_factor() instead")
+        if i < n - 1:
+            c[i] = upper[i] / pivot
+        d[i] = (rhs[i] - a_i * d[i - 1]) / pivot
+    # Back substitution
+    for i in range(n - 2, -1, -1):
+        d[i] -= c[i] * d[i + 1]
+    return d
+
+def cyclic_tridiagonal(lower, diag, upper, rhs, corner_lower, corner_upper):
+    """
+    Solves a cyclic tridiagonal system, i.e. a tridiagonal system with the
+    corner elements A[n - 1][0] and A[0][n - 1] also nonzero, as given by
+    periodic boundary conditions. The corners are a rank-one correction to a
+    tridiagonal matrix, so the Sherman-Morrison formula gives the solution
+    from two Thomas solves, in O(n) operations.
+
+    @type          lower: vector
+    @param         lower: subdiagonal, A[i + 1][i] (n - 1 elements)
+    @type           diag: vector
+    @param          diag: main diagonal, A[i][i] (n elements)
+    @type          upper: vector
+    @param         upper: superdiagonal, A[i][i + 1] (n - 1 elements)
+    @type            rhs: vector
+    @param           rhs: RHS vector (n elements)
+    @type   corner_lower: number
+    @param  corner_lower: bottom-left corner, A[n - 1][0]
+    @type   corner_upper: number
+    @param  corner_upper: top-right corner, A[0][n - 1]
+
+    @rtype: list
+    @return: solution vector
+    """
+    n = len(diag)
+    if n < 3:
+        raise ValueError("Cyclic tridiagonal systems need n >= 3")
+
+    # A = T + u v^T, with u = (gamma, 0, ..., 0, corner_lower) and
+    # v = (1, 0, ..., 0, corner_upper / gamma)
+    gamma = -float(diag[0]) or -1.0
+    diag = [float(elem) for elem in diag]
+    diag[0] -= gamma
+    diag[-1] -= corner_lower * corner_upper / gamma
+    x = thomas(lower, diag, upper, rhs)
+    u = [0.0] * n
+    u[0] = gamma
+    u[-1] = corner_lower
+    z = thomas(lower, diag, upper, u)
+    fact = ((x[0] + corner_upper * x[-1] / gamma)
+            / (1.0 + z[0] + corner_upper * z[-1] / gamma))
+    return [x_i - fact * z_i for x_i, z_i in zip(x, z)]
+
+def solve_banded(A, b):
+    """
+    Solves Ax = b for a band matrix A in O(n * bandwidth^2) operations. For
+    diagonally dominant tridiagonal matrices, the Thomas algorithm is used;
+    otherwise the banded LU decomposition with partial pivoting.
+
+    @type  A: dt.BandedMatrix
+    @param A: band matrix
+    @type  b: vector
+    @param b: RHS vector (or sequence of RHS vectors)
+
+    @rtype: list
+    @return: solution vector (list of solution vectors for a batch)
+    """
+    if not isinstance(A, dt.BandedMatrix):
+        raise ValueError("A is not BandedMatrix")
+    if isinstance(b, dt.Vector):
+        b = b.data
+    if A.n_lower == 1 and A.n_upper == 1 and A.n_rows > 1:
+        lower = A.diagonal(-1)
+        diag = A.diagonal()
+        upper = A.diagonal(1)
+        off = [0.0] * A.n_rows
+        for i in range(A.n_rows - 1):
+            off[i + 1] += abs(lower[i])
+            off[i] += abs(upper[i])
+        # Diagonal dominance keeps the elimination without pivoting stable
+        if all([abs(d) >= o for d, o in zip(diag, off)]):
+            if len(b) > 0 and hasattr(b[0], "__len__"):
+                return [thomas(lower, diag, upper, rhs) for rhs in b]
+            return thomas(lower, diag, upper, b)
+    factor = BandedLUFactor(A)
+    if factor.singular:
+        raise ValueError("Matrix is singular")
+    return factor.solve(b)
+
+def _iteration_setup(A, b, x0):
+    """
+    Prepares the operands of the iterative methods.
+
+    @type   A: matrix
+    @param  A: square coefficient matrix (dt.SparseMatrix, dt.Matrix or list
+               of rows)
+    @type   b: vector
+    @param  b: RHS vector
+    @type  x0: vector
+    @param x0: initial guess (default=zeros)
+
+    @rtype: tuple
+    @return: A as a dt.SparseMatrix, b and x0 as lists of floats
+    """
+    if not isinstance(A, dt.SparseMatrix):
+        A = dt.SparseMatrix.from_dense(A)
+    if A.n_rows != A.n_cols:
+        raise ValueError("A is not square")
+    if isinstance(b, dt.Vector):
+        b = b.data
+    if len(b) != A.n_rows:
+        raise ValueError("b must have %d elements" % A.n_rows)
+    b = [float(elem) for elem in b]
+    if x0 is None:
+        x = [0.0] * A.n_rows
+    else:
+        if isinstance(x0, dt.Vector):
+            x0 = x0.data
+        if len(x0) != A.n_rows:
+            raise ValueError("x0 must have %d elements" % A.n_rows)
+        x = [float(elem) for elem in x0]
+    return A, b, x
+
+def _dot(x, y):
+    """
+    Computes the dot product of two sequences of floats.
+
+    @type  x: sequence
+    @type  y: sequence
+
+    @rtype: number
+    @return: dot product of x and y
+    """
+    return sum(map(operator.mul, x, y))
+
+def _diagonal(A):
+    """
+    Returns the diagonal of a dt.SparseMatrix, which must not contain zeros.
+
+    @type  A: dt.SparseMatrix
+    @param A: square matrix
+
+    @rtype: list
+    @return: diagonal elements
+    """
+    d = A.diagonal()
+    if 0.0 in d:
+        raise ValueError("A has a zero on the diagonal")
+    return d
+
+def jacobi(A, b, x0=None, delta=1e-10, max_iter=10000):
+    """
+    Solves Ax = b by Jacobi iterations, which converge if A is (e.g.)
+    strictly diagonally dominant. Each iteration costs O(nnz) for a sparse A.
+
+    @type         A: matrix
+    @param        A: square coefficient matrix (dt.SparseMatrix, dt.Matrix or
+                     list of rows)
+    @type         b: vector
+    @param        b: RHS vector
+    @type        x0: vector
+    @param       x0: initial guess (default=zeros)
+    @type     delta: number
+    @param    delta: desired accuracy, relative to the norm of b, of the
+                     residual b - Ax
+    @type  max_iter: number
+    @param max_iter: maximum number of iterations
+
+    @rtype: list, number
+    @return: solution vector, iteration counter
+    """
+    A, b, x = _iteration_setup(A, b, x0)
+    d = _diagonal(A)
+    tol = delta * (_dot(b, b)**0.5 or 1.0)
+
+    for n_iter in range(max_iter + 1):
+        r = [b_i - Ax_i for b_i, Ax_i in zip(b, A.mul_vector(x).data)]
+        if _dot(r, r)**0.5 <= tol:
+            return x, n_iter
+        x = [x_i + r_i / d_i for x_i, r_i, d_i in zip(x, r, d)]
+    raise ValueError("Jacobi iterations did not converge")
+
+def sor(A, b, omega=1.0, x0=None, delta=1e-10, max_iter=10000):
+    """
+    Solves Ax = b by successive over-relaxation (SOR), i.e. Gauss-Seidel
+    sweeps whose corrections are scaled by omega. It converges for symmetric
+    positive-definite A and 0 < omega < 2, or strictly diagonally dominant A
+    and omega = 1; the optimal omega for discretised elliptic equations is
+    close to 2. Each sweep costs O(nnz) for a sparse A.
+
+    The convergence test uses the residual of each row just before it is
+    updated, which needs no extra matrix-vector product.
+
+    @type         A: matrix
+    @param        A: square coefficient matrix (dt.SparseMatrix, dt.Matrix or
+                     list of rows)
+    @type         b: vector
+    @param        b: RHS vector
+    @type     omega: number
+    @param    omega: relaxation parameter, 0 < omega < 2
+    @type        x0: vector
+    @param       x0: initial guess (default=zeros)
+    @type     delta: number
+    @param    delta: desired accuracy, relative to the norm of b, of the
+                     residual b - Ax
+    @type  max_iter: number
+    @param max_iter: maximum number of sweeps
+
+    @rtype: list, number
+    @return: solution vector, iteration counter
+    """
+    if not 0.0 < omega < 2.0:
+        raise ValueError("omega must be between 0 and 2")
+    A, b, x = _iteration_setup(A, b, x0)
+    scale = [omega / d_i for d_i in _diagonal(A)]
+    tol = delta * (_dot(b, b)**0.5 or 1.0)
+
+    mul = operator.mul
+    values = A.values
+    indices = A.indices
+    indptr = A.indptr
+    x_at = x.__getitem__
+    for n_iter in range(1, max_iter + 1):
+        r_sq = 0.0
+        for i in range(A.n_rows):
+            start, end = indptr[i], indptr[i + 1]
+            r = b[i] - sum(map(mul, values[start:end],
+                               map(x_at, indices[start:end])))
+            r_sq += r * r
+            x[i] += scale[i] * r
+        if r_sq**0.5 <= tol:
+            return x, n_iter
+    raise ValueError("SOR iterations did not converge")
+
+def gauss_seidel(A, b, x0=None, delta=1e-10, max_iter=10000):
+    """
+    Solves Ax = b by Gauss-Seidel iterations, i.e. SOR with omega = 1 (see
+    sor()).
+
+    @type         A: matrix
+    @param        A: square coefficient matrix (dt.SparseMatrix, dt.Matrix or
+                     list of rows)
+    @type         b: vector
+    @param        b: RHS vector
+    @type        x0: vector
+    @param       x0: initial guess (default=zeros)
+    @type     delta: number
+    @param    delta: desired accuracy, relative to the norm of b, of the
+                     residual b - Ax
+    @type  max_iter: number
+    @param max_iter: maximum number of sweeps
+
+    @rtype: list, number
+    @return: solution vector, iteration counter
+    """
+    return sor(A, b, 1.0, x0, delta, max_iter)
+
+def conjugate_gradient(A, b, x0=None, delta=1e-10, max_iter=None):
+    """
+    Solves Ax = b by the conjugate gradient method, for symmetric
+    positive-definite A. In exact arithmetic it converges in at most n
+    iterations, but much sooner if the eigenvalues of A are clustered. Each
+    iteration costs one matrix-vector product, O(nnz) for a sparse A.
+
+    @type         A: matrix
+    @param        A: square, symmetric positive-definite coefficient matrix
+                     (dt.SparseMatrix, dt.Matrix or list of rows)
+    @type         b: vector
+    @param        b: RHS vector
+    @type        x0: vector
+    @param       x0: initial guess (default=zeros)
+    @type     delta: number
+    @param    delta: desired accuracy, relative to the norm of b, of the
+                     residual b - Ax
+    @type  max_iter: number
+    @param max_iter: maximum number of iterations (default=10n)
+
+    @rtype: list, number
+    @return: solution vector, iteration counter
+    """
+    A, b, x = _iteration_setup(A, b, x0)
+    if max_iter is None:
+        max_iter = 10 * A.n_rows
+    tol = delta * (_dot(b, b)**0.5 or 1.0)
+
+    r = [b_i - Ax_i for b_i, Ax_i in zip(b, A.mul_vector(x).data)]
+    p = r[:]
+    rr = _dot(r, r)
+    for n_iter in range(max_iter + 1):
+        if rr**0.5 <= tol:
+            return x, n_iter
+        if n_iter == max_iter:
+            break
+        Ap = A.mul_vector(p).data
+        pAp = _dot(p, Ap)
+        if pAp <= 0.0:
+            raise ValueError("A is not positive definite")
+        alpha = rr / pAp
+        x = [x_i + alpha * p_i for x_i, p_i in zip(x, p)]
+        r = [r_i - alpha * Ap_i for r_i, Ap_i in zip(r, Ap)]
+        rr_new = _dot(r, r)
+        beta = rr_new / rr
+        p = [r_i + beta * p_i for r_i, p_i in zip(r, p)]
+        rr = rr_new
+    raise ValueError("Conjugate gradient iterations did not converge")
+
+def bicgstab(A, b, x0=None, delta=1e-10, max_iter=None):
+    """
+    Solves Ax = b by the biconjugate gradient stabilised method (BiCGSTAB),
+    for general (nonsymmetric) A. Each iteration costs two matrix-vector
+    products, O(nnz) for a sparse A.
+
+    @type         A: matrix
+    @param        A: square coefficient matrix (dt.SparseMatrix, dt.Matrix or
+                     list of rows)
+    @type         b: vector
+    @param        b: RHS vector
+    @type        x0: vector
+    @param       x0: initial guess (default=zeros)
+    @type     delta: number
+    @param    delta: desired accuracy, relative to the norm of b, of the
+                     residual b - Ax
+    @type  max_iter: number
+    @param max_iter: maximum number of iterations (default=10n)
+
+    @rtype: list, number
+    @return: solution vector, iteration counter
+    """
+    A, b, x = _iteration_setup(A, b, x0)
+    if max_iter is None:
+        max_iter = 10 * A.n_rows
+    tol = delta * (_dot(b, b)**0.5 or 1.0)
+
+    r = [b_i - Ax_i for b_i, Ax_i in zip(b, A.mul_vector(x).data)]
+    r_hat = r[:]
+    rho = alpha = omega = 1.0
+    p = [0.0] * A.n_rows
+    v = [0.0] * A.n_rows
+    for n_iter in range(max_iter + 1):
+        if _dot(r, r)**0.5 <= tol:
+            return x, n_iter
+        if n_iter == max_iter:
+            break
+        rho_new = _dot(r_hat, r)
+        if rho_new == 0.0:
+            raise ValueError("BiCGSTAB broke down")
+        beta = rho_new / rho * alpha / omega
+        p = [r_i + beta * (p_i - omega * v_i)
+             for r_i, p_i, v_i in zip(r, p, v)]
+        v = A.mul_vector(p).data
+        alpha = rho_new / _dot(r_hat, v)
+        s = [r_i - alpha * v_i for r_i, v_i in zip(r, v)]
+        if _dot(s, s)**0.5 <= tol:
+            x = [x_i + alpha * p_i for x_i, p_i in zip(x, p)]
+            return x, n_iter + 1
+        t = A.mul_vector(s).data
+        omega = _dot(t, s) / _dot(t, t)
+        if omega == 0.0:
+            raise ValueError("BiCGSTAB broke down")
+        x = [x_i + alpha * p_i + omega * s_i
+             for x_i, p_i, s_i in zip(x, p, s)]
+        r = [s_i - omega * t_i for s_i, t_i in zip(s, t)]
+        rho = rho_new
+    raise ValueError("BiCGSTAB iterations did not converge")
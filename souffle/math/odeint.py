@@ -1,11 +1,836 @@
 """
 Integration of systems of ordinary differential equations, with non-adaptive
-and adaptive methods.
+and adaptive methods, implicit methods for stiff systems, and symplectic
+methods for Hamiltonian systems.
 
 See odeint_derivations.pdf for more detailed description.
 """
 
+import array
+import time
 import souffle.datatypes as dtt
+import souffle.math.derivative as derivative
+import souffle.math.lineq as lineq
+import souffle.math.nonlineq as nonlineq
+
+def initial_state(X0, n_dims=None):
+    """
+    Converts an initial system state to a dtt.FloatVector, so that the
+    integrators work on contiguous arrays of floats.
+
+    @type      X0: vector
+    @param     X0: initial system state (default=[0.0, 0.0, ...])
+    @type  n_dims: number
+    @param n_dims: number of dimensions (required if X0 is not given)
+
+    @rtype: dtt.FloatVector
+    @return: initial system state
+    """
+    if isinstance(X0, list) or isinstance(X0, tuple):
+        if len(X0) == 0:
+            if n_dims == None:
+                raise ValueError("ERROR: if no initial conditions given, "\
+                                 "must specify number of dimensions")
+            return dtt.FloatVector.zeros(n_dims)
+        return dtt.FloatVector(map(float, X0))
+    elif isinstance(X0, dtt.Vector):
+        return dtt.FloatVector(X0)
+    raise ValueError("Initial state is not list, tuple or dtt.Vector")
+
+def _work_vectors(n_vecs, n_elems):
+    """
+    Returns a list of preallocated work vectors for the steppers.
+
+    @type   n_vecs: number
+    @param  n_vecs: number of work vectors
+    @type  n_elems: number
+    @param n_elems: number of elements in each work vector
+
+    @rtype: list
+    @return: list of zero dtt.FloatVectors
+    """
+    return [dtt.FloatVector.zeros(n_elems) for i in range(n_vecs)]
+
+def _stage_kwargs(f, kwargs, n_stages, n_elems):
+    """
+    Returns the keyword arguments for evaluations of f whose results are used
+    up within the step. If f can write into an output buffer (f.accepts_out,
+    as for the ODE functions made by the make_* factories in souffle.physics
+    and souffle.math.chaos), each stage gets its own preallocated buffer, so
+    that these evaluations allocate nothing.
+
+    @type         f: function
+    @param        f: vector function f(t, X) solving a system of ODEs
+    @type    kwargs: dictionary
+    @param   kwargs: constants to pass to the ODE function
+    @type  n_stages: number
+    @param n_stages: number of stages needing distinct buffers
+    @type   n_elems: number
+    @param  n_elems: number of dimensions
+
+    @rtype: list
+    @return: keyword arguments for each stage
+    """
+    if not getattr(f, "accepts_out", False):
+        return [kwargs] * n_stages
+    return [dict(kwargs, out=out) for out in _work_vectors(n_stages, n_elems)]
+
+def _modified_midpoint(f, kwargs, t, X, F0, dt, n, X1, X2, out):
+    """
+    Takes n modified midpoint steps of total length dt from the state X,
+    writing the smoothed estimate of X(t + dt) into out. Everything is done
+    in place in the work vectors X1 and X2.
+
+    @type       f: function
+    @param      f: vector function f(t, X) solving a system of ODEs
+    @type  kwargs: dictionary
+    @param kwargs: constants to pass to the ODE function
+    @type       t: number
+    @param      t: current time
+    @type       X: vector
+    @param      X: current state
+    @type      F0: vector
+    @param     F0: f(t, X), which is the same for every n
+    @type      dt: number
+    @param     dt: total length of the midpoint steps
+    @type       n: number
+    @param      n: number of midpoint steps
+    @type     out: vector
+    @param    out: vector into which to write the estimate of X(t + dt)
+    """
+    ddt = dt / n
+    # X1 and X2 leapfrog each other, at t + (k + 1/2)*ddt and t + k*ddt
+    X1.assign(X).axpy(ddt / 2, F0)
+    X2.assign(X).axpy(ddt, f(t + ddt / 2, X1, **kwargs))
+    for i in range(n - 1):
+        X1.axpy(ddt, f(t + (i + 1) * ddt, X2, **kwargs))
+        X2.axpy(ddt, f(t + (i + 1.5) * ddt, X1, **kwargs))
+    out.assign(X1).iadd(X2).axpy(ddt / 2, f(t + dt, X2, **kwargs))
+    out.imul_scalar(0.5)
+
+class _ExtrapolationTable(object):
+    """
+    Preallocated work vectors for the Bulirsch-Stoer steppers: the current
+    and previous rows of the Richardson extrapolation table, which grow as
+    needed, and the work vectors for the modified midpoint steps.
+
+    @type  n_elems: number
+    @param n_elems: number of elements in the system state
+    """
+    def __init__(self, n_elems):
+        self.n_elems = n_elems
+        self.row = []
+        self.prev = []
+        self.X1, self.X2, self.epsilon = _work_vectors(3, n_elems)
+
+    def grow(self, n):
+        """
+        Makes sure both rows have room for at least n estimates.
+
+        @type  n: number
+        @param n: required length of the rows
+        """
+        while len(self.row) < n:
+            self.row.append(dtt.FloatVector.zeros(self.n_elems))
+            self.prev.append(dtt.FloatVector.zeros(self.n_elems))
+
+    def swap(self):
+        """
+        Makes the current row the previous one; the old previous row is
+        reused for the next row.
+        """
+        self.row, self.prev = self.prev, self.row
+
+    def extrapolate(self, n):
+        """
+        Computes the remaining n - 1 estimates of the current row of the
+        extrapolation table, given its first estimate and the previous row.
+
+        @type  n: number
+        @param n: row number
+        
+        @rtype: number
+        @return: error estimate of the most accurate estimate
+        """
+        row = self.row
+        prev = self.prev
+        epsilon = self.epsilon
+        # Polynomial (Aitken-Neville) extrapolation in the squared substep
+        # size, with n substeps for row n
+        for m in range(1, n):
+            epsilon.assign(row[m - 1]).isub(prev[m - 1]).idiv_scalar(
+                (float(n) / (n - m))**2 - 1)
+            row[m].assign(row[m - 1]).iadd(epsilon)
+        return abs(epsilon[0])
+
+def _extrapolated_step(f, kwargs, table, t, X, F0, dt, n):
+    """
+    Takes a Bulirsch-Stoer step with a fixed number of rows of the
+    extrapolation table.
+
+    @type       f: function
+    @param      f: vector function f(t, X) solving a system of ODEs
+    @type  kwargs: dictionary
+    @param kwargs: constants to pass to the ODE function
+    @type   table: _ExtrapolationTable
+    @param  table: work vectors
+    @type       t: number
+    @param      t: current time
+    @type       X: vector
+    @param      X: current state
+    @type      F0: vector
+    @param     F0: f(t, X)
+    @type      dt: number
+    @param     dt: length of the step
+    @type       n: number
+    @param      n: number of rows
+
+    @rtype: dtt.FloatVector
+    @return: estimate of X(t + dt)
+    """
+    table.grow(n)
+    _modified_midpoint(f, kwargs, t, X, F0, dt, 1, table.X1, table.X2,
+                       table.row[0])
+    for i in range(2, n + 1):
+        table.swap()
+        _modified_midpoint(f, kwargs, t, X, F0, dt, i, table.X1, table.X2,
+                           table.row[0])
+        table.extrapolate(i)
+    return table.row[n - 1].copy()
+
+class Trajectory(object):
+    """
+    Columnar storage for the history of an integration. The time and each
+    component of the state are kept in their own contiguous array of doubles,
+    which grow by doubling their capacity, so that storing a sample costs no
+    more than a few float copies.
+
+    If max_samples is given, the memory used is capped by decimation: when
+    the store is full, every other stored sample is dropped and from then on
+    only every other sample offered is kept (i.e. the sampling stride
+    doubles). The most recent sample offered is always kept as well, in a
+    tail slot that the next sample overwrites, so the last sample is the end
+    of the integration.
+
+    @type       n_dims: number
+    @param      n_dims: number of components of the state
+    @type     capacity: number
+    @param    capacity: initial number of samples to allocate room for
+    @type  max_samples: number
+    @param max_samples: maximum number of samples to keep (default=no limit)
+    """
+    def __init__(self, n_dims, capacity=1024, max_samples=None):
+        if max_samples is not None:
+            max_samples = int(max_samples)
+            if max_samples < 2:
+                raise ValueError("max_samples must be at least 2")
+            capacity = min(capacity, max_samples)
+        self.n_dims = int(n_dims)
+        self.capacity = max(int(capacity), 1)
+        self.max_samples = max_samples
+        # Only every stride-th sample offered to append() is stored
+        self.stride = 1
+        self.n_samples = 0
+        self._n_offered = 0
+        # Whether the last sample offered is held in the tail slot, after the
+        # samples kept by the stride
+        self._tail = False
+        self._t = self._new_column()
+        self._X = [self._new_column() for i in range(self.n_dims)]
+
+    def _new_column(self):
+        return array.array("d", bytes(8 * self.capacity))
+
+    def __len__(self):
+        """
+        Returns the number of stored samples.
+
+        @rtype: number
+        @return: the number of stored samples
+        """
+        return self.n_samples + self._tail
+
+    def append(self, t, X):
+        """
+        Offers a sample to the store; it is kept unless it is skipped by
+        decimation, in which case it is only held in the tail slot until the
+        next sample is offered.
+
+        @type  t: number
+        @param t: time
+        @type  X: vector
+        @param X: system state
+        """
+        n_offered = self._n_offered
+        self._n_offered = n_offered + 1
+
+        n = self.n_samples
+        if n == self.capacity:
+            if self.max_samples is not None and n >= self.max_samples:
+                self._decimate()
+                n = self.n_samples
+            else:
+                self._grow()
+
+        # The sample goes into the slot after the kept samples, replacing
+        # the previous tail; it becomes a kept sample if the stride admits it
+        self._t[n] = t
+        for column, elem in zip(self._X, X.data):
+            column[n] = elem
+        self._tail = bool(n_offered % self.stride)
+        if not self._tail:
+            self.n_samples = n + 1
+
+    def _grow(self):
+        """
+        Doubles the capacity of the columns. New columns are allocated rather
+        than resizing the old ones in place, so views handed out earlier stay
+        valid (but stop tracking new samples).
+        """
+        n = self.n_samples
+        self.capacity *= 2
+        if self.max_samples is not None:
+            self.capacity = min(self.capacity, self.max_samples)
+        columns = []
+        for column in [self._t] + self._X:
+            new_column = self._new_column()
+            memoryview(new_column)[:n] = memoryview(column)[:n]
+            columns.append(new_column)
+        self._t = columns[0]
+        self._X = columns[1:]
+
+    def _decimate(self):
+        """
+        Drops every other stored sample, and doubles the sampling stride.
+        """
+        n = self.n_samples
+        n_kept = (n + 1) // 2
+        for column in [self._t] + self._X:
+            column[:n_kept] = column[0:n:2]
+        self.n_samples = n_kept
+        self.stride *= 2
+
+    #### Accessing samples
+
+    def times(self):
+        """
+        Returns a zero-copy view of the stored times.
+
+        @rtype: memoryview
+        @return: the time column
+        """
+        return memoryview(self._t)[:len(self)]
+
+    def column(self, idx):
+        """
+        Returns a zero-copy view of one component of the stored states.
+
+        @type  idx: number
+        @param idx: index of the component in the state vector
+
+        @rtype: memoryview
+        @return: the column of the given component
+        """
+        return memoryview(self._X[idx])[:len(self)]
+
+    def columns(self):
+        """
+        Returns zero-copy views of every component of the stored states.
+
+        @rtype: list
+        @return: the column of each component
+        """
+        return [self.column(i) for i in range(self.n_dims)]
+
+    def state(self, idx):
+        """
+        Returns a stored state. Supports backwards indexing.
+
+        @type  idx: number
+        @param idx: index of the sample
+
+        @rtype: dtt.FloatVector
+        @return: the stored state
+        """
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError("Sample index out of range")
+        return dtt.FloatVector([column[idx] for column in self._X])
+
+class _States(object):
+    """
+    Read-only sequence view of the states stored in a Trajectory, so that
+    integrator.X[i] still returns a state vector.
+    """
+    def __init__(self, trajectory):
+        self.trajectory = trajectory
+
+    def __len__(self):
+        return len(self.trajectory)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self.trajectory.state(i)
+                    for i in range(*idx.indices(len(self.trajectory)))]
+        return self.trajectory.state(idx)
+
+class HermiteInterpolant(object):
+    """
+    Cubic Hermite interpolant of the solution over a single step, built from
+    the states and derivatives at both ends of the step. Its error is of 4th
+    order in the step size, matching RK4.
+
+    @type  t0: number
+    @param t0: time at the start of the step
+    @type  X0: vector
+    @param X0: state at the start of the step
+    @type  F0: vector
+    @param F0: derivative at the start of the step
+    @type  t1: number
+    @param t1: time at the end of the step
+    @type  X1: vector
+    @param X1: state at the end of the step
+    @type  F1: vector
+    @param F1: derivative at the end of the step
+    """
+    def __init__(self, t0, X0, F0, t1, X1, F1):
+        self.t0 = t0
+        self.t1 = t1
+        self.vectors = (X0, F0, X1, F1)
+
+    def __call__(self, t):
+        """
+        Evaluates the interpolant.
+
+        @type  t: number
+        @param t: time within the step
+
+        @rtype: dtt.FloatVector
+        @return: interpolated state
+        """
+        dt = self.t1 - self.t0
+        s = (t - self.t0) / dt
+        s2 = s * s
+        s3 = s2 * s
+        coeffs = (2*s3 - 3*s2 + 1, dt * (s3 - 2*s2 + s), -2*s3 + 3*s2,
+                  dt * (s3 - s2))
+        return dtt.linear_combination(coeffs, self.vectors)
+
+class DormandPrinceInterpolant(object):
+    """
+    The 4th-order continuous extension of a Dormand-Prince step, which comes
+    for free from the stages of the step (see Hairer, Norsett & Wanner,
+    Solving Ordinary Differential Equations I, Sec. II.6).
+
+    @type  t0: number
+    @param t0: time at the start of the step
+    @type  dt: number
+    @param dt: length of the step
+    @type  X0: vector
+    @param X0: state at the start of the step
+    @type  X1: vector
+    @param X1: state at the end of the step
+    @type   F: list
+    @param  F: the seven stage derivatives of the step
+    """
+    D = (-12715105075.0 / 11282082432, 0.0, 87487479700.0 / 32700410799,
+         -10690763975.0 / 1880347072, 701980252875.0 / 199316789632,
+         -1453857185.0 / 822651844, 69997945.0 / 29380423)
+
+    def __init__(self, t0, dt, X0, X1, F):
+        self.t0 = t0
+        self.t1 = t0 + dt
+        self.dt = dt
+        diff = dtt.linear_combination((1.0, -1.0), (X1, X0))
+        bspl = dtt.linear_combination((dt, -1.0), (F[0], diff))
+        self.vectors = (
+            X0, diff, bspl,
+            dtt.linear_combination((1.0, -dt, -1.0), (diff, F[6], bspl)),
+            dtt.linear_combination([dt * d for d in self.D], F))
+
+    def __call__(self, t):
+        """
+        Evaluates the interpolant.
+
+        @type  t: number
+        @param t: time within the step
+
+        @rtype: dtt.FloatVector
+        @return: interpolated state
+        """
+        s = (t - self.t0) / self.dt
+        s1 = 1.0 - s
+        # X0 + s*(diff + s1*(bspl + s*(c4 + s1*c5)))
+        coeffs = (1.0, s, s * s1, s * s1 * s, s * s1 * s * s1)
+        return dtt.linear_combination(coeffs, self.vectors)
+
+class SubstepInterpolant(object):
+    """
+    Interpolant of a long step, by cubic Hermite interpolation between nodes
+    which are computed on demand by accurate substeps from the start of the
+    step. The Bulirsch-Stoer methods take steps over which a single cubic
+    would be far less accurate than the method itself; splitting the step
+    into n_pieces reduces the interpolation error by n_pieces^4, at the cost
+    of at most one substep per node.
+
+    @type     substep: function
+    @param    substep: function returning the state at a time within the
+                       step, integrated from the start of the step
+    @type  derivative: function
+    @param derivative: function returning the derivative f(t, X)
+    @type          t0: number
+    @param         t0: time at the start of the step
+    @type          X0: vector
+    @param         X0: state at the start of the step
+    @type          F0: vector
+    @param         F0: derivative at the start of the step
+    @type          t1: number
+    @param         t1: time at the end of the step
+    @type          X1: vector
+    @param         X1: state at the end of the step
+    @type          F1: vector
+    @param         F1: derivative at the end of the step
+    @type    n_pieces: number
+    @param   n_pieces: number of pieces of the interpolant
+    """
+    def __init__(self, substep, derivative, t0, X0, F0, t1, X1, F1,
+                 n_pieces=16):
+        self.t0 = t0
+        self.t1 = t1
+        self.substep = substep
+        self.derivative = derivative
+        self.n_pieces = n_pieces
+        self.nodes = {0: (t0, X0, F0), n_pieces: (t1, X1, F1)}
+        self.pieces = {}
+
+    def node(self, idx):
+        """
+        Returns a node of the interpolant, computing it if needed.
+
+        @type  idx: number
+        @param idx: index of the node (0 to n_pieces)
+
+        @rtype: tuple
+        @return: time, state and derivative at the node
+        """
+        if idx not in self.nodes:
+            t = self.t0 + (self.t1 - self.t0) * idx / self.n_pieces
+            X = self.substep(t)
+            self.nodes[idx] = (t, X, self.derivative(t, X))
+        return self.nodes[idx]
+
+    def __call__(self, t):
+        """
+        Evaluates the interpolant.
+
+        @type  t: number
+        @param t: time within the step
+
+        @rtype: dtt.FloatVector
+        @return: interpolated state
+        """
+        s = (t - self.t0) / (self.t1 - self.t0)
+        idx = min(max(int(s * self.n_pieces), 0), self.n_pieces - 1)
+        piece = self.pieces.get(idx)
+        if piece is None:
+            piece = HermiteInterpolant(*(self.node(idx) + self.node(idx + 1)))
+            self.pieces[idx] = piece
+        return piece(t)
+
+class _DenseOutput(object):
+    """
+    Keeps track of which of the requested output times have been reached by
+    an adaptive integration.
+
+    @type   t_eval: iterable
+    @param  t_eval: requested output times
+    @type  t_start: number
+    @param t_start: time at the start of the integration
+    @type    t_end: number
+    @param   t_end: time at the end of the integration
+    """
+    def __init__(self, t_eval, t_start, t_end):
+        self.t_eval = sorted([float(t) for t in t_eval])
+        if self.t_eval and (self.t_eval[0] < t_start
+                            or self.t_eval[-1] > t_end):
+            raise ValueError("Output times are outside of the integration "
+                             "interval")
+        self.idx = 0
+
+    def due(self, t):
+        """
+        Returns the output times up to and including t that have not been
+        returned yet.
+
+        @type  t: number
+        @param t: time reached by the integration
+
+        @rtype: list
+        @return: the output times that are due
+        """
+        t_eval = self.t_eval
+        start = self.idx
+        idx = start
+        while idx < len(t_eval) and t_eval[idx] <= t:
+            idx += 1
+        self.idx = idx
+        return t_eval[start:idx]
+
+class _Events(object):
+    """
+    Tracks the values of event functions g(t, X) over the steps of an
+    integration, and locates the times at which they cross zero.
+
+    An event function may have the attributes
+        terminal:  if True, the integration stops at its first crossing
+                   (default=False)
+        direction: if +1, only crossings from negative to positive are
+                   detected; if -1, only those from positive to negative
+                   (default=0, both)
+
+    A crossing is detected from the sign change of g between the ends of a
+    step, so an even number of crossings within one step goes unnoticed. It
+    is located by bisection on the interpolant of the step.
+
+    @type  events: iterable
+    @param events: event functions g(t, X)
+    @type       t: number
+    @param      t: time at the start of the integration
+    @type       X: vector
+    @param      X: system state at the start of the integration
+    @type   delta: number
+    @param  delta: accuracy of the event times, relative to the step size
+    """
+    def __init__(self, events, t, X, delta=1e-12):
+        self.events = list(events)
+        self.delta = delta
+        self.values = [g(t, X) for g in self.events]
+        self.t_events = [[] for g in self.events]
+        self.X_events = [[] for g in self.events]
+        self.terminated = False
+
+    def crossed(self, g, v0, v1):
+        """
+        Returns whether an event function has crossed zero over a step.
+
+        @type   g: function
+        @param  g: event function
+        @type  v0: number
+        @param v0: value at the start of the step
+        @type  v1: number
+        @param v1: value at the end of the step
+
+        @rtype: boolean
+        @return: whether a crossing in the direction of the event occurred
+        """
+        direction = getattr(g, "direction", 0)
+        if direction >= 0 and v0 < 0 <= v1:
+            return True
+        if direction <= 0 and v0 > 0 >= v1:
+            return True
+        return False
+
+    def locate(self, g, v0, v1, interpolant):
+        """
+        Locates the crossing of an event function within a step.
+
+        @type            g: function
+        @param           g: event function
+        @type           v0: number
+        @param          v0: value at the start of the step
+        @type           v1: number
+        @param          v1: value at the end of the step
+        @type  interpolant: function
+        @param interpolant: interpolant of the step, returning X(t)
+
+        @rtype: number
+        @return: time of the crossing
+        """
+        t0 = interpolant.t0
+        dt = interpolant.t1 - t0
+        if v1 == 0:
+            return interpolant.t1
+        # Solve on the fraction of the step, with g normalised by its values
+        # at the ends, so that the tolerance does not depend on the scales of
+        # t and g
+        scale = max(abs(v0), abs(v1))
+        def g_step(s):
+            t = t0 + s * dt
+            return g(t, interpolant(t)) / scale
+        s, n_iter = nonlineq.bisection(g_step, 0.0, 1.0, self.delta)
+        return t0 + s * dt
+
+    def check(self, t1, X1, interpolant):
+        """
+        Checks the event functions at the end of a step, and locates the
+        crossings within it. Crossings after the first terminal one are
+        discarded, and the tracker is marked as terminated.
+
+        @type           t1: number
+        @param          t1: time at the end of the step
+        @type           X1: vector
+        @param          X1: state at the end of the step
+        @type  interpolant: function
+        @param interpolant: function returning the interpolant of the step;
+                            it is only called if a crossing is found
+
+        @rtype: list
+        @return: (time, state) of each crossing, in order of time
+        """
+        values = [g(t1, X1) for g in self.events]
+        found = []
+        for idx, g in enumerate(self.events):
+            if self.crossed(g, self.values[idx], values[idx]):
+                t_event = self.locate(g, self.values[idx], values[idx],
+                                      interpolant())
+                found.append((t_event, idx))
+        self.values = values
+
+        crossings = []
+        for t_event, idx in sorted(found):
+            X_event = interpolant()(t_event)
+            self.t_events[idx].append(t_event)
+            self.X_events[idx].append(X_event)
+            crossings.append((t_event, X_event))
+            if getattr(self.events[idx], "terminal", False):
+                self.terminated = True
+                break
+        return crossings
+
+class IntegrationStats(object):
+    """
+    Counters and timings of an integration, collected once the integrator is
+    instrumented (see OdeInt.instrument()). They accumulate over successive
+    integrations.
+
+    The wall time is split into phases:
+        rhs:    evaluating the ODE function (only if timing is enabled)
+        output: accepting steps (events, dense output, storage, callbacks)
+        total:  from the start of each integration to its last accepted step,
+                including the time spent by the caller between the steps
+                yielded by iterate()
+
+    @type  on_accept: function
+    @param on_accept: called as on_accept(t, X, dt) after each accepted step
+    @type  on_reject: function
+    @param on_reject: called as on_reject(t, dt) after each rejected step
+    @type     timing: boolean
+    @param    timing: time the evaluations of the ODE function
+    """
+    def __init__(self, on_accept=None, on_reject=None, timing=True):
+        self.on_accept = on_accept
+        self.on_reject = on_reject
+        self.timing = timing
+        # Number of evaluations of the ODE function
+        self.n_evals = 0
+        # Number of accepted and rejected steps
+        self.n_accepted = 0
+        self.n_rejected = 0
+        # Lengths of the accepted and rejected steps
+        self.dt_accepted = array.array("d")
+        self.dt_rejected = array.array("d")
+        # Evaluations spent on each accepted step, including rejected
+        # attempts and the output of the step
+        self.evals_per_step = array.array("l")
+        self.time = {"rhs": 0.0, "output": 0.0, "total": 0.0}
+        self._evals_mark = 0
+        self._time_mark = None
+
+    def __str__(self):
+        lines = ["evaluations: %d" % self.n_evals,
+                 "accepted steps: %d" % self.n_accepted,
+                 "rejected steps: %d" % self.n_rejected]
+        if self.n_accepted:
+            lines.append("evaluations per step: %.2f"
+                         % (float(sum(self.evals_per_step))
+                            / self.n_accepted))
+            lines.append("step sizes: %g to %g" % (min(self.dt_accepted),
+                                                   max(self.dt_accepted)))
+        for phase in ("rhs", "output", "total"):
+            lines.append("%s time: %.6f s" % (phase, self.time[phase]))
+        return "\n".join(lines)
+
+    def start(self):
+        """
+        Marks the start of an integration.
+        """
+        self._time_mark = time.perf_counter()
+
+    def reject(self, t, dt):
+        """
+        Records a rejected step.
+
+        @type   t: number
+        @param  t: time at the start of the step
+        @type  dt: number
+        @param dt: length of the step
+        """
+        self.n_rejected += 1
+        self.dt_rejected.append(dt)
+        if self.on_reject is not None:
+            self.on_reject(t, dt)
+
+    def accept(self, integrator, t_old, X_old, t_new, X_new, *args):
+        """
+        Accepts a step through integrator._output(), and records it.
+
+        @type  integrator: OdeInt
+        @param integrator: the instrumented integrator
+        @type       t_old: number
+        @param      t_old: time at the start of the step
+        @type       X_old: vector
+        @param      X_old: state at the start of the step
+        @type       t_new: number
+        @param      t_new: time at the end of the step
+        @type       X_new: vector
+        @param      X_new: state at the end of the step
+        @type        args: tuple
+        @param       args: remaining arguments of integrator._output()
+
+        @rtype: list
+        @return: (time, state) outputs of the step
+        """
+        start = time.perf_counter()
+        outputs = integrator._output(t_old, X_old, t_new, X_new, *args)
+        dt = t_new - t_old
+        self.n_accepted += 1
+        self.dt_accepted.append(dt)
+        self.evals_per_step.append(self.n_evals - self._evals_mark)
+        self._evals_mark = self.n_evals
+        if self.on_accept is not None:
+            self.on_accept(integrator.t_cur, integrator.X_cur, dt)
+        end = time.perf_counter()
+        self.time["output"] += end - start
+        if self._time_mark is not None:
+            self.time["total"] += end - self._time_mark
+        self._time_mark = end
+        return outputs
+
+class _CountedFunction(object):
+    """
+    Wraps a function of an instrumented integrator, counting (and optionally
+    timing) its calls in the integrator's statistics.
+
+    @type      f: function
+    @param     f: the wrapped function
+    @type  stats: IntegrationStats
+    @param stats: where to record the calls
+    """
+    def __init__(self, f, stats):
+        self.f = f
+        self.stats = stats
+        self.accepts_out = getattr(f, "accepts_out", False)
+
+    def __call__(self, *args, **kwargs):
+        stats = self.stats
+        stats.n_evals += 1
+        if not stats.timing:
+            return self.f(*args, **kwargs)
+        start = time.perf_counter()
+        result = self.f(*args, **kwargs)
+        stats.time["rhs"] += time.perf_counter() - start
+        return result
 
 class OdeInt(object):
     """
@@ -21,73 +846,367 @@ class OdeInt(object):
     @param n_dims: number of dimensions (required if X0 is not given)
     @type  kwargs: vector
     @param kwargs: constants to pass to the ODE function
+    @type  max_samples: number
+    @param max_samples: maximum number of samples to store; older samples are
+                        decimated beyond this (default=no limit)
     """
-    def __init__(self, f, t0, X0, n_dims, kwargs):
+    # Statistics of the integration (None unless instrumented), and the
+    # names of the attributes holding the functions to count
+    _stats = None
+    _counted = ("f",)
+
+    def __init__(self, f, t0, X0, n_dims, kwargs, max_samples=None):
         self.f = f
-        self.t = []
-        # X will be a list of dtt.Vectors
-        self.X = []
         # These arguments are parameters apart from t and X that we want to
         # pass to the ODE function
         self.kwargs = kwargs
 
+        # The last derivative evaluated through _derivative(), as (t, X, F)
+        self._f_cache = None
+
+        # Times and states of the events found by the last integration, with
+        # one list per event function
+        self.t_events = []
+        self.X_events = []
+
         # Set the initial conditions
-        self.t.append(t0)
-        if isinstance(X0, list) or isinstance(X0, tuple):
-            if len(X0) == 0:
-                if n_dims == None:
-                    raise ValueError("ERROR: if no initial conditions given, "\
-                                     "must specify number of dimensions")
-                else:
-                    X0 = [0.0] * int(n_dims)
-                    X0 = dtt.Vector(X0)
-            else:
-                X0 = map(float, X0)
-                X0 = dtt.Vector(X0)
-        elif isinstance(X0, dtt.Vector):
-            pass
-        else:
-            raise ValueError("Initial state is not list, tuple or dtt.Vector")
-        self.X.append(X0)
+        X0 = initial_state(X0, n_dims)
+        self.trajectory = Trajectory(X0.n_elems, max_samples=max_samples)
+        self._record(float(t0), X0)
+
+        # Keyword arguments for the evaluations used up within a step, with
+        # output buffers if the ODE function takes them
+        self._stage_kwargs = _stage_kwargs(f, kwargs, 3, X0.n_elems)
 
-    def integrate(self, dt, n_steps, verbose=False):
+    #### Accessing the results
+
+    @property
+    def t(self):
         """
-        Integrates over multiple steps.
+        The stored times (a zero-copy view of the trajectory).
+        """
+        if self.trajectory is None:
+            return []
+        return self.trajectory.times()
+
+    @property
+    def X(self):
+        """
+        The stored states, as a sequence of vectors.
+        """
+        if self.trajectory is None:
+            return []
+        return _States(self.trajectory)
+
+    @property
+    def stats(self):
+        """
+        The statistics of the integration (None unless instrumented).
+        """
+        return self._stats
+
+    def instrument(self, on_accept=None, on_reject=None, timing=True):
+        """
+        Starts collecting statistics of the integration: evaluations of the
+        ODE function, accepted and rejected steps with their lengths, and wall
+        time per phase (see IntegrationStats). Uninstrumented integrators only
+        pay for a check per step.
+
+        @type  on_accept: function
+        @param on_accept: called as on_accept(t, X, dt) after each accepted
+                          step
+        @type  on_reject: function
+        @param on_reject: called as on_reject(t, dt) after each rejected step
+        @type     timing: boolean
+        @param    timing: time the evaluations of the ODE function, at the
+                          cost of two clock reads per evaluation
+                          [default=True]
+
+        @rtype: IntegrationStats
+        @return: the statistics, updated as the integration proceeds
+        """
+        stats = IntegrationStats(on_accept, on_reject, timing)
+        for name in self._counted:
+            f = getattr(self, name)
+            if isinstance(f, _CountedFunction):
+                f = f.f
+            setattr(self, name, _CountedFunction(f, stats))
+        self._stats = stats
+        return stats
+
+    def _record(self, t, X, store=True):
+        """
+        Makes (t, X) the current state, and stores it in the trajectory.
+
+        @type      t: number
+        @param     t: time
+        @type      X: vector
+        @param     X: system state
+        @type  store: boolean
+        @param store: whether to store the state in the trajectory
+        """
+        self.t_cur = t
+        self.X_cur = X
+        if store:
+            self.trajectory.append(t, X)
+
+    def _derivative(self, t, X):
+        """
+        Returns f(t, X), reusing the result of the previous call if it was
+        made for the same time and state vector.
+
+        @type  t: number
+        @param t: time
+        @type  X: vector
+        @param X: system state
+
+        @rtype: vector
+        @return: derivative
+        """
+        cache = self._f_cache
+        if cache is None or cache[1] is not X or cache[0] != t:
+            cache = (t, X, self.f(t, X, **self.kwargs))
+            self._f_cache = cache
+        return cache[2]
+
+    def _start_dense_output(self, t_eval, t_end, store):
+        """
+        Sets up dense output for an adaptive integration starting from the
+        current state, and returns any output times that fall on it.
+
+        @type  t_eval: iterable
+        @param t_eval: requested output times
+        @type   t_end: number
+        @param  t_end: time at the end of the integration
+        @type   store: boolean
+        @param  store: whether to store the outputs in the trajectory
+
+        @rtype: _DenseOutput, list
+        @return: dense output tracker, (time, state) outputs at the start
+        """
+        dense = _DenseOutput(t_eval, self.t_cur, t_end)
+        outputs = [(t, self.X_cur) for t in dense.due(self.t_cur)]
+        times = self.trajectory.times()
+        if store and outputs and not (len(times) and times[-1] == self.t_cur):
+            self.trajectory.append(self.t_cur, self.X_cur)
+        return dense, outputs
+
+    def _start_events(self, events, t, X):
+        """
+        Sets up event detection for an integration starting from (t, X). As
+        every integration starts here, this also starts the clock of the
+        statistics.
+
+        @type  events: iterable
+        @param events: event functions g(t, X), or None
+        @type       t: number
+        @param      t: time at the start of the integration
+        @type       X: vector
+        @param      X: system state at the start of the integration
+
+        @rtype: _Events
+        @return: event tracker, or None if there are no events
+        """
+        if self._stats is not None:
+            self._stats.start()
+        if events is None:
+            return None
+        tracker = _Events(events, t, X)
+        self.t_events = tracker.t_events
+        self.X_events = tracker.X_events
+        return tracker
+
+    def _substep_interpolant(self, t_old, X_old, t_new, X_new, n):
+        """
+        Builds the interpolant of a Bulirsch-Stoer step, whose nodes are
+        computed by substeps with the same number of extrapolation rows.
+
+        @type        t_old: number
+        @param       t_old: time at the start of the step
+        @type        X_old: vector
+        @param       X_old: state at the start of the step
+        @type        t_new: number
+        @param       t_new: time at the end of the step
+        @type        X_new: vector
+        @param       X_new: state at the end of the step
+        @type            n: number
+        @param           n: number of rows of the extrapolation table
+
+        @rtype: SubstepInterpolant
+        @return: interpolant of the step
+        """
+        F_old = self._derivative(t_old, X_old)
+        F_new = self._derivative(t_new, X_new)
+        table = _ExtrapolationTable(X_old.n_elems)
+        kwargs = self._stage_kwargs[0]
+        substep = lambda t: _extrapolated_step(
+            self.f, kwargs, table, t_old, X_old, F_old, t - t_old, n)
+        derivative = lambda t, X: self.f(t, X, **self.kwargs)
+        return SubstepInterpolant(substep, derivative, t_old, X_old, F_old,
+                                  t_new, X_new, F_new)
+
+    def _accept(self, t_old, X_old, t_new, X_new, store, dense=None,
+                events=None, interpolant=None):
+        """
+        Accepts a step (see _output()), recording it in the statistics if the
+        integrator is instrumented.
+
+        @rtype: list
+        @return: (time, state) outputs of the step
+        """
+        if self._stats is not None:
+            return self._stats.accept(self, t_old, X_old, t_new, X_new, store,
+                                      dense, events, interpolant)
+        return self._output(t_old, X_old, t_new, X_new, store, dense, events,
+                            interpolant)
+
+    def _reject(self, t, dt):
+        """
+        Records a rejected step in the statistics, if the integrator is
+        instrumented.
+
+        @type   t: number
+        @param  t: time at the start of the step
+        @type  dt: number
+        @param dt: length of the step
+        """
+        if self._stats is not None:
+            self._stats.reject(t, dt)
+
+    def _output(self, t_old, X_old, t_new, X_new, store, dense=None,
+                events=None, interpolant=None):
+        """
+        Accepts a step, making its end the current state; if a terminal event
+        occurs within the step, the step is cut short at the event instead.
+
+        The interpolant of the step is only built if it is needed, for dense
+        output or to locate an event. Unless a method-specific one is given,
+        the cubic Hermite interpolant is used.
+
+        @type            t_old: number
+        @param           t_old: time at the start of the step
+        @type            X_old: vector
+        @param           X_old: state at the start of the step
+        @type            t_new: number
+        @param           t_new: time at the end of the step
+        @type            X_new: vector
+        @param           X_new: state at the end of the step
+        @type            store: boolean
+        @param           store: whether to store the outputs in the trajectory
+        @type            dense: _DenseOutput
+        @param           dense: dense output tracker, or None to output the
+                                end of the step
+        @type           events: _Events
+        @param          events: event tracker, or None
+        @type      interpolant: function
+        @param     interpolant: function building the interpolant of the step
+
+        @rtype: list
+        @return: (time, state) outputs of the step
+        """
+        if dense is None and events is None:
+            self._record(t_new, X_new, store)
+            return [(t_new, X_new)]
+
+        built = []
+        def step_interpolant():
+            if not built:
+                if interpolant is not None:
+                    built.append(interpolant())
+                else:
+                    built.append(HermiteInterpolant(
+                        t_old, X_old, self._derivative(t_old, X_old),
+                        t_new, X_new, self._derivative(t_new, X_new)))
+            return built[0]
+
+        if events is not None:
+            crossings = events.check(t_new, X_new, step_interpolant)
+            if events.terminated:
+                t_new, X_new = crossings[-1]
+
+        if dense is None:
+            self._record(t_new, X_new, store)
+            return [(t_new, X_new)]
+
+        self._record(t_new, X_new, False)
+        times = dense.due(t_new)
+        if not times:
+            return []
+        outputs = [(t, step_interpolant()(t)) for t in times]
+        if store:
+            for t, X in outputs:
+                self.trajectory.append(t, X)
+        return outputs
+
+    def iterate(self, dt, n_steps, store=True, events=None):
+        """
+        Integrates over multiple steps, lazily yielding the state after each
+        step.
 
         @type       dt: number
         @param      dt: length of time step
         @type  n_steps: number
         @param n_steps: number of integration steps
-        @type  verbose: boolean
-        @param verbose: print state at each step [default=False]
+        @type    store: boolean
+        @param   store: store each state in the trajectory; if False, only the
+                        current state is kept [default=True]
+        @type   events: iterable
+        @param  events: event functions g(t, X) whose zero crossings are
+                        located and stored in t_events and X_events; a
+                        terminal event stops the integration at the crossing
+
+        @rtype: generator
+        @return: (time, state) after each step
         """
         dt = float(dt)
         n_steps = int(n_steps)
+        events = self._start_events(events, self.t_cur, self.X_cur)
 
         for i in range(n_steps):
+            t_old, X_old = self.t_cur, self.X_cur
             t_new, X_new = self.step(dt)
-            self.t.append(t_new)
-            self.X.append(X_new)
+            for state in self._accept(t_old, X_old, t_new, X_new, store,
+                                      events=events):
+                yield state
+            if events is not None and events.terminated:
+                break
+
+    def integrate(self, dt, n_steps, verbose=False, store=True, events=None):
+        """
+        Integrates over multiple steps.
+
+        @type       dt: number
+        @param      dt: length of time step
+        @type  n_steps: number
+        @param n_steps: number of integration steps
+        @type  verbose: boolean
+        @param verbose: print state at each step [default=False]
+        @type    store: boolean
+        @param   store: store each state in the trajectory [default=True]
+        @type   events: iterable
+        @param  events: event functions g(t, X) to locate (see iterate())
+        """
+        for t_new, X_new in self.iterate(dt, n_steps, store, events):
             if verbose:
                 self.current_state()
 
     def unpack(self):
         """
-        Unpacks the data arrays.
+        Unpacks the data arrays, as zero-copy views of the columns of the
+        trajectory.
 
-        @rtype: vector
-        @return: data arrays
+        @rtype: list
+        @return: data arrays (one per component of the state)
         """
-        all_data = [vector.data for vector in self.X]
-        arrays = zip(*all_data)
-
-        return arrays
+        if self.trajectory is None:
+            return []
+        return self.trajectory.columns()
 
     def current_state(self):
         """
         Outputs the current state.
         """
-        print("%s\t%s" % (self.t[-1], " ".join(map(str, self.X[-1].data))))
+        print("%s\t%s" % (self.t_cur, " ".join(map(str, self.X_cur.data))))
 
 class Euler(OdeInt):
     """
@@ -101,9 +1220,12 @@ class Euler(OdeInt):
     @param     X0: initial system state (default=[0.0, 0.0, ...])
     @type  n_dims: number
     @param n_dims: number of dimensions (required if X0 is not given)
+    @type  max_samples: number
+    @param max_samples: maximum number of samples to store (default=no limit)
     """
-    def __init__(self, f, t0=0.0, X0=[], n_dims=None, **kwargs):
-        OdeInt.__init__(self, f, t0, X0, n_dims, kwargs)
+    def __init__(self, f, t0=0.0, X0=[], n_dims=None, max_samples=None,
+                 **kwargs):
+        OdeInt.__init__(self, f, t0, X0, n_dims, kwargs, max_samples)
 
     def step(self, dt):
         """
@@ -116,13 +1238,11 @@ class Euler(OdeInt):
         @return: updated time and state
         """
         # Load the previous system state
-        t = self.t[-1]
-        X = self.X[-1]
+        t = self.t_cur
+        X = self.X_cur
 
         t_new = t + dt
-        X_new = X + self.f(t, X, **self.kwargs).mul_scalar(dt)
-        self.t.append(t_new)
-        self.X.append(X_new)
+        X_new = X.copy().axpy(dt, self._derivative(t, X))
 
         return t_new, X_new
 
@@ -138,6 +1258,8 @@ class RK4(OdeInt):
     @param     X0: initial system state (default=[0.0, 0.0, ...])
     @type  n_dims: number
     @param n_dims: number of dimensions (required if X0 is not given)
+    @type  max_samples: number
+    @param max_samples: maximum number of samples to store (default=no limit)
     """
     ##########################################################
     #    The initial value problem is specified by         
@@ -154,8 +1276,11 @@ class RK4(OdeInt):
     #
     #    The vector X fully specifies the state of the system.
     ##########################################################
-    def __init__(self, f, t0=0.0, X0=[], n_dims=None, **kwargs):
-        OdeInt.__init__(self, f, t0, X0, n_dims, kwargs)
+    def __init__(self, f, t0=0.0, X0=[], n_dims=None, max_samples=None,
+                 **kwargs):
+        OdeInt.__init__(self, f, t0, X0, n_dims, kwargs, max_samples)
+        # Preallocated states at which the 2nd-4th increments are evaluated
+        self._stages = _work_vectors(3, self.X_cur.n_elems)
 
     def step(self, dt):
         """
@@ -168,26 +1293,27 @@ class RK4(OdeInt):
         @return: updated time and state
         """
         # Load the previous system state
-        t = self.t[-1]
-        X = self.X[-1]
+        t = self.t_cur
+        X = self.X_cur
+
+        X2, X3, X4 = self._stages
 
+        # The increments are k_i = dt * F_i; the intermediate states are
+        # built in place in the preallocated stage vectors
         # First increment
-        K1 = self.f(t, X, **self.kwargs).mul_scalar(dt)
+        F1 = self._derivative(t, X)
         # Second increment
-        K2 = self.f(t + dt / 2, X + K1.div_scalar(2),
-                    **self.kwargs).mul_scalar(dt)
+        kwargs2, kwargs3, kwargs4 = self._stage_kwargs
+        F2 = self.f(t + dt / 2, X2.assign(X).axpy(dt / 2, F1), **kwargs2)
         # Third increment
-        K3 = self.f(t + dt / 2, X + K2.div_scalar(2),
-                    **self.kwargs).mul_scalar(dt)
+        F3 = self.f(t + dt / 2, X3.assign(X).axpy(dt / 2, F2), **kwargs3)
         # Fourth increment
-        K4 = self.f(t + dt, X + K3, **self.kwargs).mul_scalar(dt)
-        # Weighted average of increments
-        K = (K1 + K2.mul_scalar(2) + K3.mul_scalar(2) + K4).div_scalar(6)
+        F4 = self.f(t + dt, X4.assign(X).axpy(dt, F3), **kwargs4)
 
         t_new = t + dt
-        X_new = X + K
-        self.t.append(t_new)
-        self.X.append(X_new)
+        # Weighted average of increments
+        X_new = dtt.linear_combination(
+            (1.0, dt / 6, dt / 3, dt / 3, dt / 6), (X, F1, F2, F3, F4))
 
         return t_new, X_new
 
@@ -204,10 +1330,18 @@ class RK4Adaptive(OdeInt):
     @param     X0: initial system state (default=[0.0, 0.0, ...])
     @type  n_dims: number
     @param n_dims: number of dimensions (required if X0 is not given)
+    @type  max_samples: number
+    @param max_samples: maximum number of samples to store (default=no limit)
     """
-    def __init__(self, f, t0=0.0, X0=[], n_dims=None, **kwargs):
-        OdeInt.__init__(self, f, t0, X0, n_dims, kwargs)
+    # Largest factor by which the step size grows after an accepted step
+    MAX_FACTOR = 10.0
+
+    def __init__(self, f, t0=0.0, X0=[], n_dims=None, max_samples=None,
+                 **kwargs):
+        OdeInt.__init__(self, f, t0, X0, n_dims, kwargs, max_samples)
         self.dt_all = []
+        # Preallocated states at which the 2nd-4th increments are evaluated
+        self._stages = _work_vectors(3, self.X_cur.n_elems)
 
     def step(self, dt, t_override=None, X_override=None):
         """
@@ -227,33 +1361,38 @@ class RK4Adaptive(OdeInt):
         """
         # Load the previous system state
         if t_override == None and X_override == None:
-            t = self.t[-1]
-            X = self.X[-1]
+            t = self.t_cur
+            X = self.X_cur
         else:
             t = t_override
             X = X_override
 
-        # First increment
-        K1 = self.f(t, X, **self.kwargs).mul_scalar(dt)
+        X2, X3, X4 = self._stages
+
+        # The increments are k_i = dt * F_i; the intermediate states are
+        # built in place in the preallocated stage vectors
+        # First increment (shared by the steps taken from the same state)
+        F1 = self._derivative(t, X)
         # Second increment
-        K2 = self.f(t + dt / 2, X + K1.div_scalar(2),
-                    **self.kwargs).mul_scalar(dt)
+        kwargs2, kwargs3, kwargs4 = self._stage_kwargs
+        F2 = self.f(t + dt / 2, X2.assign(X).axpy(dt / 2, F1), **kwargs2)
         # Third increment
-        K3 = self.f(t + dt / 2, X + K2.div_scalar(2), 
-                    **self.kwargs).mul_scalar(dt)
+        F3 = self.f(t + dt / 2, X3.assign(X).axpy(dt / 2, F2), **kwargs3)
         # Fourth increment
-        K4 = self.f(t + dt, X + K3, **self.kwargs).mul_scalar(dt)
-        # Weighted average of increments
-        K = (K1 + K2.mul_scalar(2) + K3.mul_scalar(2) + K4).div_scalar(6)
+        F4 = self.f(t + dt, X4.assign(X).axpy(dt, F3), **kwargs4)
 
         t_new = t + dt
-        X_new = X + K
+        # Weighted average of increments
+        X_new = dtt.linear_combination(
+            (1.0, dt / 6, dt / 3, dt / 3, dt / 6), (X, F1, F2, F3, F4))
 
         return t_new, X_new
 
-    def integrate(self, duration, dt0, delta, indices, verbose=False):
+    def iterate(self, duration, dt0, delta, indices, store=True,
+                t_eval=None, events=None):
         """
-        Integrates over a specified duration of time.
+        Integrates over a specified duration of time, lazily yielding the
+        state after each accepted step.
 
         @type  duration: number
         @param duration: total simulation time
@@ -264,6 +1403,21 @@ class RK4Adaptive(OdeInt):
         @type   indices: vector
         @param  indices: indices of parameters in state vector for which to
                          estimate local truncation error
+        @type     store: boolean
+        @param    store: store each state in the trajectory; if False, only
+                         the current state is kept [default=True]
+        @type    t_eval: iterable
+        @param   t_eval: if specified, the solution is output (yielded and
+                         stored) at these times instead of after each step,
+                         by cubic Hermite interpolation within the steps
+        @type    events: iterable
+        @param   events: event functions g(t, X) whose zero crossings are
+                         located and stored in t_events and X_events; a
+                         terminal event stops the integration at the crossing
+
+        @rtype: generator
+        @return: (time, state) after each accepted step, or at each output
+                 time
         """
         dt = float(dt0)
         self.dt_all.append(dt)
@@ -271,36 +1425,82 @@ class RK4Adaptive(OdeInt):
         duration = float(duration)
         delta = float(delta)
 
-        start_time = self.t[-1]
-        while self.t[-1] < (start_time + duration):
+        start_time = self.t_cur
+        dense = None
+        if t_eval is not None:
+            dense, outputs = self._start_dense_output(
+                t_eval, start_time + duration, store)
+            for state in outputs:
+                yield state
+        events = self._start_events(events, self.t_cur, self.X_cur)
+
+        while self.t_cur < (start_time + duration):
+            t_old, X_old = self.t_cur, self.X_cur
             # Get the first estimate of X(t + 2*dt)
             t_new_1a, X_new_1a = self.step(dt)
-            t_new_1b, X_new_1b = self.step(dt, t_new_1a, X_new_1a)
-            # Get the second estimate of X(t + 2*dt)
+            # Get the second estimate of X(t + 2*dt); this is done before
+            # the second half of the first estimate, so that both steps from
+            # the current state share its derivative
             t_new_2, X_new_2 = self.step(2 * dt)
+            t_new_1b, X_new_1b = self.step(dt, t_new_1a, X_new_1a)
             # Compute the error
             error = self.step_error(X_new_1b, X_new_2, indices)
-            rho = delta * dt / error
+            # A zero error (e.g. for a solution that RK4 integrates exactly)
+            # allows the largest growth
+            if error > 0:
+                rho = delta * dt / error
+            else:
+                rho = float("inf")
+            factor = min(self.MAX_FACTOR, rho**0.25)
 
-            # If rho > 1: don't need to redo step; update step size and
-            #             immediately go to next iteration
-            if rho > 1:
+            # If rho >= 1: don't need to redo step; update step size and
+            #              immediately go to next iteration
+            if rho >= 1:
                 t_new, X_new = t_new_1a, X_new_1a
-                self.t.append(t_new)
-                self.X.append(X_new)
                 self.dt_all.append(dt)
                 # Adjust step size for next iteration
-                dt *= rho**0.25
+                dt *= factor
             # If rho < 1: update step size, redo step, and then move on to
             #             next iteration
-            elif rho < 1:
+            else:
+                self._reject(t_old, dt)
                 # Adjust step size for redo
-                dt *= rho**0.25
+                dt *= factor
                 t_new, X_new = self.step(dt)
-                self.t.append(t_new)
-                self.X.append(X_new)
                 self.dt_all.append(dt)
 
+            for state in self._accept(t_old, X_old, t_new, X_new, store,
+                                      dense, events):
+                yield state
+            if events is not None and events.terminated:
+                break
+
+    def integrate(self, duration, dt0, delta, indices, verbose=False,
+                  store=True, t_eval=None, events=None):
+        """
+        Integrates over a specified duration of time.
+
+        @type  duration: number
+        @param duration: total simulation time
+        @type       dt0: number
+        @param      dt0: initial length of time step
+        @type     delta: number
+        @param    delta: desired accuracy per unit time
+        @type   indices: vector
+        @param  indices: indices of parameters in state vector for which to
+                         estimate local truncation error
+        @type   verbose: boolean
+        @param  verbose: print state at each step [default=False]
+        @type     store: boolean
+        @param    store: store each state in the trajectory [default=True]
+        @type    t_eval: iterable
+        @param   t_eval: if specified, store the solution at these times
+                         instead of after each step
+        @type    events: iterable
+        @param   events: event functions g(t, X) to locate (see iterate())
+        """
+        for t_new, X_new in self.iterate(duration, dt0, delta, indices,
+                                         store, t_eval, events):
             if verbose:
                 self.current_state()
 
@@ -328,10 +1528,17 @@ class RK4Adaptive(OdeInt):
 
         return error
 
-class BulSto(OdeInt):
+class DormandPrince(OdeInt):
     """
-    Integrates a system of ODEs using the Bulirsch-Stoer method.
-    
+    Integrates a system of ODEs using the Dormand-Prince 5(4) embedded
+    Runge-Kutta pair, with adaptive step sizes.
+
+    Each step gives a 5th-order solution and an embedded 4th-order one from
+    the same seven derivative evaluations; their difference estimates the
+    local truncation error. The last evaluation is at the new state, so it is
+    reused as the first one of the next step ("first same as last"), leaving
+    six evaluations per step. The step size is set by a PI controller.
+
     @type       f: function
     @param      f: vector function f(t, X) solving a system of ODEs
     @type      t0: number
@@ -340,73 +1547,274 @@ class BulSto(OdeInt):
     @param     X0: initial system state (default=[0.0, 0.0, ...])
     @type  n_dims: number
     @param n_dims: number of dimensions (required if X0 is not given)
+    @type  max_samples: number
+    @param max_samples: maximum number of samples to store (default=no limit)
     """
-    def __init__(self, f, t0=0.0, X0=[], n_dims=None, **kwargs):
-        OdeInt.__init__(self, f, t0, X0, n_dims, kwargs)
+    ##########################################################
+    #    For a step size dt, the stages are
+    #        k_i = f(t + c_i*dt, x + dt * sum_j a_ij*k_j)
+    #    for i = 1, ..., 7, and
+    #        x[i+1] = x[i] + dt * sum_i b_i*k_i
+    #    with the coefficients below. Since b_i = a_7i, the 7th
+    #    stage is evaluated at x[i+1].
+    #
+    #    The error estimate is dt * sum_i e_i*k_i, where e_i is the
+    #    difference between the 5th- and 4th-order weights.
+    ##########################################################
+    C = (0.0, 1.0 / 5, 3.0 / 10, 4.0 / 5, 8.0 / 9, 1.0, 1.0)
+    A = ((),
+         (1.0 / 5,),
+         (3.0 / 40, 9.0 / 40),
+         (44.0 / 45, -56.0 / 15, 32.0 / 9),
+         (19372.0 / 6561, -25360.0 / 2187, 64448.0 / 6561, -212.0 / 729),
+         (9017.0 / 3168, -355.0 / 33, 46732.0 / 5247, 49.0 / 176,
+          -5103.0 / 18656),
+         (35.0 / 384, 0.0, 500.0 / 1113, 125.0 / 192, -2187.0 / 6784,
+          11.0 / 84))
+    B = A[6] + (0.0,)
+    E = (71.0 / 57600, 0.0, -71.0 / 16695, 71.0 / 1920, -17253.0 / 339200,
+         22.0 / 525, -1.0 / 40)
+
+    # Step size control: with an accuracy per unit time, the normalised
+    # error scales as dt^4
+    SAFETY = 0.9
+    ALPHA = 0.7 / 4
+    BETA = 0.4 / 4
+    MIN_FACTOR = 0.2
+    MAX_FACTOR = 10.0
+
+    def __init__(self, f, t0=0.0, X0=[], n_dims=None, max_samples=None,
+                 **kwargs):
+        OdeInt.__init__(self, f, t0, X0, n_dims, kwargs, max_samples)
+        self.dt_all = []
+        # Preallocated states at which the 2nd-6th stages are evaluated
+        self._stages = _work_vectors(5, self.X_cur.n_elems)
+        # Derivatives of the last step taken
+        self._F = [None] * 7
 
-    def step(self, dt, delta):
+    def step(self, dt, indices=None):
         """
-        Integrates a single step.
-
+        Integrates a single step from the current state.
 
         @type       dt: number
         @param      dt: length of time step
-        @type     delta: number
-        @param    delta: desired accuracy per unit time
-        
-        @rtype: number, vector
-        @return: updated time and state
-        """
-        # Load the previous system state
-        t = self.t[-1]
-        X = self.X[-1]
+        @type  indices: vector
+        @param indices: indices of parameters in state vector for which to
+                        estimate local truncation error (default=all)
 
-        # Take a first midpoint step of size dt
-        n = 1
-        X1 = X + self.f(t, X, **self.kwargs).mul_scalar(dt / 2)
-        X2 = X + self.f(t, X1, **self.kwargs).mul_scalar(dt)
+        @rtype: number, vector, number
+        @return: updated time and state, and local truncation error estimate
+        """
+        t = self.t_cur
+        X = self.X_cur
+        C = self.C
+        A = self.A
+        F = self._F
+
+        F[0] = self._derivative(t, X)
+        for i in range(1, 6):
+            X_stage = dtt.linear_combination(
+                (1.0,) + tuple(dt * a for a in A[i]), (X,) + tuple(F[:i]),
+                out=self._stages[i - 1])
+            F[i] = self.f(t + C[i] * dt, X_stage, **self.kwargs)
 
-        # Compute the first row of the extrapolation table
-        e1 = [(X1 + X2 + self.f(t, X2, **self.kwargs)
-               .mul_scalar(dt / 2)).div_scalar(2), ]
+        t_new = t + dt
+        X_new = dtt.linear_combination(
+            (1.0,) + tuple(dt * a for a in A[6]), (X,) + tuple(F[:6]))
+        F[6] = self.f(t_new, X_new, **self.kwargs)
+
+        if indices is None:
+            indices = range(X.n_elems)
+        error = 0.0
+        for k in indices:
+            epsilon = dt * sum([e * Fi.data[k] for e, Fi in zip(self.E, F)])
+            error += epsilon**2
+        error = error**0.5
+
+        return t_new, X_new, error
+
+    def iterate(self, duration, dt0, delta, indices=None, store=True,
+                t_eval=None, events=None):
+        """
+        Integrates over a specified duration of time, lazily yielding the
+        state after each accepted step. The last step is shortened to end
+        exactly at the end of the interval.
 
-        # Extrapolate for an increasing number of rows until the desired
+        @type  duration: number
+        @param duration: total simulation time
+        @type       dt0: number
+        @param      dt0: initial length of time step
+        @type     delta: number
+        @param    delta: desired accuracy per unit time
+        @type   indices: vector
+        @param  indices: indices of parameters in state vector for which to
+                         estimate local truncation error (default=all)
+        @type     store: boolean
+        @param    store: store each state in the trajectory; if False, only
+                         the current state is kept [default=True]
+        @type    t_eval: iterable
+        @param   t_eval: if specified, the solution is output (yielded and
+                         stored) at these times instead of after each step,
+                         using the continuous extension of the method
+        @type    events: iterable
+        @param   events: event functions g(t, X) whose zero crossings are
+                         located and stored in t_events and X_events, using
+                         the continuous extension; a terminal event stops the
+                         integration at the crossing
+
+        @rtype: generator
+        @return: (time, state) after each accepted step, or at each output
+                 time
+        """
+        dt = float(dt0)
+        delta = float(delta)
+        t_end = self.t_cur + float(duration)
+        # Normalised error of the last accepted step, for the PI controller
+        error_prev = 1.0
+
+        dense = None
+        if t_eval is not None:
+            dense, outputs = self._start_dense_output(t_eval, t_end, store)
+            for state in outputs:
+                yield state
+        events = self._start_events(events, self.t_cur, self.X_cur)
+
+        while self.t_cur < t_end:
+            dt = min(dt, t_end - self.t_cur)
+            t_new, X_new, error = self.step(dt, indices)
+            # Normalised error; the step is accepted if it is at most 1
+            error = max(error / (delta * dt), 1e-10)
+
+            if error <= 1.0:
+                factor = (self.SAFETY * error**(-self.ALPHA)
+                          * error_prev**self.BETA)
+                error_prev = error
+                # The last stage is the derivative at the new state
+                self._f_cache = (t_new, X_new, self._F[6])
+                self.dt_all.append(dt)
+                t_old, X_old, dt_old = self.t_cur, self.X_cur, dt
+                interpolant = lambda: DormandPrinceInterpolant(
+                    t_old, dt_old, X_old, X_new, self._F)
+                for state in self._accept(t_old, X_old, t_new, X_new, store,
+                                          dense, events, interpolant):
+                    yield state
+                if events is not None and events.terminated:
+                    break
+                dt *= min(self.MAX_FACTOR, max(self.MIN_FACTOR, factor))
+            else:
+                # Reject the step and retry with a smaller one
+                self._reject(self.t_cur, dt)
+                factor = self.SAFETY * error**(-self.ALPHA)
+                dt *= min(1.0, max(self.MIN_FACTOR, factor))
+
+    def integrate(self, duration, dt0, delta, indices=None, verbose=False,
+                  store=True, t_eval=None, events=None):
+        """
+        Integrates over a specified duration of time.
+
+        @type  duration: number
+        @param duration: total simulation time
+        @type       dt0: number
+        @param      dt0: initial length of time step
+        @type     delta: number
+        @param    delta: desired accuracy per unit time
+        @type   indices: vector
+        @param  indices: indices of parameters in state vector for which to
+                         estimate local truncation error (default=all)
+        @type   verbose: boolean
+        @param  verbose: print state at each step [default=False]
+        @type     store: boolean
+        @param    store: store each state in the trajectory [default=True]
+        @type    t_eval: iterable
+        @param   t_eval: if specified, store the solution at these times
+                         instead of after each step
+        @type    events: iterable
+        @param   events: event functions g(t, X) to locate (see iterate())
+        """
+        for t_new, X_new in self.iterate(duration, dt0, delta, indices,
+                                         store, t_eval, events):
+            if verbose:
+                self.current_state()
+
+class BulSto(OdeInt):
+    """
+    Integrates a system of ODEs using the Bulirsch-Stoer method.
+    
+    @type       f: function
+    @param      f: vector function f(t, X) solving a system of ODEs
+    @type      t0: number
+    @param     t0: initial time
+    @type      X0: vector
+    @param     X0: initial system state (default=[0.0, 0.0, ...])
+    @type  n_dims: number
+    @param n_dims: number of dimensions (required if X0 is not given)
+    @type  max_samples: number
+    @param max_samples: maximum number of samples to store (default=no limit)
+    """
+    def __init__(self, f, t0=0.0, X0=[], n_dims=None, max_samples=None,
+                 **kwargs):
+        OdeInt.__init__(self, f, t0, X0, n_dims, kwargs, max_samples)
+        self._table = _ExtrapolationTable(self.X_cur.n_elems)
+        self.n_rows = None
+
+    def step(self, dt, delta):
+        """
+        Integrates a single step.
+
+
+        @type       dt: number
+        @param      dt: length of time step
+        @type     delta: number
+        @param    delta: desired accuracy per unit time
+        
+        @rtype: number, vector
+        @return: updated time and state
+        """
+        # Load the previous system state
+        t = self.t_cur
+        X = self.X_cur
+
+        table = self._table
+        # The derivative at the start of the step is shared by every
+        # midpoint sequence
+        F0 = self._derivative(t, X)
+        kwargs = self._stage_kwargs[0]
+
+        # Take a first midpoint step of size dt, giving the first row of the
+        # extrapolation table
+        n = 1
+        table.grow(n)
+        _modified_midpoint(self.f, kwargs, t, X, F0, dt, n, table.X1,
+                           table.X2, table.row[0])
+
+        # Extrapolate for an increasing number of rows until the desired
         # accuracy is achieved
         error = 2 * dt * delta
         while error > dt * delta:
             n += 1
-            ddt = dt / n
-
-            # Take midpoint step of size ddt
-            X1 = X + self.f(t, X, **self.kwargs).mul_scalar(ddt / 2)
-            X2 = X + self.f(t, X1, **self.kwargs).mul_scalar(ddt)
-            for i in range(n - 1):
-                X1 += self.f(t, X2, **self.kwargs).mul_scalar(ddt)
-                X2 += self.f(t, X1, **self.kwargs).mul_scalar(ddt)
-
-            # e2 records the previous e1; used for error estimation later
-            e2 = e1
-            e1 = [dtt.Vector([0.0 for i in enumerate(X)])
-                  for j in range(n)]
-            e1[0] = (X1 + X2 + self.f(t, X2, **self.kwargs)
-                     .mul_scalar(ddt / 2)).div_scalar(2)
+            table.grow(n)
+            # The previous row is kept for error estimation
+            table.swap()
+
+            # Take midpoint steps of size dt / n
+            _modified_midpoint(self.f, kwargs, t, X, F0, dt, n,
+                               table.X1, table.X2, table.row[0])
 
             # Extrapolate the remaining rows
-            for m in range(1, n):
-                epsilon = ((e1[m - 1] - e2[m - 1])
-                         .div_scalar((float(n) / (n - 1))**(2*m) - 1))
-                e1[m] = e1[m - 1] + epsilon
-            error = abs(epsilon[0])
+            error = table.extrapolate(n)
 
         # Take the most accurate estimate
         t_new = t + dt
-        X_new = e1[n - 1]
+        X_new = table.row[n - 1].copy()
+        # Number of rows used, for the interpolant of the step
+        self.n_rows = n
 
         return t_new, X_new
     
-    def integrate(self, dt, n_steps, delta, verbose=False):
+    def iterate(self, dt, n_steps, delta, store=True, events=None):
         """
-        Integrates over multiple steps.
+        Integrates over multiple steps, lazily yielding the state after each
+        step.
 
         @type       dt: number    
         @param      dt: length of time-step
@@ -414,17 +1822,52 @@ class BulSto(OdeInt):
         @param n_steps: number of integration steps
         @type    delta: number
         @param   delta: desired accuracy per unit time
-        @type  verbose: boolean
-        @param verbose: print state at each step [default=False]
+        @type    store: boolean
+        @param   store: store each state in the trajectory; if False, only the
+                        current state is kept [default=True]
+        @type   events: iterable
+        @param  events: event functions g(t, X) whose zero crossings are
+                        located and stored in t_events and X_events; a
+                        terminal event stops the integration at the crossing
+
+        @rtype: generator
+        @return: (time, state) after each step
         """
         dt = float(dt)
         n_steps = int(n_steps)
         delta = float(delta)
+        events = self._start_events(events, self.t_cur, self.X_cur)
 
         for i in range(n_steps):
+            t_old, X_old = self.t_cur, self.X_cur
             t_new, X_new = self.step(dt, delta)
-            self.t.append(t_new)
-            self.X.append(X_new)
+            interpolant = lambda: self._substep_interpolant(
+                t_old, X_old, t_new, X_new, self.n_rows)
+            for state in self._accept(t_old, X_old, t_new, X_new, store,
+                                      events=events, interpolant=interpolant):
+                yield state
+            if events is not None and events.terminated:
+                break
+
+    def integrate(self, dt, n_steps, delta, verbose=False, store=True,
+                  events=None):
+        """
+        Integrates over multiple steps.
+
+        @type       dt: number    
+        @param      dt: length of time-step
+        @type  n_steps: number
+        @param n_steps: number of integration steps
+        @type    delta: number
+        @param   delta: desired accuracy per unit time
+        @type  verbose: boolean
+        @param verbose: print state at each step [default=False]
+        @type    store: boolean
+        @param   store: store each state in the trajectory [default=True]
+        @type   events: iterable
+        @param  events: event functions g(t, X) to locate (see iterate())
+        """
+        for t_new, X_new in self.iterate(dt, n_steps, delta, store, events):
             if verbose:
                 self.current_state()
 
@@ -439,19 +1882,27 @@ class BulStoAdaptive(OdeInt):
         2. The initial conditions are passed to the integrate() method instead
            of the constructor
     
-    @type  f: function
-    @param f: vector function f(t, X) solving a system of ODEs
+    @type            f: function
+    @param           f: vector function f(t, X) solving a system of ODEs
+    @type  max_samples: number
+    @param max_samples: maximum number of samples to store (default=no limit)
     """
-    def __init__(self, f, **kwargs):
+    def __init__(self, f, max_samples=None, **kwargs):
         self.f = f
-        self.t = []
-        self.X = []
         self.kwargs = kwargs
-
-    def integrate(self, duration, delta, t0=0.0, X0=[], n_dims=None, nmax=8,
-                  verbose=False):
+        self.max_samples = max_samples
+        # The trajectory is created once the dimensions of the state are known
+        self.trajectory = None
+        self._table = None
+        self._f_cache = None
+        self.t_events = []
+        self.X_events = []
+
+    def iterate(self, duration, delta, t0=0.0, X0=[], n_dims=None, nmax=8,
+                store=True, events=None):
         """
-        Resursively performs the steps of adaptive Bulirsch-Stoer.
+        Integrates over a specified duration of time, lazily yielding the
+        state at the end of each accepted sub-interval.
 
         @type  duration: number
         @param duration: total simulation time
@@ -465,78 +1916,1033 @@ class BulStoAdaptive(OdeInt):
         @param   n_dims: number of dimensions (required if X0 is not given)
         @type      nmax: number
         @param     nmax: maximum subdivisions of current time step
-        @type   verbose: boolean
-        @param  verbose: print state at each step [default=False]
+        @type     store: boolean
+        @param    store: store each state in the trajectory; if False, only
+                         the current state is kept [default=True]
+        @type    events: iterable
+        @param   events: event functions g(t, X) whose zero crossings are
+                         located and stored in t_events and X_events; a
+                         terminal event stops the integration at the crossing
+
+        @rtype: generator
+        @return: (time, state) after each accepted sub-interval
         """
-        if isinstance(X0, list) or isinstance(X0, tuple):
-            if len(X0) == 0:
-                if n_dims == None:
-                    raise ValueError("ERROR: if no initial conditions given, "\
-                                     "must specify number of dimensions")
-                else:
-                    X0 = [0.0] * int(n_dims)
-                    X0 = dtt.Vector(X0)
-            else:
-                X0 = map(float, X0)
-                X0 = dtt.Vector(X0)
-        elif isinstance(X0, dtt.Vector):
-            pass
-        else:
-            raise ValueError("Initial state is not list, tuple or dtt.Vector")
-        dt = duration
-        t = t0
-        X = X0
+        X0 = initial_state(X0, n_dims)
+        if self.trajectory is None:
+            self.trajectory = Trajectory(X0.n_elems,
+                                         max_samples=self.max_samples)
+        # The work vectors are shared by all levels of the recursion, since
+        # each level is done with them before recursing
+        if self._table is None or self._table.n_elems != X0.n_elems:
+            self._table = _ExtrapolationTable(X0.n_elems)
+            self._stage_kwargs = _stage_kwargs(self.f, self.kwargs, 1,
+                                               X0.n_elems)
+
+        events = self._start_events(events, float(t0), X0)
+
+        return self._iterate(float(duration), float(delta), float(t0), X0,
+                             int(nmax), store, events)
+
+    def _iterate(self, dt, delta, t, X, nmax, store, events=None):
+        """
+        Resursively performs the steps of adaptive Bulirsch-Stoer over the
+        interval [t, t + dt].
+
+        @type     dt: number
+        @param    dt: length of the interval
+        @type  delta: number
+        @param delta: desired accuracy per unit time
+        @type      t: number
+        @param     t: time at the start of the interval
+        @type      X: vector
+        @param     X: system state at the start of the interval
+        @type   nmax: number
+        @param  nmax: maximum subdivisions of current time step
+        @type  store: boolean
+        @param store: store each state in the trajectory
+        @type  events: _Events
+        @param events: event tracker, or None
+
+        @rtype: generator
+        @return: (time, state) after each accepted sub-interval
+        """
+        table = self._table
+        F0 = self._derivative(t, X)
+        kwargs = self._stage_kwargs[0]
 
-        # Take a first midpoint step of size dt
+        # Take a first midpoint step of size dt, giving the first row of the
+        # extrapolation table
         n = 1
-        X1 = X + self.f(t, X, **self.kwargs).mul_scalar(dt / 2)
-        X2 = X + self.f(t, X1, **self.kwargs).mul_scalar(dt)
-
-        # Compute the first row of the extrapolation table
-        e1 = [(X1 + X2 + self.f(t, X2, **self.kwargs)
-               .mul_scalar(dt / 2)).div_scalar(2), ]
+        table.grow(nmax)
+        _modified_midpoint(self.f, kwargs, t, X, F0, dt, n, table.X1,
+                           table.X2, table.row[0])
 
         # Extrapolate for an increasing number of rows until the desired
         # accuracy is achieved, or the maximum number of steps is reached
         for i in range(2, nmax + 1):
             n += 1
-            ddt = dt / n
-
-            # Take midpoint step of size ddt
-            X1 = X + self.f(t, X, **self.kwargs).mul_scalar(ddt / 2)
-            X2 = X + self.f(t, X1, **self.kwargs).mul_scalar(ddt)
-            for i in range(n - 1):
-                X1 += self.f(t, X2, **self.kwargs).mul_scalar(ddt)
-                X2 += self.f(t, X1, **self.kwargs).mul_scalar(ddt)
-
-            # Compute n rows of extrapolation table (list of dtt.Vectors)
-            e2 = e1
-            e1 = [dtt.Vector([0.0 for i in enumerate(X)])
-                  for j in range(n)]
-            e1[0] = (X1 + X2 + self.f(t, X2, **self.kwargs)
-                     .mul_scalar(ddt / 2)).div_scalar(2)
-            for m in range(1, n):
-                epsilon = ((e1[m - 1] - e2[m - 1])
-                         .div_scalar((float(n) / (n - 1))**(2*m) - 1))
-                e1[m] = e1[m - 1] + epsilon
-            error = abs(epsilon[0])
-
-            # If the desired accuracy has been achieved, return the values
+            table.swap()
+
+            # Take midpoint steps of size dt / n
+            _modified_midpoint(self.f, kwargs, t, X, F0, dt, n,
+                               table.X1, table.X2, table.row[0])
+
+            # Compute the remaining rows of the extrapolation table
+            error = table.extrapolate(n)
+
+            # If the desired accuracy has been achieved, accept the values
             if error < dt * delta:
                 # Take the most accurate estimate
                 t_new = t + dt
-                X_new = e1[n - 1]
-                self.t.append(t_new)
-                self.X.append(X_new)
-                if verbose:
-                    self.current_state()
-                    #print("%s\t%s" % (t_new," ".join(map(str, X_new[-1].data))))
-
-                return t_new, X_new
+                X_new = table.row[n - 1].copy()
+                interpolant = lambda: self._substep_interpolant(
+                    t, X, t_new, X_new, n)
+                for state in self._accept(t, X, t_new, X_new, store,
+                                          events=events,
+                                          interpolant=interpolant):
+                    yield state
+                return
 
         # If desired accuracy was not achieved at n=nmax, apply the method
         # recursively to sub-intervals of size dt / 2
-        t_new_1, X_new_1 = self.integrate(dt/2, delta, t, X)
-        t_new_2, X_new_2 = self.integrate(dt/2, delta, t_new_1, X_new_1)
-            
-        return t_new_2, X_new_2
+        self._reject(t, dt)
+        for state in self._iterate(dt / 2, delta, t, X, nmax, store, events):
+            yield state
+        # A terminal event in the first half ends the integration
+        if events is not None and events.terminated:
+            return
+        for state in self._iterate(dt / 2, delta, self.t_cur, self.X_cur,
+                                   nmax, store, events):
+            yield state
+
+    def integrate(self, duration, delta, t0=0.0, X0=[], n_dims=None, nmax=8,
+                  verbose=False, store=True, events=None):
+        """
+        Performs adaptive Bulirsch-Stoer over a specified duration of time.
+
+        @type  duration: number
+        @param duration: total simulation time
+        @type     delta: number
+        @param    delta: desired accuracy per unit time
+        @type        t0: number
+        @param       t0: initial time
+        @type        X0: vector
+        @param       X0: initial system state (default=[0.0, 0.0, ...])
+        @type    n_dims: number
+        @param   n_dims: number of dimensions (required if X0 is not given)
+        @type      nmax: number
+        @param     nmax: maximum subdivisions of current time step
+        @type   verbose: boolean
+        @param  verbose: print state at each step [default=False]
+        @type     store: boolean
+        @param    store: store each state in the trajectory [default=True]
+        @type    events: iterable
+        @param   events: event functions g(t, X) to locate (see iterate())
+
+        @rtype: number, vector
+        @return: final time and state
+        """
+        for t_new, X_new in self.iterate(duration, delta, t0, X0, n_dims,
+                                         nmax, store, events):
+            if verbose:
+                self.current_state()
+
+        return self.t_cur, self.X_cur
+
+class BulStoIterative(OdeInt):
+    """
+    Integrates a system of ODEs using the Bulirsch-Stoer method, with adaptive
+    step sizes and extrapolation orders.
+
+    Unlike BulStoAdaptive, the steps are taken iteratively: after each step,
+    the size and the number of rows of the extrapolation table for the next
+    step are chosen from the convergence of the table, minimising the number
+    of derivative evaluations per unit time (see Hairer, Norsett & Wanner,
+    Solving Ordinary Differential Equations I, Sec. II.9). The step size and
+    order are kept between calls to integrate().
+
+    @type       f: function
+    @param      f: vector function f(t, X) solving a system of ODEs
+    @type      t0: number
+    @param     t0: initial time
+    @type      X0: vector
+    @param     X0: initial system state (default=[0.0, 0.0, ...])
+    @type  n_dims: number
+    @param n_dims: number of dimensions (required if X0 is not given)
+    @type  max_samples: number
+    @param max_samples: maximum number of samples to store (default=no limit)
+    """
+    ##########################################################
+    #    Row k of the table extrapolates the modified midpoint
+    #    estimates with n = 1, ..., k substeps, and is of order
+    #    2k. Its cost is A_k = 1 + k(k + 1) derivative
+    #    evaluations, and its error estimate err_k gives the
+    #    step size H_k for which err_k would meet the
+    #    tolerance. The next order is the one with the least
+    #    work per unit time, W_k = A_k / H_k.
+    ##########################################################
+    SAFETY = 0.94
+    MIN_FACTOR = 0.02
+    MAX_FACTOR = 4.0
+
+    def __init__(self, f, t0=0.0, X0=[], n_dims=None, max_samples=None,
+                 **kwargs):
+        OdeInt.__init__(self, f, t0, X0, n_dims, kwargs, max_samples)
+        self.dt_all = []
+        self._table = _ExtrapolationTable(self.X_cur.n_elems)
+        # Step size and number of rows for the next step
+        self.dt_next = None
+        self.k_next = None
+
+    def step(self, dt, delta, k, nmax):
+        """
+        Attempts a single step from the current state, computing rows of the
+        extrapolation table until one converges within the tolerance, or
+        up to row k + 1.
+
+        @type     dt: number
+        @param    dt: length of time step
+        @type  delta: number
+        @param delta: desired accuracy per unit time
+        @type      k: number
+        @param     k: target number of rows
+        @type   nmax: number
+        @param  nmax: maximum number of rows
+
+        @rtype: number, vector, number, list
+        @return: updated time and state (None if the step is rejected), the
+                 row at which the table converged, and the optimal step sizes
+                 for each row (None for row 1)
+        """
+        t = self.t_cur
+        X = self.X_cur
+        table = self._table
+        table.grow(nmax)
+        F0 = self._derivative(t, X)
+        kwargs = self._stage_kwargs[0]
+        tolerance = delta * dt
+
+        H = [None] * (nmax + 1)
+        _modified_midpoint(self.f, kwargs, t, X, F0, dt, 1, table.X1,
+                           table.X2, table.row[0])
+        for n in range(2, min(k + 1, nmax) + 1):
+            table.swap()
+            _modified_midpoint(self.f, kwargs, t, X, F0, dt, n,
+                               table.X1, table.X2, table.row[0])
+            table.extrapolate(n)
+            error = sum([e * e for e in table.epsilon.data])**0.5
+            error = max(error / tolerance, 1e-10)
+
+            # The error of row n scales as dt^(2n - 1), and the tolerance as dt
+            factor = self.SAFETY * error**(-1.0 / (2 * n - 2))
+            H[n] = dt * min(self.MAX_FACTOR, max(self.MIN_FACTOR, factor))
+
+            # Only accept convergence close to the target order, so that the
+            # work estimates stay meaningful
+            if error <= 1.0 and n >= k - 1:
+                return t + dt, table.row[n - 1].copy(), n, H
+
+        return None, None, n, H
+
+    def iterate(self, duration, dt0, delta, nmax=8, store=True, t_eval=None,
+                events=None):
+        """
+        Integrates over a specified duration of time, lazily yielding the
+        state after each accepted step. The last step is shortened to end
+        exactly at the end of the interval.
+
+        @type  duration: number
+        @param duration: total simulation time
+        @type       dt0: number
+        @param      dt0: initial length of time step (ignored if a step size
+                         is known from a previous integration)
+        @type     delta: number
+        @param    delta: desired accuracy per unit time
+        @type      nmax: number
+        @param     nmax: maximum number of rows of the extrapolation table
+        @type     store: boolean
+        @param    store: store each state in the trajectory; if False, only
+                         the current state is kept [default=True]
+        @type    t_eval: iterable
+        @param   t_eval: if specified, the solution is output (yielded and
+                         stored) at these times instead of after each step;
+                         the steps are shortened to end on them
+        @type    events: iterable
+        @param   events: event functions g(t, X) whose zero crossings are
+                         located and stored in t_events and X_events; a
+                         terminal event stops the integration at the crossing
+
+        @rtype: generator
+        @return: (time, state) after each accepted step, or at each output
+                 time
+        """
+        nmax = int(nmax)
+        if nmax < 3:
+            raise ValueError("nmax must be at least 3")
+        delta = float(delta)
+        t_end = self.t_cur + float(duration)
+
+        dt = self.dt_next if self.dt_next is not None else float(dt0)
+        k = self.k_next if self.k_next is not None else min(4, nmax - 1)
+        k = min(k, nmax - 1)
+
+        dense = None
+        if t_eval is not None:
+            dense, outputs = self._start_dense_output(t_eval, t_end, store)
+            for state in outputs:
+                yield state
+        events = self._start_events(events, self.t_cur, self.X_cur)
+
+        while self.t_cur < t_end:
+            # Shorten the step to end on the next output time, or the end of
+            # the interval; the step size it replaces is kept for later
+            t_stop = t_end
+            if dense is not None and dense.idx < len(dense.t_eval):
+                t_stop = min(t_stop, dense.t_eval[dense.idx])
+            dt_free = dt
+            clipped = dt >= t_stop - self.t_cur
+            if clipped:
+                dt = t_stop - self.t_cur
+            t_old, X_old = self.t_cur, self.X_cur
+            t_new, X_new, n, H = self.step(dt, delta, k, nmax)
+
+            # Work per unit time of each row whose error is known
+            work = [None] * (nmax + 1)
+            for i in range(2, n + 1):
+                work[i] = (1 + i * (i + 1)) / H[i]
+
+            if X_new is None:
+                # Rejected: retry with the cheapest of the computed rows
+                self._reject(t_old, dt)
+                k = min(min(range(2, n + 1), key=lambda i: work[i]),
+                        nmax - 1)
+                dt = min(H[k], 0.5 * dt)
+                continue
+
+            self.dt_all.append(dt)
+            # Choose the order for the next step from the converged row and
+            # the one before it, and try a higher order if it looks cheaper
+            if n > 2 and work[n - 1] < 0.8 * work[n]:
+                k = n - 1
+                dt = H[k]
+            elif n < nmax - 1 and (n == 2 or work[n] < 0.9 * work[n - 1]):
+                k = n + 1
+                dt = H[n] * (1 + k * (k + 1)) / (1 + n * (n + 1))
+            else:
+                k = min(n, nmax - 1)
+                dt = H[n]
+            if clipped:
+                t_new = t_stop
+                dt = max(dt, dt_free)
+
+            interpolant = lambda: self._substep_interpolant(
+                t_old, X_old, t_new, X_new, n)
+            accepted = self._accept(t_old, X_old, t_new, X_new,
+                                    store and dense is None, None, events,
+                                    interpolant)
+            if dense is None:
+                for state in accepted:
+                    yield state
+            else:
+                # The steps end on the output times
+                for t in dense.due(self.t_cur):
+                    self._record(t, self.X_cur, store)
+                    yield t, self.X_cur
+            if events is not None and events.terminated:
+                break
+
+        self.dt_next = dt
+        self.k_next = k
+
+    def integrate(self, duration, dt0, delta, nmax=8, verbose=False,
+                  store=True, t_eval=None, events=None):
+        """
+        Integrates over a specified duration of time.
+
+        @type  duration: number
+        @param duration: total simulation time
+        @type       dt0: number
+        @param      dt0: initial length of time step
+        @type     delta: number
+        @param    delta: desired accuracy per unit time
+        @type      nmax: number
+        @param     nmax: maximum number of rows of the extrapolation table
+        @type   verbose: boolean
+        @param  verbose: print state at each step [default=False]
+        @type     store: boolean
+        @param    store: store each state in the trajectory [default=True]
+        @type    t_eval: iterable
+        @param   t_eval: if specified, store the solution at these times
+                         instead of after each step
+        @type    events: iterable
+        @param   events: event functions g(t, X) to locate (see iterate())
+        """
+        for t_new, X_new in self.iterate(duration, dt0, delta, nmax, store,
+                                         t_eval, events):
+            if verbose:
+                self.current_state()
+
+class _Implicit(OdeInt):
+    """
+    Base class for the implicit integrators for stiff systems. It keeps the
+    Jacobian of the system, and solves the implicit equations of the steps by
+    simplified Newton iterations.
+
+    The Jacobian is either given by the user, as a function jac(t, X) returning
+    a matrix, or estimated by finite differences. The Newton-based steppers
+    reuse it across steps for as long as the iterations converge quickly,
+    since evaluating it is usually the most expensive part of a step (the
+    Rosenbrock method needs it exact, and re-evaluates it). Likewise, the LU
+    factorisation of the iteration matrix is reused across Newton iterations,
+    stages and steps for as long as the step size and Jacobian are unchanged.
+
+    @type       f: function
+    @param      f: vector function f(t, X) solving a system of ODEs
+    @type      t0: number
+    @param     t0: initial time
+    @type      X0: vector
+    @param     X0: initial system state (default=[0.0, 0.0, ...])
+    @type  n_dims: number
+    @param n_dims: number of dimensions (required if X0 is not given)
+    @type  kwargs: vector
+    @param kwargs: constants to pass to the ODE function
+    @type  max_samples: number
+    @param max_samples: maximum number of samples to store (default=no limit)
+    @type     jac: function
+    @param    jac: function jac(t, X) returning the Jacobian matrix df_i/dX_j
+                   (default=finite differences)
+    """
+    # Relative step size of the finite-difference Jacobian
+    JAC_STEP = 1e-7
+    # Relative accuracy to which the implicit equations are solved
+    NEWTON_TOL = 1e-10
+    MAX_ITER = 10
+    # Newton iterations converging more slowly than this (the ratio of
+    # successive corrections) trigger a new Jacobian
+    MAX_RATE = 0.5
+
+    def __init__(self, f, t0, X0, n_dims, kwargs, max_samples, jac):
+        OdeInt.__init__(self, f, t0, X0, n_dims, kwargs, max_samples)
+        self.jac = jac
+        # The Jacobian and the state at which it was evaluated
+        self._J = None
+        self._J_state = None
+        self.n_jac = 0
+        # The factorised iteration matrix, with the c and Jacobian it was
+        # computed from
+        self._M = None
+        self.n_lu = 0
+
+    def _jacobian(self, t, X):
+        """
+        Evaluates the Jacobian at (t, X), and keeps it for the next steps.
+
+        @type  t: number
+        @param t: time
+        @type  X: vector
+        @param X: system state
+
+        @rtype: list
+        @return: Jacobian matrix, as a list of rows
+        """
+        if self.jac is not None:
+            J = self.jac(t, X, **self.kwargs)
+        else:
+            J = derivative.jacobian(lambda Y: self.f(t, Y, **self.kwargs), X,
+                                    self.JAC_STEP, self._derivative(t, X))
+        if isinstance(J, dtt.Matrix):
+            J = J.tolist()
+        self._J = [[float(elem) for elem in row] for row in J]
+        self._J_state = (t, X)
+        self.n_jac += 1
+        return self._J
+
+    def _iteration_matrix(self, c):
+        """
+        Returns the LU factorisation of the matrix I - c*J of the linear
+        systems of a step. The factorisation is kept, and reused for as long
+        as neither c nor the Jacobian changes, so that each linear system
+        costs O(n^2) rather than O(n^3).
+
+        @type  c: number
+        @param c: multiple of the Jacobian
+
+        @rtype: lineq.LUFactor
+        @return: factorised iteration matrix
+        """
+        cached = self._M
+        if cached is not None and cached[0] == c and cached[1] is self._J:
+            return cached[2]
+        M = lineq.lu_factor([[(1.0 if i == j else 0.0) - c * J_ij
+                              for j, J_ij in enumerate(row)]
+                             for i, row in enumerate(self._J)])
+        if M.singular:
+            raise ValueError("Iteration matrix is singular; "
+                             "try a different step size")
+        self._M = (c, self._J, M)
+        self.n_lu += 1
+        return M
+
+    def _solve(self, M, b):
+        """
+        Solves the linear system M x = b.
+
+        @type  M: lineq.LUFactor
+        @param M: factorised matrix
+        @type  b: vector
+        @param b: RHS vector
+
+        @rtype: dtt.FloatVector
+        @return: solution vector
+        """
+        return dtt.FloatVector(M.solve(b.data))
+
+    def _newton(self, t, C, c, X_guess):
+        """
+        Solves X = C + c*f(t, X) for X, by simplified Newton iterations from
+        an initial guess. If they diverge, or do not converge within MAX_ITER
+        iterations, the Jacobian is re-evaluated at the current state and the
+        iterations restarted.
+
+        @type        t: number
+        @param       t: time at which f is evaluated
+        @type        C: vector
+        @param       C: constant part of the equation
+        @type        c: number
+        @param       c: multiple of f in the equation
+        @type  X_guess: vector
+        @param X_guess: initial guess
+
+        @rtype: dtt.FloatVector
+        @return: solution
+        """
+        while True:
+            fresh = (self._J_state is not None
+                     and self._J_state[1] is self.X_cur)
+            if self._J is None:
+                self._jacobian(self.t_cur, self.X_cur)
+                fresh = True
+            M = self._iteration_matrix(c)
+
+            X = X_guess.copy()
+            norm_prev = None
+            rate = 0.0
+            for i in range(self.MAX_ITER):
+                residual = dtt.linear_combination(
+                    (1.0, c, -1.0), (C, self.f(t, X, **self.kwargs), X))
+                dX = self._solve(M, residual)
+                X.iadd(dX)
+                norm = sum([elem * elem for elem in dX.data])**0.5
+                if norm_prev is not None and norm_prev > 0:
+                    rate = norm / norm_prev
+                    if rate > 1.0:
+                        break
+                scale = sum([elem * elem for elem in X.data])**0.5
+                if norm <= self.NEWTON_TOL * (1.0 + scale):
+                    # Slow convergence means the Jacobian is out of date;
+                    # re-evaluate it at the next step
+                    if rate > self.MAX_RATE and not fresh:
+                        self._J = None
+                    return X
+                norm_prev = norm
+
+            if fresh:
+                raise ValueError("Newton iterations did not converge; "
+                                 "try a smaller step size")
+            self._J = None
+
+class BackwardEuler(_Implicit):
+    """
+    Integrates a system of ODEs using the backward (implicit) Euler method,
+    which is first-order and L-stable: it stays stable for stiff systems at
+    any step size.
+
+    @type       f: function
+    @param      f: vector function f(t, X) solving a system of ODEs
+    @type      t0: number
+    @param     t0: initial time
+    @type      X0: vector
+    @param     X0: initial system state (default=[0.0, 0.0, ...])
+    @type  n_dims: number
+    @param n_dims: number of dimensions (required if X0 is not given)
+    @type  max_samples: number
+    @param max_samples: maximum number of samples to store (default=no limit)
+    @type     jac: function
+    @param    jac: function jac(t, X) returning the Jacobian matrix df_i/dX_j
+                   (default=finite differences)
+    """
+    ##########################################################
+    #    x[i+1] = x[i] + dt * f(t[i+1], x[i+1])
+    ##########################################################
+    def __init__(self, f, t0=0.0, X0=[], n_dims=None, max_samples=None,
+                 jac=None, **kwargs):
+        _Implicit.__init__(self, f, t0, X0, n_dims, kwargs, max_samples, jac)
+
+    def step(self, dt):
+        """
+        Integrates a single step.
+
+        @type  dt: number
+        @param dt: length of time step
+
+        @rtype: number, vector
+        @return: updated time and state
+        """
+        t = self.t_cur
+        X = self.X_cur
+
+        t_new = t + dt
+        X_new = self._newton(t_new, X, dt, X)
+
+        return t_new, X_new
+
+class BDF2(_Implicit):
+    """
+    Integrates a system of ODEs using the 2nd-order backward differentiation
+    formula, which is L-stable. It needs the states at the two previous
+    steps; the first step, and any step after the step size changes, is taken
+    with the backward Euler method.
+
+    @type       f: function
+    @param      f: vector function f(t, X) solving a system of ODEs
+    @type      t0: number
+    @param     t0: initial time
+    @type      X0: vector
+    @param     X0: initial system state (default=[0.0, 0.0, ...])
+    @type  n_dims: number
+    @param n_dims: number of dimensions (required if X0 is not given)
+    @type  max_samples: number
+    @param max_samples: maximum number of samples to store (default=no limit)
+    @type     jac: function
+    @param    jac: function jac(t, X) returning the Jacobian matrix df_i/dX_j
+                   (default=finite differences)
+    """
+    ##########################################################
+    #    x[i+1] = (4/3)x[i] - (1/3)x[i-1]
+    #             + (2/3)dt * f(t[i+1], x[i+1])
+    ##########################################################
+    def __init__(self, f, t0=0.0, X0=[], n_dims=None, max_samples=None,
+                 jac=None, **kwargs):
+        _Implicit.__init__(self, f, t0, X0, n_dims, kwargs, max_samples, jac)
+        # The previous state, the state reached from it and the step size
+        self._history = None
+
+    def step(self, dt):
+        """
+        Integrates a single step.
+
+        @type  dt: number
+        @param dt: length of time step
+
+        @rtype: number, vector
+        @return: updated time and state
+        """
+        t = self.t_cur
+        X = self.X_cur
+        t_new = t + dt
+
+        history = self._history
+        if history is not None and history[1] is X and history[2] == dt:
+            X_prev = history[0]
+            C = dtt.linear_combination((4.0 / 3, -1.0 / 3), (X, X_prev))
+            # Linear extrapolation of the previous states as the guess
+            X_guess = dtt.linear_combination((2.0, -1.0), (X, X_prev))
+            X_new = self._newton(t_new, C, 2.0 / 3 * dt, X_guess)
+        else:
+            X_new = self._newton(t_new, X, dt, X)
+        self._history = (X, X_new, dt)
+
+        return t_new, X_new
+
+class Rosenbrock(_Implicit):
+    """
+    Integrates a system of ODEs using the linearly implicit Rosenbrock 2(3)
+    pair of Shampine & Reichelt (SIAM J. Sci. Comput. 18, 1, 1997), with
+    adaptive step sizes. It is L-stable, and takes three linear solves per
+    step instead of Newton iterations.
+
+    The Jacobian is evaluated afresh at the start of every step, as the order
+    conditions and the error estimate of the pair assume the exact Jacobian
+    (unlike a W-method); it is only reused to retry a rejected step from the
+    same state.
+
+    @type       f: function
+    @param      f: vector function f(t, X) solving a system of ODEs
+    @type      t0: number
+    @param     t0: initial time
+    @type      X0: vector
+    @param     X0: initial system state (default=[0.0, 0.0, ...])
+    @type  n_dims: number
+    @param n_dims: number of dimensions (required if X0 is not given)
+    @type  max_samples: number
+    @param max_samples: maximum number of samples to store (default=no limit)
+    @type     jac: function
+    @param    jac: function jac(t, X) returning the Jacobian matrix df_i/dX_j
+                   (default=finite differences)
+    """
+    ##########################################################
+    #    With W = I - dt*d*J and T = df/dt,
+    #        k_1 = W^-1 (f(t, x) + dt*d*T)
+    #        F_1 = f(t + dt/2, x + (dt/2)k_1)
+    #        k_2 = W^-1 (F_1 - k_1) + k_1
+    #        x[i+1] = x[i] + dt*k_2
+    #        F_2 = f(t + dt, x[i+1])
+    #        k_3 = W^-1 (F_2 - e_32(k_2 - F_1) - 2(k_1 - f(t, x))
+    #                    + dt*d*T)
+    #    and the error estimate is (dt/6)(k_1 - 2k_2 + k_3).
+    ##########################################################
+    D = 1.0 / (2.0 + 2.0**0.5)
+    E32 = 6.0 + 2.0**0.5
+
+    # Step size control: with an accuracy per unit time, the normalised
+    # error scales as dt^2
+    SAFETY = 0.9
+    MIN_FACTOR = 0.2
+    MAX_FACTOR = 5.0
+
+    def __init__(self, f, t0=0.0, X0=[], n_dims=None, max_samples=None,
+                 jac=None, **kwargs):
+        _Implicit.__init__(self, f, t0, X0, n_dims, kwargs, max_samples, jac)
+        self.dt_all = []
+        # Derivative at the end of the last step
+        self._F_new = None
+
+    def step(self, dt, indices=None):
+        """
+        Integrates a single step from the current state.
+
+        @type       dt: number
+        @param      dt: length of time step
+        @type  indices: vector
+        @param indices: indices of parameters in state vector for which to
+                        estimate local truncation error (default=all)
+
+        @rtype: number, vector, number
+        @return: updated time and state, and local truncation error estimate
+        """
+        t = self.t_cur
+        X = self.X_cur
+        if self._J is None or self._J_state[1] is not X:
+            self._jacobian(t, X)
+        d = self.D
+        W = self._iteration_matrix(dt * d)
+
+        F0 = self._derivative(t, X)
+        # The time derivative of f, which the method needs to be accurate
+        # for non-autonomous systems
+        h = self.JAC_STEP * max(1.0, abs(t))
+        T = dtt.linear_combination(
+            (1.0 / h, -1.0 / h), (self.f(t + h, X, **self.kwargs), F0))
+        k1 = self._solve(W, dtt.linear_combination((1.0, dt * d), (F0, T)))
+        F1 = self.f(t + dt / 2, dtt.linear_combination((1.0, dt / 2), (X, k1)),
+                    **self.kwargs)
+        k2 = self._solve(W, dtt.linear_combination((1.0, -1.0), (F1, k1)))
+        k2.iadd(k1)
+
+        t_new = t + dt
+        X_new = dtt.linear_combination((1.0, dt), (X, k2))
+        F2 = self.f(t_new, X_new, **self.kwargs)
+        k3 = self._solve(W, dtt.linear_combination(
+            (1.0, -self.E32, self.E32, -2.0, 2.0, dt * d),
+            (F2, k2, F1, k1, F0, T)))
+
+        if indices is None:
+            indices = range(X.n_elems)
+        error = 0.0
+        for i in indices:
+            epsilon = dt / 6 * (k1.data[i] - 2 * k2.data[i] + k3.data[i])
+            error += epsilon**2
+        error = error**0.5
+        # The last evaluation is the derivative at the new state
+        self._F_new = F2
+
+        return t_new, X_new, error
+
+    def iterate(self, duration, dt0, delta, indices=None, store=True,
+                t_eval=None, events=None):
+        """
+        Integrates over a specified duration of time, lazily yielding the
+        state after each accepted step. The last step is shortened to end
+        exactly at the end of the interval.
+
+        @type  duration: number
+        @param duration: total simulation time
+        @type       dt0: number
+        @param      dt0: initial length of time step
+        @type     delta: number
+        @param    delta: desired accuracy per unit time
+        @type   indices: vector
+        @param  indices: indices of parameters in state vector for which to
+                         estimate local truncation error (default=all)
+        @type     store: boolean
+        @param    store: store each state in the trajectory; if False, only
+                         the current state is kept [default=True]
+        @type    t_eval: iterable
+        @param   t_eval: if specified, the solution is output (yielded and
+                         stored) at these times instead of after each step,
+                         by cubic Hermite interpolation within the steps
+        @type    events: iterable
+        @param   events: event functions g(t, X) whose zero crossings are
+                         located and stored in t_events and X_events; a
+                         terminal event stops the integration at the crossing
+
+        @rtype: generator
+        @return: (time, state) after each accepted step, or at each output
+                 time
+        """
+        dt = float(dt0)
+        delta = float(delta)
+        t_end = self.t_cur + float(duration)
+
+        dense = None
+        if t_eval is not None:
+            dense, outputs = self._start_dense_output(t_eval, t_end, store)
+            for state in outputs:
+                yield state
+        events = self._start_events(events, self.t_cur, self.X_cur)
+
+        while self.t_cur < t_end:
+            dt = min(dt, t_end - self.t_cur)
+            t_new, X_new, error = self.step(dt, indices)
+            # Normalised error; the step is accepted if it is at most 1
+            error = max(error / (delta * dt), 1e-10)
+            factor = self.SAFETY * error**-0.5
+
+            if error <= 1.0:
+                self._f_cache = (t_new, X_new, self._F_new)
+                self.dt_all.append(dt)
+                t_old, X_old = self.t_cur, self.X_cur
+                for state in self._accept(t_old, X_old, t_new, X_new, store,
+                                          dense, events):
+                    yield state
+                if events is not None and events.terminated:
+                    break
+                dt *= min(self.MAX_FACTOR, max(self.MIN_FACTOR, factor))
+            else:
+                # Reject the step, and retry with a smaller one
+                self._reject(self.t_cur, dt)
+                dt *= min(1.0, max(self.MIN_FACTOR, factor))
+
+    def integrate(self, duration, dt0, delta, indices=None, verbose=False,
+                  store=True, t_eval=None, events=None):
+        """
+        Integrates over a specified duration of time.
+
+        @type  duration: number
+        @param duration: total simulation time
+        @type       dt0: number
+        @param      dt0: initial length of time step
+        @type     delta: number
+        @param    delta: desired accuracy per unit time
+        @type   indices: vector
+        @param  indices: indices of parameters in state vector for which to
+                         estimate local truncation error (default=all)
+        @type   verbose: boolean
+        @param  verbose: print state at each step [default=False]
+        @type     store: boolean
+        @param    store: store each state in the trajectory [default=True]
+        @type    t_eval: iterable
+        @param   t_eval: if specified, store the solution at these times
+                         instead of after each step
+        @type    events: iterable
+        @param   events: event functions g(t, X) to locate (see iterate())
+        """
+        for t_new, X_new in self.iterate(duration, dt0, delta, indices,
+                                         store, t_eval, events):
+            if verbose:
+                self.current_state()
+
+#### Symplectic integrators
+
+def _composition(weights):
+    """
+    Returns the drift and kick coefficients of a composition of leapfrog
+    (kick-drift-kick) steps with the given relative lengths. Adjacent kicks
+    of consecutive leapfrog steps are merged.
+
+    @type  weights: tuple
+    @param weights: relative lengths of the leapfrog steps
+
+    @rtype: tuple, tuple
+    @return: drift coefficients, kick coefficients
+    """
+    drifts = (0.0,) + tuple(weights)
+    kicks = tuple((w1 + w2) / 2 for w1, w2
+                  in zip((0.0,) + tuple(weights), tuple(weights) + (0.0,)))
+    return drifts, kicks
+
+class _Symplectic(OdeInt):
+    """
+    Base class of the symplectic integrators for separable Hamiltonian
+    systems, e.g. equations of motion with forces depending only on the
+    positions. The state X holds the n positions followed by the n
+    velocities, as for the first-order form (e.g. astro.orbit_1body), but the
+    ODEs are given split into
+
+        dQ/dt = velocity(t, V),    dV/dt = accel(t, Q)
+
+    with Q = X[:n] and V = X[n:]. A step is a sequence of stages
+
+        Q += C[i] * dt * velocity(t, V)
+        V += D[i] * dt * accel(t, Q)
+
+    which exactly preserves phase-space volume, so that the energy error
+    stays bounded over long integrations instead of drifting.
+
+    @type      accel: function
+    @param     accel: vector function accel(t, Q) giving the accelerations
+    @type         t0: number
+    @param        t0: initial time
+    @type         X0: vector
+    @param        X0: initial positions followed by initial velocities
+    @type     n_dims: number
+    @param    n_dims: number of dimensions (required if X0 is not given)
+    @type  max_samples: number
+    @param max_samples: maximum number of samples to store (default=no limit)
+    @type   velocity: function
+    @param  velocity: vector function velocity(t, V) giving dQ/dt
+                      (default=V)
+    """
+    C = ()
+    D = ()
+    # The first-order form calls accel, so only accel is counted
+    _counted = ("accel",)
+
+    def __init__(self, accel, t0=0.0, X0=[], n_dims=None, max_samples=None,
+                 velocity=None, **kwargs):
+        OdeInt.__init__(self, self._first_order, t0, X0, n_dims, kwargs,
+                        max_samples)
+        if self.X_cur.n_elems % 2 != 0:
+            raise ValueError("State must hold as many velocities as "
+                             "positions")
+        self.accel = accel
+        self.velocity = velocity
+        self.n_pos = self.X_cur.n_elems // 2
+        # The last acceleration evaluated in a step, as (t, X, A), for reuse
+        # by the first kick of the next step
+        self._a_cache = None
+
+    def _first_order(self, t, X, **kwargs):
+        """
+        The ODEs in first-order form, as used for events and dense output.
+
+        @type  t: number
+        @param t: time
+        @type  X: vector
+        @param X: system state
+
+        @rtype: vector
+        @return: derivative
+        """
+        n = self.n_pos
+        dQ = self._dQ(t, dtt.FloatVector(X.data[n:]))
+        A = dtt.FloatVector(self.accel(t, dtt.FloatVector(X.data[:n]),
+                                       **kwargs))
+        return dtt.FloatVector(dQ.data + A.data)
+
+    def _dQ(self, t, V):
+        """
+        Returns dQ/dt.
+
+        @type  t: number
+        @param t: time
+        @type  V: vector
+        @param V: velocities
+
+        @rtype: vector
+        @return: derivative of the positions
+        """
+        if self.velocity is None:
+            return V
+        return dtt.FloatVector(self.velocity(t, V, **self.kwargs))
+
+    def step(self, dt):
+        """
+        Integrates a single step.
+
+        @type  dt: number
+        @param dt: length of time step
+
+        @rtype: number, vector
+        @return: updated time and state
+        """
+        # Load the previous system state
+        t = self.t_cur
+        X = self.X_cur
+        n = self.n_pos
+        Q = dtt.FloatVector(X.data[:n])
+        V = dtt.FloatVector(X.data[n:])
+
+        cache = self._a_cache
+        t_stage = t
+        A = None
+        for c, d in zip(self.C, self.D):
+            if c:
+                # Drift
+                Q.axpy(c * dt, self._dQ(t_stage, V))
+                t_stage += c * dt
+                A = None
+            if d:
+                # Kick
+                if (A is None and t_stage == t and cache is not None
+                    and cache[1] is X and cache[0] == t):
+                    A = cache[2]
+                elif A is None:
+                    A = self.accel(t_stage, Q, **self.kwargs)
+                V.axpy(d * dt, A)
+
+        t_new = t + dt
+        X_new = dtt.FloatVector(Q.data + V.data)
+        # The positions have not moved since the last kick
+        self._a_cache = (t_new, X_new, A) if A is not None else None
+
+        return t_new, X_new
+
+class Leapfrog(_Symplectic):
+    """
+    Integrates a separable Hamiltonian system using the 2nd-order leapfrog
+    method in its kick-drift-kick form, also known as velocity Verlet. The
+    last acceleration of a step is reused by the next one, so that each step
+    costs a single evaluation. See _Symplectic for the arguments.
+    """
+    ##########################################################
+    #    v[i+1/2] = v[i] + (dt/2)*a(x[i])
+    #    x[i+1] = x[i] + dt*v[i+1/2]
+    #    v[i+1] = v[i+1/2] + (dt/2)*a(x[i+1])
+    ##########################################################
+    C, D = _composition((1.0,))
+
+VelocityVerlet = Leapfrog
+
+class Yoshida4(_Symplectic):
+    """
+    Integrates a separable Hamiltonian system using the 4th-order method of
+    Yoshida (Phys. Lett. A 150, 262, 1990): three leapfrog steps, the middle
+    one backwards in time. See _Symplectic for the arguments.
+    """
+    W1 = 1.0 / (2.0 - 2.0**(1.0 / 3))
+    W0 = 1.0 - 2 * W1
+    C, D = _composition((W1, W0, W1))
+
+class Yoshida6(_Symplectic):
+    """
+    Integrates a separable Hamiltonian system using the 6th-order method of
+    Yoshida (solution A), composed of seven leapfrog steps. See _Symplectic
+    for the arguments.
+    """
+    W1 = -1.17767998417887
+    W2 = 0.235573213359357
+    W3 = 0.784513610477560
+    W0 = 1.0 - 2 * (W1 + W2 + W3)
+    C, D = _composition((W3, W2, W1, W0, W1, W2, W3))
+
+class ForestRuth(_Symplectic):
+    """
+    Integrates a separable Hamiltonian system using the 4th-order method of
+    Forest & Ruth (Physica D 43, 105, 1990), in its drift-kick-drift form:
+    three accelerations per step, starting and ending with a drift. See
+    _Symplectic for the arguments.
+    """
+    THETA = 1.0 / (2.0 - 2.0**(1.0 / 3))
+    C = (THETA / 2, (1 - THETA) / 2, (1 - THETA) / 2, THETA / 2)
+    D = (THETA, 1 - 2 * THETA, THETA, 0.0)
@@ -0,0 +1,218 @@
+"""
+Parameter sweeps of ODE integrations, spread across processes.
+
+Each job integrates one combination of parameters and initial state with a
+fresh integrator. The jobs are grouped into chunks, which are run by a pool
+of worker processes; each chunk sends back its results as arrays of floats,
+so that little has to be pickled. Since the integrator class, the ODE
+function and the measure function are sent to the workers, they must be
+picklable, i.e. defined at the top level of a module (such as the functions
+in souffle.physics and souffle.math.chaos); lambdas only work with
+max_workers=1, which runs the jobs in the calling process.
+"""
+
+import array
+import concurrent.futures
+import itertools
+import os
+
+def grid(**axes):
+    """
+    Returns every combination of the given parameter values, e.g.
+    grid(a=[1, 2], b=[3, 4]) gives
+    [{a: 1, b: 3}, {a: 1, b: 4}, {a: 2, b: 3}, {a: 2, b: 4}].
+
+    @type  axes: dictionary
+    @param axes: values of each parameter
+
+    @rtype: list
+    @return: dictionaries of keyword arguments
+    """
+    keys = sorted(axes)
+    return [dict(zip(keys, values))
+            for values in itertools.product(*[axes[key] for key in keys])]
+
+def _column(values):
+    """
+    Packs a column of results into an array of floats if possible.
+
+    @type  values: list
+    @param values: values of the column
+
+    @rtype: array.array or list
+    @return: the column
+    """
+    try:
+        return array.array("d", values)
+    except TypeError:
+        return list(values)
+
+class SweepResult(object):
+    """
+    The results of a sweep in columnar form, with one row per job in the
+    order of the jobs.
+
+    @type  params: dictionary
+    @param params: column of values of each parameter
+    @type      X0: list
+    @param     X0: columns of the initial states
+    @type       t: array.array
+    @param      t: final times
+    @type       X: list
+    @param      X: columns of the final states
+    @type  values: list
+    @param values: results of the measure function (None if not given)
+    """
+    def __init__(self, params, X0, t, X, values):
+        self.params = params
+        self.X0 = X0
+        self.t = t
+        self.X = X
+        self.values = values
+
+    def __len__(self):
+        """
+        Returns the number of jobs.
+
+        @rtype: number
+        @return: number of jobs
+        """
+        return len(self.t)
+
+    def row(self, idx):
+        """
+        Collects the parameters and results of one job.
+
+        @type  idx: number
+        @param idx: index of the job
+
+        @rtype: dictionary
+        @return: parameters, and initial and final time and state of the job
+        """
+        row = dict((key, col[idx]) for key, col in self.params.items())
+        row["X0"] = [col[idx] for col in self.X0]
+        row["t"] = self.t[idx]
+        row["X"] = [col[idx] for col in self.X]
+        if self.values is not None:
+            row["value"] = self.values[idx]
+        return row
+
+def _run_chunk(task):
+    """
+    Runs a chunk of jobs.
+
+    @type  task: tuple
+    @param task: integrator class, ODE function, initial time, arguments
+                 and keyword arguments of integrate(), measure function, and
+                 the (kwargs, X0) of each job
+
+    @rtype: tuple
+    @return: final times, columns of final states, and measured values
+    """
+    integrator, f, t0, args, integrate_kwargs, measure, jobs = task
+    t = array.array("d")
+    X = None
+    values = []
+    for kwargs, X0 in jobs:
+        ode = integrator(f, t0, X0, **kwargs)
+        ode.integrate(*args, **integrate_kwargs)
+        t.append(ode.t_cur)
+        if X is None:
+            X = [array.array("d") for i in range(len(ode.X_cur))]
+        for col, x in zip(X, ode.X_cur):
+            col.append(x)
+        if measure is not None:
+            values.append(measure(ode))
+    return t, X, values
+
+def sweep(integrator, f, params, X0, t0=0.0, args=(), integrate_kwargs=None,
+          measure=None, max_workers=None, chunksize=None):
+    """
+    Integrates a system of ODEs for every combination of parameters and
+    initial state, spreading the jobs across a pool of processes.
+
+    Any integrator taking (f, t0, X0, **kwargs) in its constructor can be
+    used, e.g. odeint.RK4 or odeint.DormandPrince; integrate() is called with
+    args and integrate_kwargs. By default the trajectories are not stored,
+    unless a measure function is given, which receives the integrator at the
+    end of each job and returns a (picklable) result.
+
+    @type        integrator: class
+    @param       integrator: integrator class
+    @type                 f: function
+    @param                f: vector function f(t, X) solving a system of ODEs
+    @type            params: list
+    @param           params: keyword arguments for the ODE function of each
+                             parameter combination (see grid())
+    @type                X0: list
+    @param               X0: initial states (or a single initial state)
+    @type                t0: number
+    @param               t0: initial time
+    @type              args: tuple
+    @param             args: arguments of integrate()
+    @type  integrate_kwargs: dictionary
+    @param integrate_kwargs: keyword arguments of integrate()
+                             (default={"store": measure is not None})
+    @type           measure: function
+    @param          measure: function of the integrator computing a result
+                             from each job
+    @type       max_workers: number
+    @param      max_workers: number of processes (default=number of CPUs;
+                             1 runs the jobs in the calling process)
+    @type         chunksize: number
+    @param        chunksize: number of jobs per chunk (default=a quarter of
+                             the jobs of each process)
+
+    @rtype: SweepResult
+    @return: the columnar results
+    """
+    params = list(params)
+    if len(params) == 0:
+        params = [{}]
+    X0 = list(X0)
+    if len(X0) == 0:
+        raise ValueError("No initial states given")
+    if not hasattr(X0[0], "__len__"):
+        X0 = [X0]
+    if integrate_kwargs is None:
+        integrate_kwargs = {"store": measure is not None}
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    max_workers = int(max_workers)
+    if max_workers < 1:
+        raise ValueError("max_workers must be at least 1")
+
+    jobs = [(kwargs, X) for kwargs in params for X in X0]
+    if chunksize is None:
+        chunksize = -(-len(jobs) // (4 * max_workers))
+    chunksize = max(1, int(chunksize))
+    tasks = [(integrator, f, t0, tuple(args), integrate_kwargs, measure,
+              jobs[i:i + chunksize])
+             for i in range(0, len(jobs), chunksize)]
+
+    if max_workers == 1:
+        results = [_run_chunk(task) for task in tasks]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers) as pool:
+            results = list(pool.map(_run_chunk, tasks))
+
+    # Join the chunks into columns
+    t = array.array("d")
+    X = None
+    values = [] if measure is not None else None
+    for t_chunk, X_chunk, values_chunk in results:
+        t.extend(t_chunk)
+        if X is None:
+            X = X_chunk
+        else:
+            for col, col_chunk in zip(X, X_chunk):
+                col.extend(col_chunk)
+        if values is not None:
+            values.extend(values_chunk)
+
+    keys = sorted(set(key for kwargs in params for key in kwargs))
+    param_cols = dict((key, _column([kwargs.get(key) for kwargs, X in jobs]))
+                      for key in keys)
+    X0_cols = [_column(col) for col in zip(*[X for kwargs, X in jobs])]
+
+    return SweepResult(param_cols, X0_cols, t, X, values)
@@ -2,11 +2,19 @@
 Astrophysics, celestial mechanics.
 """
 
+import array
 import math
 import souffle.constants as const
 import souffle.datatypes as dtt
 import souffle.physics.thermo as thermo
 
+##### Default constants #####
+# N-body: Barnes-Hut opening angle
+NBODY_THETA = 0.5
+# N-body: maximum depth of the octree (coincident particles share a leaf)
+NBODY_MAX_DEPTH = 48
+#############################
+
 def orbit_1body(t, X, **kwargs):
     """
     The Newtonian equations of motion for orbit of a significantly less massive
@@ -37,6 +45,31 @@ def orbit_1body(t, X, **kwargs):
     X_dot = [x_dot, y_dot, vx_dot, vy_dot]
     return dtt.Vector(X_dot)
 
+def orbit_1body_accel(t, Q, **kwargs):
+    """
+    The Newtonian gravitational acceleration of an object orbiting the Sun,
+    i.e. the velocity half of orbit_1body(), for the symplectic integrators
+    in souffle.math.odeint.
+
+    @type  t: number
+    @param t: current time
+    @type  Q: vector
+    @param Q: current position
+
+    @rtype: vector
+    @return: acceleration
+    """
+    x = Q[0]
+    y = Q[1]
+
+    # Orbital separation
+    r = (x**2 + y**2)**0.5
+
+    ax = - const.G * const.M_sol * x / r**3
+    ay = - const.G * const.M_sol * y / r**3
+
+    return dtt.Vector([ax, ay])
+
 def stellar_structure(r, X, **kwargs):
     """
     Solves the stellar structure equations of hydrostatic equilibrium and
@@ -73,3 +106,501 @@ def stellar_structure(r, X, **kwargs):
     X_dot = [dM_dr, drho_dr]
     
     return dtt.Vector(X_dot)
+
+#### N-body systems
+
+class Particles(object):
+    """
+    Structure-of-arrays store of N particles: the masses, positions and
+    velocities are each kept as a column (array of floats) over all
+    particles.
+
+    The state of the system, as used by nbody() and nbody_accel(), holds the
+    positions followed by the velocities, one component at a time:
+    [x..., y..., z..., vx..., vy..., vz...].
+    """
+    def __init__(self):
+        self.m = array.array("d")
+        self.x = array.array("d")
+        self.y = array.array("d")
+        self.z = array.array("d")
+        self.vx = array.array("d")
+        self.vy = array.array("d")
+        self.vz = array.array("d")
+
+    def __len__(self):
+        """
+        Returns the number of particles.
+
+        @rtype: number
+        @return: number of particles
+        """
+        return len(self.m)
+
+    def add(self, m, pos, vel=(0.0, 0.0, 0.0)):
+        """
+        Adds a particle.
+
+        @type    m: number
+        @param   m: mass [kg]
+        @type  pos: sequence
+        @param pos: position (x, y, z) [m]
+        @type  vel: sequence
+        @param vel: velocity (vx, vy, vz) [m s^{-1}]
+        """
+        if len(pos) != 3 or len(vel) != 3:
+            raise ValueError("Position and velocity must have three "
+                             "components")
+        self.m.append(m)
+        self.x.append(pos[0])
+        self.y.append(pos[1])
+        self.z.append(pos[2])
+        self.vx.append(vel[0])
+        self.vy.append(vel[1])
+        self.vz.append(vel[2])
+
+    def state(self):
+        """
+        Returns the state of the system.
+
+        @rtype: dtt.FloatVector
+        @return: positions followed by velocities
+        """
+        data = array.array("d")
+        for col in (self.x, self.y, self.z, self.vx, self.vy, self.vz):
+            data.extend(col)
+        return dtt.FloatVector(data)
+
+    def set_state(self, X):
+        """
+        Updates the positions and velocities from a state of the system.
+
+        @type  X: vector
+        @param X: positions followed by velocities
+        """
+        n = len(self)
+        if len(X) != 6 * n:
+            raise ValueError("State must have six components per particle")
+        data = X.data if isinstance(X, dtt.Vector) else X
+        self.x = array.array("d", data[0:n])
+        self.y = array.array("d", data[n:2 * n])
+        self.z = array.array("d", data[2 * n:3 * n])
+        self.vx = array.array("d", data[3 * n:4 * n])
+        self.vy = array.array("d", data[4 * n:5 * n])
+        self.vz = array.array("d", data[5 * n:6 * n])
+
+    def energy(self, G=const.G, softening=0.0):
+        """
+        Returns the total (kinetic plus potential) energy, by direct
+        summation over all pairs.
+
+        @type          G: number
+        @param         G: gravitational constant
+        @type  softening: number
+        @param softening: softening length [m]
+
+        @rtype: number
+        @return: total energy [J]
+        """
+        m, x, y, z = self.m, self.x, self.y, self.z
+        eps2 = softening**2
+        kinetic = 0.0
+        potential = 0.0
+        for i in range(len(m)):
+            kinetic += 0.5 * m[i] * (self.vx[i]**2 + self.vy[i]**2
+                                     + self.vz[i]**2)
+            xi, yi, zi = x[i], y[i], z[i]
+            for j in range(i + 1, len(m)):
+                r2 = (x[j] - xi)**2 + (y[j] - yi)**2 + (z[j] - zi)**2 + eps2
+                potential -= G * m[i] * m[j] / r2**0.5
+        return kinetic + potential
+
+def _split_positions(Q):
+    """
+    Splits the positions of a state into columns.
+
+    @type  Q: vector
+    @param Q: positions [x..., y..., z...] (or a whole state)
+
+    @rtype: tuple
+    @return: x, y and z columns
+    """
+    data = Q.data if isinstance(Q, dtt.Vector) else Q
+    n = len(data) // 3
+    return data[0:n], data[n:2 * n], data[2 * n:3 * n]
+
+def accel_direct(x, y, z, m, G=const.G, softening=0.0):
+    """
+    Computes the gravitational accelerations of N particles by direct
+    summation over all pairs, in O(N^2) operations. Best for small N.
+
+    @type          x: sequence
+    @param         x: x-coordinates [m]
+    @type          y: sequence
+    @param         y: y-coordinates [m]
+    @type          z: sequence
+    @param         z: z-coordinates [m]
+    @type          m: sequence
+    @param         m: masses [kg]
+    @type          G: number
+    @param         G: gravitational constant
+    @type  softening: number
+    @param softening: softening length [m]
+
+    @rtype: tuple
+    @return: x, y and z columns of the accelerations
+    """
+    n = len(m)
+    eps2 = softening**2
+    ax = array.array("d", bytes(8 * n))
+    ay = array.array("d", bytes(8 * n))
+    az = array.array("d", bytes(8 * n))
+    for i in range(n):
+        xi, yi, zi, mi = x[i], y[i], z[i], m[i]
+        axi = ayi = azi = 0.0
+        # Each pair is visited once, and acts on both particles
+        for j in range(i + 1, n):
+            dx = x[j] - xi
+            dy = y[j] - yi
+            dz = z[j] - zi
+            r2 = dx * dx + dy * dy + dz * dz + eps2
+            s = G / (r2 * r2**0.5)
+            axi += s * m[j] * dx
+            ayi += s * m[j] * dy
+            azi += s * m[j] * dz
+            ax[j] -= s * mi * dx
+            ay[j] -= s * mi * dy
+            az[j] -= s * mi * dz
+        ax[i] += axi
+        ay[i] += ayi
+        az[i] += azi
+    return ax, ay, az
+
+class Octree(object):
+    """
+    Barnes-Hut octree of N particles. Each node is a cube, split into eight
+    octants until each leaf holds a single particle; the nodes are kept as
+    columns (structure of arrays), with the total mass and centre of mass of
+    each node.
+
+    @type  x: sequence
+    @param x: x-coordinates [m]
+    @type  y: sequence
+    @param y: y-coordinates [m]
+    @type  z: sequence
+    @param z: z-coordinates [m]
+    @type  m: sequence
+    @param m: masses [kg]
+    """
+    def __init__(self, x, y, z, m):
+        self.x = x
+        self.y = y
+        self.z = z
+        self.m = m
+        n = len(m)
+        if n == 0:
+            raise ValueError("Cannot build an octree without particles")
+
+        # Bounding cube of the particles
+        x_min, x_max = min(x), max(x)
+        y_min, y_max = min(y), max(y)
+        z_min, z_max = min(z), max(z)
+        half = 0.5 * max(x_max - x_min, y_max - y_min, z_max - z_min)
+        half = half * (1 + 1e-12) or 1.0
+
+        # Node columns: centre and half-width of the cube, mass and
+        # mass-weighted position (the centre of mass once the tree is built),
+        # index of the first child (-1 for leaves) and of the first particle
+        # of leaves (-1 if empty)
+        self.cx = array.array("d")
+        self.cy = array.array("d")
+        self.cz = array.array("d")
+        self.half = array.array("d")
+        self.mass = array.array("d")
+        self.mx = array.array("d")
+        self.my = array.array("d")
+        self.mz = array.array("d")
+        self.child = array.array("l")
+        self.body = array.array("l")
+        # Next particle in the same leaf, for coincident particles
+        self.next = array.array("l", [-1]) * n
+
+        self._new_node(0.5 * (x_min + x_max), 0.5 * (y_min + y_max),
+                       0.5 * (z_min + z_max), half)
+        for i in range(n):
+            self._insert(i)
+
+        mass = self.mass
+        for k in range(len(mass)):
+            if mass[k] > 0:
+                self.mx[k] /= mass[k]
+                self.my[k] /= mass[k]
+                self.mz[k] /= mass[k]
+
+    def __len__(self):
+        """
+        Returns the number of nodes.
+
+        @rtype: number
+        @return: number of nodes
+        """
+        return len(self.half)
+
+    def _new_node(self, cx, cy, cz, half):
+        """
+        Appends an empty leaf.
+
+        @type    cx: number
+        @param   cx: x-coordinate of the centre
+        @type    cy: number
+        @param   cy: y-coordinate of the centre
+        @type    cz: number
+        @param   cz: z-coordinate of the centre
+        @type  half: number
+        @param half: half-width of the cube
+        """
+        self.cx.append(cx)
+        self.cy.append(cy)
+        self.cz.append(cz)
+        self.half.append(half)
+        self.mass.append(0.0)
+        self.mx.append(0.0)
+        self.my.append(0.0)
+        self.mz.append(0.0)
+        self.child.append(-1)
+        self.body.append(-1)
+
+    def _split(self, k):
+        """
+        Splits a leaf into eight children.
+
+        @type  k: number
+        @param k: index of the leaf
+        """
+        half = 0.5 * self.half[k]
+        self.child[k] = len(self.half)
+        for octant in range(8):
+            self._new_node(self.cx[k] + (half if octant & 1 else -half),
+                           self.cy[k] + (half if octant & 2 else -half),
+                           self.cz[k] + (half if octant & 4 else -half),
+                           half)
+
+    def _octant(self, k, i):
+        """
+        Returns the child of node k containing particle i.
+
+        @type  k: number
+        @param k: index of the node
+        @type  i: number
+        @param i: index of the particle
+
+        @rtype: number
+        @return: index of the child
+        """
+        octant = ((self.x[i] >= self.cx[k]) | (self.y[i] >= self.cy[k]) << 1
+                  | (self.z[i] >= self.cz[k]) << 2)
+        return self.child[k] + octant
+
+    def _add_mass(self, k, i):
+        """
+        Adds the mass of particle i to node k.
+
+        @type  k: number
+        @param k: index of the node
+        @type  i: number
+        @param i: index of the particle
+        """
+        m = self.m[i]
+        self.mass[k] += m
+        self.mx[k] += m * self.x[i]
+        self.my[k] += m * self.y[i]
+        self.mz[k] += m * self.z[i]
+
+    def _insert(self, i):
+        """
+        Inserts particle i, descending from the root.
+
+        @type  i: number
+        @param i: index of the particle
+        """
+        k = 0
+        depth = 0
+        while True:
+            self._add_mass(k, i)
+            if self.child[k] >= 0:
+                # Internal node
+                k = self._octant(k, i)
+                depth += 1
+            elif self.body[k] < 0:
+                # Empty leaf
+                self.body[k] = i
+                return
+            elif depth >= NBODY_MAX_DEPTH:
+                # Too deep to separate the particles: share the leaf
+                self.next[i] = self.body[k]
+                self.body[k] = i
+                return
+            else:
+                # Occupied leaf: push its particle down one level
+                j = self.body[k]
+                self.body[k] = -1
+                self._split(k)
+                k_j = self._octant(k, j)
+                self._add_mass(k_j, j)
+                self.body[k_j] = j
+                k = self._octant(k, i)
+                depth += 1
+
+    def accel(self, i, G=const.G, softening=0.0, theta=NBODY_THETA):
+        """
+        Computes the acceleration of particle i. Nodes of width s at distance
+        d from the particle with s / d < theta are replaced by their centre of
+        mass; theta=0 gives the direct sum.
+
+        @type          i: number
+        @param         i: index of the particle
+        @type          G: number
+        @param         G: gravitational constant
+        @type  softening: number
+        @param softening: softening length [m]
+        @type      theta: number
+        @param     theta: opening angle
+
+        @rtype: tuple
+        @return: acceleration (ax, ay, az)
+        """
+        x, y, z, m = self.x, self.y, self.z, self.m
+        mass, mx, my, mz = self.mass, self.mx, self.my, self.mz
+        half, child, body, nxt = self.half, self.child, self.body, self.next
+        eps2 = softening**2
+        # Opening criterion (2 half / d)^2 < theta^2
+        theta2 = 0.25 * theta**2
+        xi, yi, zi = x[i], y[i], z[i]
+        ax = ay = az = 0.0
+        stack = [0]
+        while stack:
+            k = stack.pop()
+            if mass[k] == 0:
+                continue
+            if child[k] < 0:
+                # Leaf: sum over its particles
+                j = body[k]
+                while j >= 0:
+                    if j != i:
+                        dx = x[j] - xi
+                        dy = y[j] - yi
+                        dz = z[j] - zi
+                        r2 = dx * dx + dy * dy + dz * dz + eps2
+                        s = G * m[j] / (r2 * r2**0.5)
+                        ax += s * dx
+                        ay += s * dy
+                        az += s * dz
+                    j = nxt[j]
+                continue
+            dx = mx[k] - xi
+            dy = my[k] - yi
+            dz = mz[k] - zi
+            r2 = dx * dx + dy * dy + dz * dz
+            if half[k]**2 < theta2 * r2:
+                # Far enough: use the centre of mass
+                r2 += eps2
+                s = G * mass[k] / (r2 * r2**0.5)
+                ax += s * dx
+                ay += s * dy
+                az += s * dz
+            else:
+                stack.extend(range(child[k], child[k] + 8))
+        return ax, ay, az
+
+def accel_tree(x, y, z, m, G=const.G, softening=0.0, theta=NBODY_THETA):
+    """
+    Computes the gravitational accelerations of N particles with a
+    Barnes-Hut octree, in O(N log N) operations. Best for large N.
+
+    @type          x: sequence
+    @param         x: x-coordinates [m]
+    @type          y: sequence
+    @param         y: y-coordinates [m]
+    @type          z: sequence
+    @param         z: z-coordinates [m]
+    @type          m: sequence
+    @param         m: masses [kg]
+    @type          G: number
+    @param         G: gravitational constant
+    @type  softening: number
+    @param softening: softening length [m]
+    @type      theta: number
+    @param     theta: opening angle (see Octree.accel())
+
+    @rtype: tuple
+    @return: x, y and z columns of the accelerations
+    """
+    tree = Octree(x, y, z, m)
+    ax = array.array("d")
+    ay = array.array("d")
+    az = array.array("d")
+    for i in range(len(m)):
+        axi, ayi, azi = tree.accel(i, G, softening, theta)
+        ax.append(axi)
+        ay.append(ayi)
+        az.append(azi)
+    return ax, ay, az
+
+def nbody_accel(t, Q, **kwargs):
+    """
+    The gravitational accelerations of an N-body system, for the symplectic
+    integrators in souffle.math.odeint.
+
+    The keyword arguments are
+        masses:    the masses of the particles (required)
+        method:    "direct" or "tree" (default="direct")
+        G:         gravitational constant (default=const.G)
+        softening: softening length (default=0)
+        theta:     opening angle of the tree (default=NBODY_THETA)
+
+    @type  t: number
+    @param t: current time
+    @type  Q: vector
+    @param Q: current positions [x..., y..., z...]
+
+    @rtype: vector
+    @return: accelerations [ax..., ay..., az...]
+    """
+    if "masses" not in kwargs:
+        raise ValueError("Bad kwargs; please provide the masses")
+    m = kwargs["masses"]
+    method = kwargs.get("method", "direct")
+    G = kwargs.get("G", const.G)
+    softening = kwargs.get("softening", 0.0)
+
+    x, y, z = _split_positions(Q)
+    if len(x) != len(m):
+        raise ValueError("Positions and masses do not match")
+    if method == "direct":
+        ax, ay, az = accel_direct(x, y, z, m, G, softening)
+    elif method == "tree":
+        ax, ay, az = accel_tree(x, y, z, m, G, softening,
+                                kwargs.get("theta", NBODY_THETA))
+    else:
+        raise ValueError("Unknown method: %s" % method)
+
+    return dtt.FloatVector(ax + ay + az)
+
+def nbody(t, X, **kwargs):
+    """
+    The Newtonian equations of motion of an N-body system, in first-order
+    form for the Runge-Kutta integrators in souffle.math.odeint. Takes the
+    same keyword arguments as nbody_accel().
+
+    @type  t: number
+    @param t: current time
+    @type  X: vector
+    @param X: current state [x..., y..., z..., vx..., vy..., vz...]
+
+    @rtype: vector
+    @return: derivative
+    """
+    data = X.data if isinstance(X, dtt.Vector) else X
+    n3 = len(data) // 2
+    A = nbody_accel(t, data[:n3], **kwargs)
+    return dtt.FloatVector(array.array("d", data[n3:]) + A.data)
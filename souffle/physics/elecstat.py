@@ -2,9 +2,38 @@
 Electrostatics.
 """
 
+import array
+import concurrent.futures
+import itertools
 import math
+import operator
 import souffle.constants as const
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+##### Default constants #####
+# Batch evaluation: number of targets per chunk in pure Python
+BATCH_CHUNK = 1024
+# Batch evaluation: number of (target, source) pairs per chunk with NumPy
+BATCH_NUMPY_ELEMS = 2**20
+# Tree: opening angle
+TREE_THETA = 0.5
+# Tree: maximum number of charges per leaf
+TREE_LEAF_SIZE = 16
+# Tree: maximum depth (coincident charges share a leaf)
+TREE_MAX_DEPTH = 48
+# Tree: maximum number of targets per group walking the tree together
+TREE_GROUP_SIZE = 32
+# Tree: maximum number of targets compared in error reports
+TREE_ERROR_SAMPLE = 1000
+# Multigrid: maximum number of nodes along an axis of the coarsest grid, which
+# is solved by SOR
+MULTIGRID_MAX_COARSE = 17
+#############################
+
 def potential(q, r):
     """
     Returns the electric potential at distance r from a point charge q.
@@ -37,3 +66,1416 @@ def field(q, r):
     q = float(q)
     r = float(r)
     return q / 4 / math.pi / const.eps_0 / r**2
+
+#### Batch evaluation over point clouds
+
+def _columns(points, name):
+    """
+    Converts point coordinates, given as one column per axis, to arrays.
+
+    @type  points: sequence
+    @param points: the (x, y) or (x, y, z) columns
+    @type    name: string
+    @param   name: name of the argument, for error messages
+
+    @rtype: list
+    @return: the columns, as arrays of floats
+    """
+    if len(points) not in (2, 3):
+        raise ValueError("%s must be 2 or 3 coordinate columns" % name)
+    columns = [array.array("d", col) for col in points]
+    for col in columns[1:]:
+        if len(col) != len(columns[0]):
+            raise ValueError("Coordinate columns of %s have different "
+                             "lengths" % name)
+    return columns
+
+def _backend(backend):
+    """
+    Checks the backend for batch evaluation.
+
+    @type  backend: string
+    @param backend: "numpy", "python" or None (NumPy if installed)
+
+    @rtype: string
+    @return: "numpy" or "python"
+    """
+    if backend is None:
+        backend = "numpy" if numpy is not None else "python"
+    if backend not in ("numpy", "python"):
+        raise ValueError("Unknown backend: %s" % backend)
+    if backend == "numpy" and numpy is None:
+        raise ValueError("NumPy backend requested, but NumPy is not "
+                         "installed")
+    return backend
+
+def _batch_python(kind, kq, sources, targets, softening):
+    """
+    Sums the potential or field of all sources at a chunk of targets, in pure
+    Python: each source costs one pass over the chunk with list operations.
+
+    @type       kind: string
+    @param      kind: "potential" or "field"
+    @type         kq: array.array
+    @param        kq: charges times Coulomb's constant
+    @type    sources: list
+    @param   sources: coordinate columns of the sources
+    @type    targets: list
+    @param   targets: coordinate columns of the targets
+    @type  softening: number
+    @param softening: softening length
+
+    @rtype: list
+    @return: potential array, or field component arrays
+    """
+    sqrt = math.sqrt
+    eps2 = softening * softening
+    m = len(targets[0])
+    points = list(zip(*targets))
+    if kind == "potential":
+        V = [0.0] * m
+    else:
+        E = [[0.0] * m for col in targets]
+    for k in range(len(kq)):
+        c = kq[k]
+        s = [col[k] for col in sources]
+        if len(s) == 2:
+            sx, sy = s
+            r2 = [(x - sx) * (x - sx) + (y - sy) * (y - sy) + eps2
+                  for x, y in points]
+        else:
+            sx, sy, sz = s
+            r2 = [(x - sx) * (x - sx) + (y - sy) * (y - sy)
+                  + (z - sz) * (z - sz) + eps2 for x, y, z in points]
+        # Targets at the source (without softening) get no contribution
+        if kind == "potential":
+            V = [v + c / sqrt(x) if x > 0.0 else v for v, x in zip(V, r2)]
+        else:
+            f = [c / (x * sqrt(x)) if x > 0.0 else 0.0 for x in r2]
+            for E_i, col, s_i in zip(E, targets, s):
+                E_i[:] = [e + (t - s_i) * g for e, t, g in zip(E_i, col, f)]
+    if kind == "potential":
+        return array.array("d", V)
+    return [array.array("d", E_i) for E_i in E]
+
+def _batch_numpy(kind, kq, sources, targets, softening):
+    """
+    Sums the potential or field of all sources at a chunk of targets, with
+    NumPy: the chunk is a (targets x sources) array operation.
+
+    @type       kind: string
+    @param      kind: "potential" or "field"
+    @type         kq: array.array
+    @param        kq: charges times Coulomb's constant
+    @type    sources: list
+    @param   sources: coordinate columns of the sources
+    @type    targets: list
+    @param   targets: coordinate columns of the targets
+    @type  softening: number
+    @param softening: softening length
+
+    @rtype: list
+    @return: potential array, or field component arrays
+    """
+    kq = numpy.frombuffer(kq)
+    d = [numpy.frombuffer(t)[:, None] - numpy.frombuffer(s)[None, :]
+         for t, s in zip(targets, sources)]
+    r2 = sum([col * col for col in d]) + softening * softening
+    # Targets at the source (without softening) get no contribution
+    inv_r = numpy.zeros_like(r2)
+    numpy.divide(1.0, numpy.sqrt(r2), out=inv_r, where=r2 > 0.0)
+    if kind == "potential":
+        return inv_r.dot(kq)
+    inv_r3 = inv_r**3 * kq
+    return [(col * inv_r3).sum(axis=1) for col in d]
+
+def _batch_chunks(task):
+    """
+    Evaluates the potential or field at a slice of the targets, chunk by
+    chunk (also run by the worker processes).
+
+    @type  task: tuple
+    @param task: kind, backend, charges times Coulomb's constant, sources,
+                 targets, softening and chunk size
+
+    @rtype: list
+    @return: potential array, or field component arrays
+    """
+    kind, backend, kq, sources, targets, softening, chunk_size = task
+    evaluate = _batch_numpy if backend == "numpy" else _batch_python
+    m = len(targets[0])
+    n_out = 1 if kind == "potential" else len(targets)
+    result = [array.array("d") for i in range(n_out)]
+    for start in range(0, m, chunk_size):
+        chunk = [col[start:start + chunk_size] for col in targets]
+        values = evaluate(kind, kq, sources, chunk, softening)
+        if kind == "potential":
+            values = [values]
+        for out, col in zip(result, values):
+            if backend == "numpy":
+                col = array.array("d", numpy.ascontiguousarray(col).tobytes())
+            out.extend(col)
+    return result
+
+def _batch(kind, charges, sources, targets, softening, eps, backend,
+           chunk_size, max_workers):
+    """
+    Evaluates the potential or field of point charges at many points (see
+    potential_batch() and field_batch()).
+    """
+    sources = _columns(sources, "sources")
+    targets = _columns(targets, "targets")
+    if len(sources) != len(targets):
+        raise ValueError("Sources and targets must have the same dimensions")
+    if len(charges) != len(sources[0]):
+        raise ValueError("Expected one charge per source")
+    backend = _backend(backend)
+    if chunk_size is None:
+        if backend == "numpy":
+            chunk_size = max(1, BATCH_NUMPY_ELEMS // max(1, len(charges)))
+        else:
+            chunk_size = BATCH_CHUNK
+    chunk_size = int(chunk_size)
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be at least 1")
+    max_workers = int(max_workers)
+    if max_workers < 1:
+        raise ValueError("max_workers must be at least 1")
+
+    k = 1.0 / (4.0 * math.pi * eps)
+    kq = array.array("d", [k * q for q in charges])
+    m = len(targets[0])
+    # Contiguous slices of the targets, one per worker
+    size = max(1, -(-m // max_workers))
+    tasks = [(kind, backend, kq, sources,
+              [col[start:start + size] for col in targets],
+              float(softening), chunk_size)
+             for start in range(0, m, size)]
+    if max_workers == 1 or len(tasks) <= 1:
+        results = [_batch_chunks(task) for task in tasks]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers) as pool:
+            results = list(pool.map(_batch_chunks, tasks))
+
+    n_out = 1 if kind == "potential" else len(targets)
+    columns = [array.array("d") for i in range(n_out)]
+    for result in results:
+        for col, part in zip(columns, result):
+            col.extend(part)
+    if backend == "numpy":
+        columns = [numpy.frombuffer(col) for col in columns]
+    if kind == "potential":
+        return columns[0]
+    return columns
+
+def potential_batch(charges, sources, targets, softening=0.0,
+                    eps=const.eps_0, backend=None, chunk_size=None,
+                    max_workers=1):
+    """
+    Returns the electric potential of a set of point charges at many target
+    points, in 2-D (points in a plane) or 3-D. The positions are given as one
+    column per axis, e.g. sources=(x, y, z). A target coinciding with a
+    source gets no contribution from it, unless the softening is nonzero.
+
+    The targets are processed in chunks, either with NumPy (a targets x
+    sources array operation per chunk) or in pure Python (one pass over the
+    chunk per source), and may be split among worker processes.
+
+    @type      charges: sequence
+    @param     charges: source charges [C]
+    @type      sources: sequence
+    @param     sources: coordinate columns of the sources [m]
+    @type      targets: sequence
+    @param     targets: coordinate columns of the targets [m]
+    @type    softening: number
+    @param   softening: softening length, replacing r with
+                        sqrt(r^2 + softening^2) [m]
+    @type          eps: number
+    @param         eps: permittivity [F/m] (default=eps_0)
+    @type      backend: string
+    @param     backend: "numpy" or "python" (default="numpy" if NumPy is
+                        installed, else "python")
+    @type   chunk_size: number
+    @param  chunk_size: number of targets per chunk (default=BATCH_CHUNK in
+                        pure Python; about BATCH_NUMPY_ELEMS / n_sources with
+                        NumPy)
+    @type  max_workers: number
+    @param max_workers: number of processes among which to split the targets
+                        (default=1, i.e. the calling process)
+
+    @rtype: array
+    @return: potential at each target [V] (array.array, or NumPy array with
+             the NumPy backend)
+    """
+    return _batch("potential", charges, sources, targets, softening, eps,
+                  backend, chunk_size, max_workers)
+
+def field_batch(charges, sources, targets, softening=0.0, eps=const.eps_0,
+                backend=None, chunk_size=None, max_workers=1):
+    """
+    Returns the electric field vector of a set of point charges at many
+    target points, in 2-D (points in a plane) or 3-D (see potential_batch()
+    for the arguments).
+
+    @type      charges: sequence
+    @param     charges: source charges [C]
+    @type      sources: sequence
+    @param     sources: coordinate columns of the sources [m]
+    @type      targets: sequence
+    @param     targets: coordinate columns of the targets [m]
+    @type    softening: number
+    @param   softening: softening length [m]
+    @type          eps: number
+    @param         eps: permittivity [F/m] (default=eps_0)
+    @type      backend: string
+    @param     backend: "numpy" or "python" (default="numpy" if NumPy is
+                        installed, else "python")
+    @type   chunk_size: number
+    @param  chunk_size: number of targets per chunk
+    @type  max_workers: number
+    @param max_workers: number of processes among which to split the targets
+
+    @rtype: list
+    @return: field components at each target, one array per axis [N/C]
+    """
+    return _batch("field", charges, sources, targets, softening, eps,
+                  backend, chunk_size, max_workers)
+
+#### Tree approximation (Barnes-Hut with multipole expansions)
+
+def _groups(targets, size):
+    """
+    Splits the targets into spatially compact groups, by recursive bisection
+    at the median of the widest axis.
+
+    @type  targets: list
+    @param targets: coordinate columns of the targets
+    @type     size: number
+    @param    size: maximum number of targets per group
+
+    @rtype: list
+    @return: lists of target indices
+    """
+    groups = []
+    stack = [list(range(len(targets[0])))]
+    while stack:
+        idx = stack.pop()
+        if len(idx) <= size:
+            groups.append(idx)
+            continue
+        spans = []
+        for col in targets:
+            values = [col[i] for i in idx]
+            spans.append(max(values) - min(values))
+        idx.sort(key=targets[spans.index(max(spans))].__getitem__)
+        stack.append(idx[:len(idx) // 2])
+        stack.append(idx[len(idx) // 2:])
+    return groups
+
+def _far_python(kind, nodes, points):
+    """
+    Evaluates the multipole expansions of the far nodes at a group of
+    targets, in pure Python.
+
+    @type   kind: string
+    @param  kind: "potential" or "field"
+    @type  nodes: list
+    @param nodes: (cx, cy, cz, q, px, py, pz, mxx, myy, mzz, mxy, mxz, myz,
+                  trace) of each node
+    @type points: list
+    @param points: (x, y, z) of each target
+
+    @rtype: list
+    @return: potential list, or field component lists
+    """
+    sqrt = math.sqrt
+    V = []
+    E = ([], [], [])
+    for x, y, z in points:
+        v = ex = ey = ez = 0.0
+        for (cx, cy, cz, q, px, py, pz, mxx, myy, mzz, mxy, mxz, myz,
+             tr) in nodes:
+            dx = x - cx
+            dy = y - cy
+            dz = z - cz
+            r2 = dx * dx + dy * dy + dz * dz
+            ir2 = 1.0 / r2
+            ir = sqrt(ir2)
+            pd = px * dx + py * dy + pz * dz
+            mrx = mxx * dx + mxy * dy + mxz * dz
+            mry = mxy * dx + myy * dy + myz * dz
+            mrz = mxz * dx + myz * dy + mzz * dz
+            rmr = dx * mrx + dy * mry + dz * mrz
+            if kind == "potential":
+                v += ir * (q + ir2 * (pd + 0.5 * ir2 * (3.0 * rmr - tr * r2)))
+            else:
+                ir3 = ir * ir2
+                ir5 = ir3 * ir2
+                s = (q * ir3 + 3.0 * pd * ir5
+                     + (7.5 * rmr * ir2 - 1.5 * tr) * ir5)
+                ex += s * dx - px * ir3 - 3.0 * mrx * ir5
+                ey += s * dy - py * ir3 - 3.0 * mry * ir5
+                ez += s * dz - pz * ir3 - 3.0 * mrz * ir5
+        V.append(v)
+        E[0].append(ex)
+        E[1].append(ey)
+        E[2].append(ez)
+    if kind == "potential":
+        return V
+    return list(E)
+
+def _far_numpy(kind, moments, points):
+    """
+    Evaluates the multipole expansions of the far nodes at a group of
+    targets, with NumPy (a targets x nodes array operation).
+
+    @type     kind: string
+    @param    kind: "potential" or "field"
+    @type  moments: list
+    @param moments: cx, cy, cz, q, px, py, pz, mxx, myy, mzz, mxy, mxz, myz
+                    and trace of the nodes, as arrays
+    @type   points: list
+    @param  points: x, y and z of the targets, as arrays
+
+    @rtype: list
+    @return: potential array, or field component arrays
+    """
+    cx, cy, cz, q, px, py, pz, mxx, myy, mzz, mxy, mxz, myz, tr = moments
+    dx = points[0][:, None] - cx
+    dy = points[1][:, None] - cy
+    dz = points[2][:, None] - cz
+    r2 = dx * dx + dy * dy + dz * dz
+    ir2 = 1.0 / r2
+    ir = numpy.sqrt(ir2)
+    pd = px * dx + py * dy + pz * dz
+    mrx = mxx * dx + mxy * dy + mxz * dz
+    mry = mxy * dx + myy * dy + myz * dz
+    mrz = mxz * dx + myz * dy + mzz * dz
+    rmr = dx * mrx + dy * mry + dz * mrz
+    if kind == "potential":
+        return (ir * (q + ir2 * (pd + 0.5 * ir2 * (3.0 * rmr - tr * r2)))
+                ).sum(axis=1)
+    ir3 = ir * ir2
+    ir5 = ir3 * ir2
+    s = q * ir3 + 3.0 * pd * ir5 + (7.5 * rmr * ir2 - 1.5 * tr) * ir5
+    return [(s * d - p * ir3 - 3.0 * mr * ir5).sum(axis=1)
+            for d, p, mr in ((dx, px, mrx), (dy, py, mry), (dz, pz, mrz))]
+
+class ChargeTree(object):
+    """
+    Barnes-Hut tree of point charges, in 2-D (a quadtree of points in a
+    plane) or 3-D (an octree). Each node is a square or cube, split until
+    each leaf holds at most leaf_size charges; the nodes are kept as columns
+    (structure of arrays), with the monopole, dipole and quadrupole moments
+    of their charges about their centres. As the charges may have either
+    sign, the expansions are taken about the geometric centres rather than
+    a centre of charge.
+
+    The potential or field at many targets is then summed in near-linear
+    time: the targets are split into compact groups, each of which walks the
+    tree once; nodes far from the whole group contribute by their multipole
+    expansions, and the charges of the other leaves by direct summation.
+
+    @type      charges: sequence
+    @param     charges: source charges [C]
+    @type      sources: sequence
+    @param     sources: coordinate columns of the sources, (x, y) or
+                        (x, y, z) [m]
+    @type          eps: number
+    @param         eps: permittivity [F/m] (default=eps_0)
+    @type    leaf_size: number
+    @param   leaf_size: maximum number of charges per leaf
+                        (default=TREE_LEAF_SIZE)
+    """
+    def __init__(self, charges, sources, eps=const.eps_0,
+                 leaf_size=TREE_LEAF_SIZE):
+        sources = _columns(sources, "sources")
+        n = len(charges)
+        if n == 0:
+            raise ValueError("Cannot build a tree without charges")
+        if n != len(sources[0]):
+            raise ValueError("Expected one charge per source")
+        if leaf_size < 1:
+            raise ValueError("leaf_size must be at least 1")
+        self.dim = len(sources)
+        if self.dim == 2:
+            sources.append(array.array("d", bytes(8 * n)))
+        k = 1.0 / (4.0 * math.pi * eps)
+        kq = array.array("d", [k * q for q in charges])
+
+        # Node columns: centre and half-width of the square or cube, range of
+        # the node's charges in the sorted order, index of the first child and
+        # number of children (0 for leaves)
+        self.centre = [array.array("d") for i in range(3)]
+        self.half = array.array("d")
+        self.start = array.array("l")
+        self.end = array.array("l")
+        self.child = array.array("l")
+        self.n_child = array.array("l")
+        # Moments of each node about its centre: the sums of q (charge),
+        # q * d_a (dipole px, py, pz) and q * d_a * d_b (second moments mxx,
+        # myy, mzz, mxy, mxz, myz) over its charges q at offsets d, times
+        # Coulomb's constant
+        self.moments = [array.array("d") for i in range(10)]
+
+        lo = [min(col) for col in sources]
+        hi = [max(col) for col in sources]
+        half = 0.5 * max([b - a for a, b in zip(lo, hi)])
+        half = half * (1 + 1e-12) or 1.0
+        self._new_node([0.5 * (a + b) for a, b in zip(lo, hi)], half, 0,
+                       range(n), kq, sources)
+
+        # Sort the charges so that each node covers a contiguous range
+        order = list(range(n))
+        stack = [(0, 0)]
+        while stack:
+            node, depth = stack.pop()
+            start, end = self.start[node], self.end[node]
+            if end - start <= leaf_size or depth >= TREE_MAX_DEPTH:
+                continue
+            c = [col[node] for col in self.centre]
+            octants = [[] for i in range(8)]
+            for i in order[start:end]:
+                octants[(sources[0][i] >= c[0]) | (sources[1][i] >= c[1]) << 1
+                        | (sources[2][i] >= c[2]) << 2].append(i)
+            half = 0.5 * self.half[node]
+            self.child[node] = len(self.half)
+            for octant, members in enumerate(octants):
+                if not members:
+                    continue
+                order[start:start + len(members)] = members
+                self._new_node([c[a] + (half if octant >> a & 1 else -half)
+                                for a in range(3)],
+                               half, start, members, kq, sources)
+                self.n_child[node] += 1
+                stack.append((len(self.half) - 1, depth + 1))
+                start += len(members)
+
+        # Charges and positions in the sorted order
+        self.kq = array.array("d", [kq[i] for i in order])
+        self.sources = [array.array("d", [col[i] for i in order])
+                        for col in sources]
+
+    def __len__(self):
+        """
+        Returns the number of nodes.
+
+        @rtype: number
+        @return: number of nodes
+        """
+        return len(self.half)
+
+    def _new_node(self, centre, half, start, idx, kq, sources):
+        """
+        Appends a leaf, computing its moments.
+
+        @type   centre: list
+        @param  centre: centre of the square or cube
+        @type     half: number
+        @param    half: half-width of the square or cube
+        @type    start: number
+        @param   start: index of its first charge, in the sorted order
+        @type      idx: sequence
+        @param     idx: indices of its charges
+        @type       kq: array
+        @param      kq: charges times Coulomb's constant
+        @type  sources: list
+        @param sources: coordinate columns of the charges
+        """
+        for col, c in zip(self.centre, centre):
+            col.append(c)
+        self.half.append(half)
+        self.start.append(start)
+        self.end.append(start + len(idx))
+        self.child.append(-1)
+        self.n_child.append(0)
+
+        q = [kq[i] for i in idx]
+        d = [[col[i] - c for i in idx] for col, c in zip(sources, centre)]
+        qd = [list(map(operator.mul, q, d_a)) for d_a in d]
+        values = [sum(q)] + [sum(qd_a) for qd_a in qd]
+        for a, b in ((0, 0), (1, 1), (2, 2), (0, 1), (0, 2), (1, 2)):
+            values.append(sum(map(operator.mul, qd[a], d[b])))
+        for col, value in zip(self.moments, values):
+            col.append(value)
+
+    def _interactions(self, centre, radius, theta):
+        """
+        Walks the tree for a group of targets within a sphere. A node of
+        width s is far if s / d < theta, d being the least distance from its
+        centre to the sphere.
+
+        @type  centre: list
+        @param centre: centre of the sphere
+        @type  radius: number
+        @param radius: radius of the sphere
+        @type   theta: number
+        @param  theta: opening angle
+
+        @rtype: tuple
+        @return: indices of the far nodes and of the near leaves
+        """
+        cx, cy, cz = self.centre
+        half, child, n_child = self.half, self.child, self.n_child
+        x, y, z = centre
+        far = []
+        near = []
+        stack = [0]
+        while stack:
+            k = stack.pop()
+            d = math.sqrt((cx[k] - x)**2 + (cy[k] - y)**2
+                          + (cz[k] - z)**2) - radius
+            if d > 0 and 2.0 * half[k] < theta * d:
+                far.append(k)
+            elif n_child[k] == 0:
+                near.append(k)
+            else:
+                stack.extend(range(child[k], child[k] + n_child[k]))
+        return far, near
+
+    def _evaluate(self, kind, targets, theta, order, backend, group_size):
+        """
+        Sums the potential or field at the targets (see potential() and
+        field()).
+        """
+        targets = _columns(targets, "targets")
+        if len(targets) != self.dim:
+            raise ValueError("Sources and targets must have the same "
+                             "dimensions")
+        if order not in (0, 1, 2):
+            raise ValueError("order must be 0, 1 or 2")
+        if theta < 0:
+            raise ValueError("theta must not be negative")
+        if group_size < 1:
+            raise ValueError("group_size must be at least 1")
+        backend = _backend(backend)
+        m = len(targets[0])
+        if m == 0:
+            result = [array.array("d") for i in range(self.dim)]
+            if backend == "numpy":
+                result = [numpy.frombuffer(col) for col in result]
+            return result[0] if kind == "potential" else result
+        if self.dim == 2:
+            targets.append(array.array("d", bytes(8 * m)))
+
+        # Node columns for the expansions, up to the given order
+        n_moments = (1, 4, 10)[order]
+        moments = self.centre + self.moments[:n_moments]
+        moments += [array.array("d", bytes(8 * len(self)))] * (10 - n_moments)
+        trace = [a + b + c for a, b, c in zip(*moments[7:10])]
+        moments.append(array.array("d", trace))
+        if backend == "numpy":
+            moments = [numpy.frombuffer(col) for col in moments]
+        else:
+            moments = list(zip(*moments))
+
+        n_out = 1 if kind == "potential" else 3
+        result = [array.array("d", bytes(8 * m)) for i in range(n_out)]
+        evaluate = _batch_numpy if backend == "numpy" else _batch_python
+        for idx in _groups(targets, group_size):
+            points = [array.array("d", [col[i] for i in idx])
+                      for col in targets]
+            lo = [min(col) for col in points]
+            hi = [max(col) for col in points]
+            centre = [0.5 * (a + b) for a, b in zip(lo, hi)]
+            radius = 0.5 * math.sqrt(sum([(b - a)**2
+                                          for a, b in zip(lo, hi)]))
+            far, near = self._interactions(centre, radius, theta)
+
+            # Near field: direct sum over the charges of the near leaves
+            kq = array.array("d")
+            sources = [array.array("d") for i in range(3)]
+            for k in near:
+                start, end = self.start[k], self.end[k]
+                kq.extend(self.kq[start:end])
+                for col, src in zip(sources, self.sources):
+                    col.extend(src[start:end])
+            values = evaluate(kind, kq, sources, points, 0.0)
+            if kind == "potential":
+                values = [values]
+
+            # Far field: multipole expansions of the far nodes
+            if not far:
+                far_values = [[0.0] * len(idx)] * n_out
+            elif backend == "numpy":
+                far_values = _far_numpy(
+                    kind, [col[numpy.array(far)] for col in moments],
+                    [numpy.frombuffer(col) for col in points])
+            else:
+                far_values = _far_python(kind, [moments[k] for k in far],
+                                         list(zip(*points)))
+            if kind == "potential" and far:
+                far_values = [far_values]
+
+            for col, near_col, far_col in zip(result, values, far_values):
+                for i, a, b in zip(idx, near_col, far_col):
+                    col[i] = a + b
+
+        if backend == "numpy":
+            result = [numpy.frombuffer(col) for col in result]
+        if kind == "potential":
+            return result[0]
+        return result[:self.dim]
+
+    def potential(self, targets, theta=TREE_THETA, order=2, backend=None,
+                  group_size=TREE_GROUP_SIZE):
+        """
+        Returns the electric potential of the charges at many target points.
+        A target coinciding with a charge gets no contribution from it.
+
+        The accuracy is set by the opening angle theta: a node of width s at
+        least a distance d from all targets of a group is replaced by its
+        multipole expansion if s / d < theta. The error falls roughly as
+        theta^(order + 1); theta=0 gives the direct sum.
+
+        @type      targets: sequence
+        @param     targets: coordinate columns of the targets [m]
+        @type        theta: number
+        @param       theta: opening angle (default=TREE_THETA)
+        @type        order: number
+        @param       order: order of the expansions: 0 (monopole), 1
+                            (dipole) or 2 (quadrupole) (default=2)
+        @type      backend: string
+        @param     backend: "numpy" or "python" (default="numpy" if NumPy is
+                            installed, else "python")
+        @type   group_size: number
+        @param  group_size: maximum number of targets per group
+                            (default=TREE_GROUP_SIZE)
+
+        @rtype: array
+        @return: potential at each target [V] (array.array, or NumPy array
+                 with the NumPy backend)
+        """
+        return self._evaluate("potential", targets, theta, order, backend,
+                              group_size)
+
+    def field(self, targets, theta=TREE_THETA, order=2, backend=None,
+              group_size=TREE_GROUP_SIZE):
+        """
+        Returns the electric field vector of the charges at many target
+        points (see potential() for the arguments).
+
+        @type      targets: sequence
+        @param     targets: coordinate columns of the targets [m]
+        @type        theta: number
+        @param       theta: opening angle (default=TREE_THETA)
+        @type        order: number
+        @param       order: order of the expansions (default=2)
+        @type      backend: string
+        @param     backend: "numpy" or "python"
+        @type   group_size: number
+        @param  group_size: maximum number of targets per group
+
+        @rtype: list
+        @return: field components at each target, one array per axis [N/C]
+        """
+        return self._evaluate("field", targets, theta, order, backend,
+                              group_size)
+
+    def error(self, targets, kind="potential", theta=TREE_THETA, order=2,
+              sample=TREE_ERROR_SAMPLE, backend=None,
+              group_size=TREE_GROUP_SIZE):
+        """
+        Reports the error of the tree approximation against direct summation,
+        at up to sample targets (evenly spaced in the given order). The errors
+        are relative to the root mean square magnitude of the exact potential
+        or field over those targets, so that targets where it nearly cancels
+        do not dominate.
+
+        @type     targets: sequence
+        @param    targets: coordinate columns of the targets [m]
+        @type        kind: string
+        @param       kind: "potential" or "field"
+        @type       theta: number
+        @param      theta: opening angle (default=TREE_THETA)
+        @type       order: number
+        @param      order: order of the expansions (default=2)
+        @type      sample: number
+        @param     sample: maximum number of targets to compare
+                           (default=TREE_ERROR_SAMPLE)
+        @type     backend: string
+        @param    backend: "numpy" or "python"
+        @type  group_size: number
+        @param group_size: maximum number of targets per group
+
+        @rtype: dict
+        @return: "max" and "rms" relative errors, and "n_targets" compared
+        """
+        if kind not in ("potential", "field"):
+            raise ValueError("Unknown kind: %s" % kind)
+        if sample < 1:
+            raise ValueError("sample must be at least 1")
+        targets = _columns(targets, "targets")
+        if len(targets[0]) == 0:
+            raise ValueError("Cannot report the error without targets")
+        step = max(1, -(-len(targets[0]) // sample))
+        targets = [col[::step] for col in targets]
+        approx = self._evaluate(kind, targets, theta, order, backend,
+                                group_size)
+        exact = _batch_chunks((kind, _backend(backend), self.kq,
+                               self.sources[:self.dim], targets, 0.0,
+                               BATCH_CHUNK))
+        if kind == "potential":
+            approx = [approx]
+        # Squared norms of the exact values and of the errors, per target
+        norm2 = [0.0] * len(targets[0])
+        err2 = [0.0] * len(targets[0])
+        for a_col, e_col in zip(approx, exact):
+            norm2 = [s + e * e for s, e in zip(norm2, e_col)]
+            err2 = [s + (a - e)**2 for s, a, e in zip(err2, a_col, e_col)]
+        scale = math.sqrt(sum(norm2) / len(norm2)) or 1.0
+        return {"max": math.sqrt(max(err2)) / scale,
+                "rms": math.sqrt(sum(err2) / len(err2)) / scale,
+                "n_targets": len(err2)}
+
+def potential_tree(charges, sources, targets, theta=TREE_THETA, order=2,
+                   eps=const.eps_0, backend=None):
+    """
+    Returns the electric potential of many point charges at many target
+    points with a Barnes-Hut tree, in O((M + K) log K) operations (see
+    ChargeTree). Best for large numbers of charges; use ChargeTree.error()
+    to check the accuracy against potential_batch().
+
+    @type  charges: sequence
+    @param charges: source charges [C]
+    @type  sources: sequence
+    @param sources: coordinate columns of the sources [m]
+    @type  targets: sequence
+    @param targets: coordinate columns of the targets [m]
+    @type    theta: number
+    @param   theta: opening angle (default=TREE_THETA)
+    @type    order: number
+    @param   order: order of the expansions (default=2)
+    @type      eps: number
+    @param     eps: permittivity [F/m] (default=eps_0)
+    @type  backend: string
+    @param backend: "numpy" or "python"
+
+    @rtype: array
+    @return: potential at each target [V]
+    """
+    return ChargeTree(charges, sources, eps).potential(targets, theta, order,
+                                                       backend)
+
+def field_tree(charges, sources, targets, theta=TREE_THETA, order=2,
+               eps=const.eps_0, backend=None):
+    """
+    Returns the electric field vector of many point charges at many target
+    points with a Barnes-Hut tree (see potential_tree()).
+
+    @type  charges: sequence
+    @param charges: source charges [C]
+    @type  sources: sequence
+    @param sources: coordinate columns of the sources [m]
+    @type  targets: sequence
+    @param targets: coordinate columns of the targets [m]
+    @type    theta: number
+    @param   theta: opening angle (default=TREE_THETA)
+    @type    order: number
+    @param   order: order of the expansions (default=2)
+    @type      eps: number
+    @param     eps: permittivity [F/m] (default=eps_0)
+    @type  backend: string
+    @param backend: "numpy" or "python"
+
+    @rtype: list
+    @return: field components at each target, one array per axis [N/C]
+    """
+    return ChargeTree(charges, sources, eps).field(targets, theta, order,
+                                                   backend)
+
+#### Grid solver for Poisson's equation
+
+# Faces of the grid, as (axis, side), with side 0 at index 0 and 1 at the end
+FACES = {"x-": (0, 0), "x+": (0, 1), "y-": (1, 0), "y+": (1, 1),
+         "z-": (2, 0), "z+": (2, 1)}
+
+def _zeros(n):
+    """
+    Returns an array of n zeros.
+
+    @type  n: number
+    @param n: number of elements
+
+    @rtype: array.array
+    @return: the zeros
+    """
+    return array.array("d", bytes(array.array("d").itemsize * n))
+
+class _Level(object):
+    """
+    A level of the multigrid hierarchy: the geometry of the grid, and the
+    layout of the lines of nodes along the last axis, which the kernels
+    update with whole-line slices.
+
+    @type    shape: tuple
+    @param   shape: number of nodes along each axis
+    @type  spacing: number
+    @param spacing: distance between nodes
+    @type  neumann: list
+    @param neumann: for each axis, whether the (low, high) faces are Neumann
+                    boundaries (otherwise Dirichlet)
+    @type    ghost: list
+    @param   ghost: for each axis, the (low, high) offsets of the ghost nodes
+                    beyond Neumann faces from their mirror images, 2h dV/dn
+    """
+    def __init__(self, shape, spacing, neumann, ghost):
+        self.shape = shape
+        self.spacing = spacing
+        self.neumann = neumann
+        self.ghost = ghost
+        self.n_nodes = 1
+        for n in shape:
+            self.n_nodes *= n
+        n = shape[-1]
+        self.n = n
+        # Range of the unknown nodes along each line
+        self.k_lo = 0 if neumann[-1][0] else 1
+        self.k_hi = n - 1 if neumann[-1][1] else n - 2
+
+        # Each line of unknown nodes, as (offset, parity of the sum of its
+        # indices, offsets of the neighbouring lines, sum of the ghost
+        # offsets); lines on Dirichlet faces are fixed
+        self.lines = []
+        outer = shape[:-1]
+        strides = [1] * len(outer)
+        for a in range(len(outer) - 2, -1, -1):
+            strides[a] = strides[a + 1] * outer[a + 1]
+        n_lines = self.n_nodes // n
+        for line in range(n_lines):
+            idx = [(line // strides[a]) % outer[a] for a in range(len(outer))]
+            neighbours = []
+            const = 0.0
+            fixed = False
+            for a, i in enumerate(idx):
+                for side, step in ((0, -1), (1, 1)):
+                    j = i + step
+                    if 0 <= j < outer[a]:
+                        neighbours.append((line + step * strides[a]) * n)
+                    elif neumann[a][side]:
+                        # Ghost line: the mirror image, offset
+                        neighbours.append((line - step * strides[a]) * n)
+                        const += ghost[a][side]
+                    else:
+                        fixed = True
+            if not fixed:
+                self.lines.append((line * n, sum(idx) % 2, neighbours, const))
+
+    def coarsened(self):
+        """
+        Returns the next coarser level (every other node), with homogeneous
+        boundary conditions for the correction, or None if the grid cannot be
+        coarsened.
+
+        @rtype: _Level
+        @return: the coarser level
+        """
+        for n in self.shape:
+            if (n - 1) % 2 != 0 or n < 5:
+                return None
+        return _Level(tuple((n - 1) // 2 + 1 for n in self.shape),
+                      2.0 * self.spacing, self.neumann,
+                      [(0.0, 0.0) for a in self.shape])
+
+    def smooth(self, V, hb, omega, colours=(0, 1)):
+        """
+        Performs a red-black Gauss-Seidel sweep over the unknown nodes, in
+        place, over-relaxed by omega: the nodes whose indices sum to an even
+        number first, then the odd ones. Nodes of one colour only depend on
+        nodes of the other, so each line is updated with whole slices.
+
+        @type        V: array.array
+        @param       V: potential
+        @type       hb: array.array
+        @param      hb: h^2 times the RHS of the discrete equations
+        @type    omega: number
+        @param   omega: relaxation parameter
+        @type  colours: tuple
+        @param colours: colours to update, in order
+        """
+        add = operator.add
+        n = self.n
+        inv = 1.0 / (2 * len(self.shape))
+        g_lo, g_hi = self.ghost[-1]
+        for colour in colours:
+            for off, parity, neighbours, const in self.lines:
+                # Interior of the line, every other node
+                ka = 1 if (parity + 1) % 2 == colour else 2
+                kb = n - 2 if (parity + n - 2) % 2 == colour else n - 3
+                if ka <= kb:
+                    acc = list(map(add, V[off + ka - 1:off + kb:2],
+                                   V[off + ka + 1:off + kb + 2:2]))
+                    for nb in neighbours:
+                        acc = list(map(add, acc, V[nb + ka:nb + kb + 1:2]))
+                    part = slice(off + ka, off + kb + 1, 2)
+                    if omega == 1.0:
+                        V[part] = array.array(
+                            "d", [(s + f + const) * inv
+                                  for s, f in zip(acc, hb[part])])
+                    else:
+                        V[part] = array.array(
+                            "d", [v + omega * ((s + f + const) * inv - v)
+                                  for v, s, f in zip(V[part], acc, hb[part])])
+                # Ends of the line on Neumann faces
+                for k, mirror, g in ((0, 1, g_lo), (n - 1, n - 2, g_hi)):
+                    if ((parity + k) % 2 != colour
+                            or not self.k_lo <= k <= self.k_hi):
+                        continue
+                    s = 2.0 * V[off + mirror] + g + const + hb[off + k]
+                    for nb in neighbours:
+                        s += V[nb + k]
+                    V[off + k] += omega * (s * inv - V[off + k])
+
+    def residual(self, V, b):
+        """
+        Computes the residual b - A V of the discrete equations, which is
+        zero at fixed nodes.
+
+        @type  V: array.array
+        @param V: potential
+        @type  b: array.array
+        @param b: RHS of the discrete equations
+
+        @rtype: array.array
+        @return: residual
+        """
+        add = operator.add
+        n = self.n
+        two_d = 2 * len(self.shape)
+        inv_h2 = 1.0 / self.spacing**2
+        g_lo, g_hi = self.ghost[-1]
+        r = _zeros(self.n_nodes)
+        for off, parity, neighbours, const in self.lines:
+            acc = list(map(add, V[off:off + n - 2], V[off + 2:off + n]))
+            for nb in neighbours:
+                acc = list(map(add, acc, V[nb + 1:nb + n - 1]))
+            part = slice(off + 1, off + n - 1)
+            r[part] = array.array(
+                "d", [f - (two_d * v - s - const) * inv_h2
+                      for v, s, f in zip(V[part], acc, b[part])])
+            for k, mirror, g in ((0, 1, g_lo), (n - 1, n - 2, g_hi)):
+                if not self.k_lo <= k <= self.k_hi:
+                    continue
+                s = 2.0 * V[off + mirror] + g + const
+                for nb in neighbours:
+                    s += V[nb + k]
+                r[off + k] = b[off + k] - (two_d * V[off + k] - s) * inv_h2
+        return r
+
+def _norm(x):
+    """
+    Returns the Euclidean norm of an array.
+
+    @type  x: array.array
+    @param x: the array
+
+    @rtype: number
+    @return: the norm
+    """
+    return math.sqrt(sum(map(operator.mul, x, x)))
+
+def _restrict(data, shape):
+    """
+    Restricts a grid function to the next coarser grid by full weighting,
+    applying the 1-D stencil (1/4, 1/2, 1/4) along each axis in turn. Beyond
+    the faces the grid function is mirrored.
+
+    @type   data: array.array
+    @param  data: fine grid function
+    @type  shape: tuple
+    @param shape: fine grid shape
+
+    @rtype: array.array
+    @return: coarse grid function
+    """
+    for axis in range(len(shape)):
+        n = shape[axis]
+        nc = (n - 1) // 2 + 1
+        inner = 1
+        for m in shape[axis + 1:]:
+            inner *= m
+        outer = len(data) // (n * inner)
+        result = array.array("d")
+        for o in range(outer):
+            if inner == 1:
+                line = data[o * n:(o + 1) * n]
+                result.append(0.5 * (line[0] + line[1]))
+                result.extend(array.array(
+                    "d", [0.25 * a + 0.5 * b + 0.25 * c for a, b, c
+                          in zip(line[1:n - 2:2], line[2:n - 1:2],
+                                 line[3:n:2])]))
+                result.append(0.5 * (line[n - 2] + line[n - 1]))
+                continue
+            slab = lambda k: data[(o * n + k) * inner:(o * n + k + 1) * inner]
+            for i in range(nc):
+                k = 2 * i
+                lo = k - 1 if k > 0 else 1
+                hi = k + 1 if k < n - 1 else n - 2
+                result.extend(array.array(
+                    "d", [0.25 * a + 0.5 * b + 0.25 * c for a, b, c
+                          in zip(slab(lo), slab(k), slab(hi))]))
+        data = result
+        shape = shape[:axis] + (nc,) + shape[axis + 1:]
+    return data
+
+def _prolong(data, shape):
+    """
+    Interpolates a grid function to the next finer grid, linearly along each
+    axis in turn.
+
+    @type   data: array.array
+    @param  data: coarse grid function
+    @type  shape: tuple
+    @param shape: coarse grid shape
+
+    @rtype: array.array
+    @return: fine grid function
+    """
+    for axis in range(len(shape)):
+        n = shape[axis]
+        nf = 2 * (n - 1) + 1
+        inner = 1
+        for m in shape[axis + 1:]:
+            inner *= m
+        outer = len(data) // (n * inner)
+        result = array.array("d")
+        for o in range(outer):
+            if inner == 1:
+                line = data[o * n:(o + 1) * n]
+                fine = _zeros(nf)
+                fine[0::2] = line
+                fine[1::2] = array.array(
+                    "d", [0.5 * (a + b) for a, b in zip(line[:-1], line[1:])])
+                result.extend(fine)
+                continue
+            for i in range(n):
+                slab = data[(o * n + i) * inner:(o * n + i + 1) * inner]
+                result.extend(slab)
+                if i < n - 1:
+                    slab_next = data[(o * n + i + 1) * inner:
+                                     (o * n + i + 2) * inner]
+                    result.extend(array.array(
+                        "d", [0.5 * (a + b) for a, b in zip(slab, slab_next)]))
+        data = result
+        shape = shape[:axis] + (nf,) + shape[axis + 1:]
+    return data
+
+class PoissonGrid(object):
+    """
+    Solves Poisson's equation for the electric potential,
+    laplacian(V) = -rho / eps, on a uniform 2-D or 3-D grid of nodes, with
+    second-order finite differences. (In 2-D, the charge density is per unit
+    area and the sources are lines of charge along z.)
+
+    Each face of the grid is either a Dirichlet boundary, where the potential
+    is fixed (by default to zero), or a Neumann boundary, where its outward
+    normal derivative dV/dn (minus the normal electric field) is given. At
+    least one face must be Dirichlet for the potential to be unique.
+
+    The potential and charge density are flat arrays of floats in row-major
+    order (see index()). The equations are solved by red-black SOR, or by
+    geometric multigrid V-cycles, whose cost is O(N) for N nodes; multigrid
+    coarsens the grid as long as every axis has an odd number of nodes, so
+    it needs m * 2^k + 1 nodes per axis with small m (e.g. 513 x 513, or
+    97 x 49), and rejects grids that stay too fine to be solved directly
+    (e.g. 512 x 512).
+
+    @type    shape: tuple
+    @param   shape: number of nodes along each axis (2 or 3 axes, at least 3
+                    nodes each)
+    @type  spacing: number
+    @param spacing: distance between nodes [m]
+    @type      eps: number
+    @param     eps: permittivity [F/m] (default=eps_0)
+    """
+    def __init__(self, shape, spacing, eps=const.eps_0):
+        shape = tuple(int(n) for n in shape)
+        if len(shape) not in (2, 3):
+            raise ValueError("Grid must be 2-D or 3-D")
+        for n in shape:
+            if n < 3:
+                raise ValueError("Grid must have at least 3 nodes per axis")
+        self.shape = shape
+        self.spacing = float(spacing)
+        self.eps = float(eps)
+        self.n_nodes = 1
+        for n in shape:
+            self.n_nodes *= n
+        # Charge density [C/m^3] and potential [V] at each node
+        self.rho = _zeros(self.n_nodes)
+        self.V = _zeros(self.n_nodes)
+        # Kind ("dirichlet" or "neumann") and value of each boundary
+        self.boundary = [[("dirichlet", 0.0), ("dirichlet", 0.0)]
+                         for n in shape]
+
+    def index(self, *idx):
+        """
+        Returns the position of a node in the flat arrays.
+
+        @type  idx: tuple
+        @param idx: index of the node along each axis
+
+        @rtype: number
+        @return: position in V and rho
+        """
+        if len(idx) != len(self.shape):
+            raise ValueError("Expected %d indices" % len(self.shape))
+        pos = 0
+        for i, n in zip(idx, self.shape):
+            if not 0 <= i < n:
+                raise IndexError("Node index out of bounds")
+            pos = pos * n + i
+        return pos
+
+    def _face_nodes(self, axis, side):
+        """
+        Returns the positions of the nodes on a face.
+
+        @type  axis: number
+        @param axis: axis normal to the face
+        @type  side: number
+        @param side: 0 for the face at index 0, 1 for the face at the end
+
+        @rtype: list
+        @return: positions in the flat arrays
+        """
+        ranges = [range(n) for n in self.shape]
+        ranges[axis] = [0 if side == 0 else self.shape[axis] - 1]
+        return [self.index(*idx) for idx in itertools.product(*ranges)]
+
+    def set_boundary(self, face, kind, value=0.0):
+        """
+        Sets the boundary condition on a face of the grid.
+
+        For a Dirichlet face, value is the potential on the face, which is
+        written into V; with value=None, the values already in V are kept, so
+        that the potential can vary along the face. For a Neumann face, value
+        is the outward normal derivative of the potential, dV/dn [V/m].
+
+        @type   face: string
+        @param  face: "x-", "x+", "y-", "y+" (and "z-", "z+" in 3-D)
+        @type   kind: string
+        @param  kind: "dirichlet" or "neumann"
+        @type  value: number
+        @param value: potential [V], or normal derivative [V/m]
+        """
+        if face not in FACES or FACES[face][0] >= len(self.shape):
+            raise ValueError("Unknown face: %s" % face)
+        if kind not in ("dirichlet", "neumann"):
+            raise ValueError("Unknown boundary condition: %s" % kind)
+        axis, side = FACES[face]
+        if kind == "dirichlet" and value is not None:
+            for pos in self._face_nodes(axis, side):
+                self.V[pos] = value
+        if kind == "neumann" and value is None:
+            value = 0.0
+        self.boundary[axis][side] = (kind, value)
+
+    def add_point_charge(self, q, idx):
+        """
+        Adds a point charge at a node, as a charge density over the volume
+        (area in 2-D) of one grid cell.
+
+        @type    q: number
+        @param   q: charge [C] (per unit length in 2-D [C/m])
+        @type  idx: tuple
+        @param idx: index of the node along each axis
+        """
+        self.rho[self.index(*idx)] += q / self.spacing**len(self.shape)
+
+    def _level(self):
+        """
+        Returns the finest level of the multigrid hierarchy, with the current
+        boundary conditions.
+
+        @rtype: _Level
+        @return: the finest level
+        """
+        neumann = [tuple(kind == "neumann" for kind, value in faces)
+                   for faces in self.boundary]
+        if all([all(flags) for flags in neumann]):
+            raise ValueError("At least one face must be a Dirichlet boundary")
+        ghost = [tuple(2.0 * self.spacing * value if kind == "neumann" else 0.0
+                       for kind, value in faces)
+                 for faces in self.boundary]
+        return _Level(self.shape, self.spacing, neumann, ghost)
+
+    def residual_norm(self):
+        """
+        Returns the Euclidean norm of the residual of the discrete equations,
+        in units of the charge density over the permittivity [V/m^2].
+
+        @rtype: number
+        @return: residual norm
+        """
+        b = array.array("d", [r / self.eps for r in self.rho])
+        return _norm(self._level().residual(self.V, b))
+
+    def sor(self, omega=None, delta=1e-8, max_iter=100000):
+        """
+        Solves for the potential by red-black successive over-relaxation,
+        starting from the current V. With the optimal omega, the number of
+        sweeps grows with the number of nodes along an axis.
+
+        @type     omega: number
+        @param    omega: relaxation parameter, 0 < omega < 2 (default=the
+                         optimum for the Laplacian on the grid)
+        @type     delta: number
+        @param    delta: desired reduction of the residual norm
+        @type  max_iter: number
+        @param max_iter: maximum number of sweeps
+
+        @rtype: number
+        @return: number of sweeps
+        """
+        if omega is None:
+            omega = 2.0 / (1.0 + math.sin(math.pi / max(self.shape)))
+        if not 0.0 < omega < 2.0:
+            raise ValueError("omega must be between 0 and 2")
+        level = self._level()
+        b = array.array("d", [r / self.eps for r in self.rho])
+        hb = array.array("d", [self.spacing**2 * f for f in b])
+        tol = delta * _norm(level.residual(self.V, b))
+        n_iter = 0
+        # The residual costs about as much as a sweep, so it is checked
+        # every few sweeps
+        while _norm(level.residual(self.V, b)) > tol:
+            if n_iter >= max_iter:
+                raise ValueError("SOR iterations did not converge")
+            for i in range(min(10, max_iter - n_iter)):
+                level.smooth(self.V, hb, omega)
+                n_iter += 1
+        return n_iter
+
+    def multigrid(self, delta=1e-8, max_cycles=100, n_smooth=2):
+        """
+        Solves for the potential by geometric multigrid V-cycles, starting
+        from the current V. Each cycle smooths the error with red-black
+        Gauss-Seidel sweeps, and corrects the smooth remainder on coarser
+        grids; it costs O(N), and reduces the residual by a roughly constant
+        factor (about 10 for the default smoothing) independent of the grid
+        size.
+
+        The grid must coarsen down to at most MULTIGRID_MAX_COARSE nodes
+        along each axis (see the class docstring); otherwise the coarsest
+        grid would cost more than the cycles, and a ValueError is raised.
+
+        @type       delta: number
+        @param      delta: desired reduction of the residual norm
+        @type  max_cycles: number
+        @param max_cycles: maximum number of V-cycles
+        @type    n_smooth: number
+        @param   n_smooth: number of smoothing sweeps before and after each
+                           coarse-grid correction
+
+        @rtype: number
+        @return: number of V-cycles
+        """
+        levels = [self._level()]
+        while True:
+            coarse = levels[-1].coarsened()
+            if coarse is None:
+                break
+            levels.append(coarse)
+        if max(levels[-1].shape) > MULTIGRID_MAX_COARSE:
+            raise ValueError("Grid of shape %s only coarsens to %s; multigrid "
+                             "needs m * 2^k + 1 nodes per axis with small m "
+                             "(e.g. 513), or use sor()"
+                             % (self.shape, levels[-1].shape))
+        b = array.array("d", [r / self.eps for r in self.rho])
+        tol = delta * _norm(levels[0].residual(self.V, b))
+        for n_cycles in range(max_cycles + 1):
+            if _norm(levels[0].residual(self.V, b)) <= tol:
+                return n_cycles
+            if n_cycles == max_cycles:
+                break
+            self._vcycle(levels, 0, self.V, b, n_smooth)
+        raise ValueError("Multigrid did not converge")
+
+    def _vcycle(self, levels, depth, V, b, n_smooth):
+        """
+        Performs a V-cycle from a level of the hierarchy, in place.
+
+        @type      levels: list
+        @param     levels: the multigrid hierarchy
+        @type       depth: number
+        @param      depth: index of the level
+        @type           V: array.array
+        @param          V: potential (or its correction, on coarse levels)
+        @type           b: array.array
+        @param          b: RHS of the discrete equations on the level
+        @type    n_smooth: number
+        @param   n_smooth: number of smoothing sweeps
+        """
+        level = levels[depth]
+        h2 = level.spacing**2
+        hb = array.array("d", [h2 * f for f in b])
+        if depth == len(levels) - 1:
+            # Coarsest grid: solve by SOR
+            omega = 2.0 / (1.0 + math.sin(math.pi / max(level.shape)))
+            r0 = _norm(level.residual(V, b))
+            for i in range(100 * max(level.shape)):
+                level.smooth(V, hb, omega)
+                if i % 10 == 9 and _norm(level.residual(V, b)) <= 1e-6 * r0:
+                    break
+            return
+        for i in range(n_smooth):
+            level.smooth(V, hb, 1.0)
+        r = _restrict(level.residual(V, b), level.shape)
+        e = _zeros(levels[depth + 1].n_nodes)
+        self._vcycle(levels, depth + 1, e, r, n_smooth)
+        V[:] = array.array("d", map(operator.add, V,
+                                    _prolong(e, levels[depth + 1].shape)))
+        for i in range(n_smooth):
+            level.smooth(V, hb, 1.0, (1, 0))
+
+    def field(self):
+        """
+        Computes the electric field E = -grad(V) at every node, by central
+        differences inside the grid and second-order one-sided differences
+        on the faces.
+
+        @rtype: list
+        @return: flat arrays of the field components along each axis [V/m]
+        """
+        components = []
+        shape = self.shape
+        h = self.spacing
+        for axis in range(len(shape)):
+            n = shape[axis]
+            inner = 1
+            for m in shape[axis + 1:]:
+                inner *= m
+            outer = self.n_nodes // (n * inner)
+            E = _zeros(self.n_nodes)
+            V = self.V
+            for o in range(outer):
+                if inner == 1:
+                    line = V[o * n:(o + 1) * n]
+                    E[o * n] = -(-1.5 * line[0] + 2.0 * line[1]
+                                 - 0.5 * line[2]) / h
+                    E[o * n + 1:(o + 1) * n - 1] = array.array(
+                        "d", [0.5 * (a - b) / h
+                              for a, b in zip(line[:n - 2], line[2:])])
+                    E[(o + 1) * n - 1] = -(1.5 * line[n - 1]
+                                           - 2.0 * line[n - 2]
+                                           + 0.5 * line[n - 3]) / h
+                    continue
+                slab = lambda k: V[(o * n + k) * inner:(o * n + k + 1) * inner]
+                for k in range(n):
+                    if k == 0:
+                        terms = ((-1.5, slab(0)), (2.0, slab(1)),
+                                 (-0.5, slab(2)))
+                    elif k == n - 1:
+                        terms = ((1.5, slab(n - 1)), (-2.0, slab(n - 2)),
+                                 (0.5, slab(n - 3)))
+                    else:
+                        terms = ((0.5, slab(k + 1)), (-0.5, slab(k - 1)))
+                    grad = [0.0] * inner
+                    for c, values in terms:
+                        grad = [g + c * v for g, v in zip(grad, values)]
+                    start = (o * n + k) * inner
+                    E[start:start + inner] = array.array(
+                        "d", [-g / h for g in grad])
+            components.append(E)
+        return components
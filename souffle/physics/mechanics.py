@@ -71,6 +71,34 @@ def nonlinear_pendulum(t, X, **kwargs):
     X_dot = [theta_dot, omega_dot]
     return dtt.Vector(X_dot)
 
+def nonlinear_pendulum_accel(t, Q, **kwargs):
+    """
+    The angular acceleration of the nonlinear pendulum, i.e. the velocity
+    half of nonlinear_pendulum(), for the symplectic integrators in
+    souffle.math.odeint.
+
+    @type  t: number
+    @param t: current time
+    @type  Q: vector
+    @param Q: current angle
+
+    @rtype: vector
+    @return: angular acceleration
+    """
+    theta = Q[0]
+
+    if len(kwargs) == 0:
+        omega_dot = (-(const.g / NONLINPEND_L)
+                     * math.sin(theta))
+    elif len(kwargs) != 1:
+        raise ValueError("Bad kwargs; please provide all of the "\
+                         "following parameters: l")
+    else:
+        omega_dot = (-(const.g / kwargs["l"])
+                     * math.sin(theta))
+
+    return dtt.Vector([omega_dot])
+
 def driven_pendulum(t, X, **kwargs):
     """
     The driven pendulum. Adds an oscillatory force exerted on the mass to the
@@ -112,6 +140,77 @@ def driven_pendulum(t, X, **kwargs):
     X_dot = [theta_dot, omega_dot]
     return dtt.Vector(X_dot)
 
+class _NonlinearPendulum(object):
+    """
+    The nonlinear pendulum with bound parameters (see
+    make_nonlinear_pendulum()).
+    """
+    accepts_out = True
+
+    def __init__(self, l):
+        self.g_l = const.g / float(l)
+
+    def __call__(self, t, X, out=None):
+        theta, omega = X.data if isinstance(X, dtt.Vector) else X
+        if out is None:
+            out = dtt.FloatVector.zeros(2)
+        data = out.data
+        data[0] = omega
+        data[1] = -self.g_l * math.sin(theta)
+        return out
+
+def make_nonlinear_pendulum(l=NONLINPEND_L):
+    """
+    Returns the nonlinear pendulum (see nonlinear_pendulum()) with its
+    parameters bound, as a callable f(t, X, out=None) writing the derivative
+    into out (see oscillators.make_vanderpol()).
+
+    @type  l: number
+    @param l: length of the pendulum [m]
+
+    @rtype: function
+    @return: ODE function f(t, X, out=None)
+    """
+    return _NonlinearPendulum(l)
+
+class _DrivenPendulum(object):
+    """
+    The driven pendulum with bound parameters (see make_driven_pendulum()).
+    """
+    accepts_out = True
+
+    def __init__(self, l, a, omegad):
+        self.g_l = const.g / float(l)
+        self.a = float(a)
+        self.omegad = float(omegad)
+
+    def __call__(self, t, X, out=None):
+        theta, omega = X.data if isinstance(X, dtt.Vector) else X
+        if out is None:
+            out = dtt.FloatVector.zeros(2)
+        data = out.data
+        data[0] = omega
+        data[1] = (-self.g_l * math.sin(theta)
+                   + self.a * math.cos(theta) * math.sin(self.omegad * t))
+        return out
+
+def make_driven_pendulum(l=DRIVPEND_L, a=DRIVPEND_A, omegad=DRIVPEND_OMEGAD):
+    """
+    Returns the driven pendulum (see driven_pendulum()) with its parameters
+    bound, as a callable f(t, X, out=None) writing the derivative into out.
+
+    @type       l: number
+    @param      l: length of the pendulum [m]
+    @type       a: number
+    @param      a: amplitude of the driving force
+    @type  omegad: number
+    @param omegad: angular frequency of the driving force
+
+    @rtype: function
+    @return: ODE function f(t, X, out=None)
+    """
+    return _DrivenPendulum(l, a, omegad)
+
 # TODO
 def double_pendulum(t, X, **kwargs):
     """
@@ -126,3 +126,124 @@ def vanderpol(t, X, **kwargs):
 
     X_dot = [x_dot, y_dot]
     return dtt.Vector(X_dot)
+
+#### Factories binding the parameters once
+#
+# The functions above look up their parameters in kwargs on every call. The
+# factories below bind them once, and return callable objects
+# f(t, X, out=None) which write the derivative into the output vector out
+# (allocating one if not given). The integrators in souffle.math.odeint detect
+# them through their accepts_out attribute, and give them preallocated
+# buffers. Being module-level classes, they can also be pickled (e.g. for
+# souffle.math.sweep).
+
+class _Brusselator(object):
+    """
+    The Brusselator with bound parameters (see make_brusselator()).
+    """
+    accepts_out = True
+
+    def __init__(self, a, b):
+        self.a = float(a)
+        self.b = float(b)
+
+    def __call__(self, t, X, out=None):
+        a = self.a
+        b = self.b
+        x, y = X.data if isinstance(X, dtt.Vector) else X
+        if out is None:
+            out = dtt.FloatVector.zeros(2)
+        data = out.data
+        data[0] = 1 - (b + 1) * x + a * x * x * y
+        data[1] = b * x - a * x * x * y
+        return out
+
+def make_brusselator(a=BRUSS_A, b=BRUSS_B):
+    """
+    Returns the Brusselator (see brusselator()) with its parameters bound.
+
+    @type  a: number
+    @param a: parameter a
+    @type  b: number
+    @param b: parameter b
+
+    @rtype: function
+    @return: ODE function f(t, X, out=None)
+    """
+    return _Brusselator(a, b)
+
+class _LotkaVolterra(object):
+    """
+    The Lotka-Volterra equations with bound parameters (see
+    make_lotka_volterra()).
+    """
+    accepts_out = True
+
+    def __init__(self, alpha, beta, gamma, delta):
+        self.alpha = float(alpha)
+        self.beta = float(beta)
+        self.gamma = float(gamma)
+        self.delta = float(delta)
+
+    def __call__(self, t, X, out=None):
+        x, y = X.data if isinstance(X, dtt.Vector) else X
+        if out is None:
+            out = dtt.FloatVector.zeros(2)
+        data = out.data
+        data[0] = x * (self.alpha - self.beta * y)
+        data[1] = - y * (self.gamma - self.delta * x)
+        return out
+
+def make_lotka_volterra(alpha=LOTKA_ALPHA, beta=LOTKA_BETA,
+                        gamma=LOTKA_GAMMA, delta=LOTKA_DELTA):
+    """
+    Returns the Lotka-Volterra equations (see lotka_volterra()) with their
+    parameters bound.
+
+    @type  alpha: number
+    @param alpha: growth rate of prey
+    @type   beta: number
+    @param  beta: rate at which predators consume prey
+    @type  gamma: number
+    @param gamma: death rate of predators
+    @type  delta: number
+    @param delta: rate at which predators increase by consuming prey
+
+    @rtype: function
+    @return: ODE function f(t, X, out=None)
+    """
+    return _LotkaVolterra(alpha, beta, gamma, delta)
+
+class _VanderPol(object):
+    """
+    The van der Pol oscillator with bound parameters (see make_vanderpol()).
+    """
+    accepts_out = True
+
+    def __init__(self, mu, omega):
+        self.mu = float(mu)
+        self.omega2 = float(omega)**2
+
+    def __call__(self, t, X, out=None):
+        x, y = X.data if isinstance(X, dtt.Vector) else X
+        if out is None:
+            out = dtt.FloatVector.zeros(2)
+        data = out.data
+        data[0] = y
+        data[1] = self.mu * (1 - x * x) * y - self.omega2 * x
+        return out
+
+def make_vanderpol(mu=VANDERPOL_MU, omega=VANDERPOL_OMEGA):
+    """
+    Returns the van der Pol oscillator (see vanderpol()) with its parameters
+    bound.
+
+    @type     mu: number
+    @param    mu: strength of the nonlinear damping
+    @type  omega: number
+    @param omega: angular frequency
+
+    @rtype: function
+    @return: ODE function f(t, X, out=None)
+    """
+    return _VanderPol(mu, omega)
@@ -1,6 +1,6 @@
 import unittest
 
-from souffle.datatypes import Vector, Matrix
+from souffle.datatypes import Vector, FloatVector, Matrix, SparseMatrix, BandedMatrix, linear_combination
 
 # TODO: use epsilon error testing for float comparisons?
 # TODO: test error conditions
@@ -61,6 +61,67 @@ class TestDatatypes(unittest.TestCase):
         y.remove(1)
         self.assertEqual(y, Vector([7.0, 5.0, 6.0]))
 
+    def test_FloatVector(self):
+        x = FloatVector([1, 2, 3])
+        y = FloatVector([4.0, 5.0, 6.0])
+        z = Vector([3.0, 2.0, 1.0])
+
+        # Representations
+        self.assertEqual(str(x), "[1.0 2.0 3.0]")
+
+        # Container methods
+        self.assertEqual(x[-1], 3.0)
+        self.assertEqual(len(x), 3)
+        self.assertEqual(list(x), [1.0, 2.0, 3.0])
+        self.assertEqual(FloatVector.zeros(2), Vector([0.0, 0.0]))
+
+        # Arithmetic keeps the array-backed type, also with generic operands
+        self.assertEqual(x + y, Vector([5.0, 7.0, 9.0]))
+        self.assertTrue(isinstance(x + z, FloatVector))
+        self.assertTrue(isinstance(x.mul_scalar(2), FloatVector))
+        self.assertEqual(x.div_scalar(4.0), Vector([0.25, 0.5, 0.75]))
+        self.assertEqual(-x, Vector([-1.0, -2.0, -3.0]))
+
+        # Comparisons still give generic Vectors of booleans
+        self.assertEqual(str(x < z), "[True False False]")
+
+        # Buffer export
+        view = y.buffer()
+        self.assertEqual(view.format, "d")
+        view[0] = 7.0
+        self.assertEqual(y[0], 7.0)
+
+    def test_Vector_inplace(self):
+        x = FloatVector([1.0, 2.0, 3.0])
+        y = Vector([4.0, 5.0, 6.0])
+        z = FloatVector.zeros(3)
+
+        self.assertTrue(z.assign(y) is z)
+        self.assertEqual(z, Vector([4.0, 5.0, 6.0]))
+        z.iadd(x)
+        self.assertEqual(z, Vector([5.0, 7.0, 9.0]))
+        z.isub(x).imul_scalar(2.0)
+        self.assertEqual(z, Vector([8.0, 10.0, 12.0]))
+        z.idiv_scalar(4.0)
+        self.assertEqual(z, Vector([2.0, 2.5, 3.0]))
+        z.assign(x).axpy(0.5, y)
+        self.assertEqual(z, Vector([3.0, 4.5, 6.0]))
+        z += x
+        self.assertEqual(z, Vector([4.0, 6.5, 9.0]))
+
+        w = x.copy()
+        w.imul_scalar(0.0)
+        self.assertEqual(x, Vector([1.0, 2.0, 3.0]))
+
+        self.assertEqual(linear_combination((1.0, 2.0), (x, y)),
+                         Vector([9.0, 12.0, 15.0]))
+        # The output may alias an input
+        self.assertTrue(linear_combination((2.0, -1.0), (x, y), out=x) is x)
+        self.assertEqual(x, Vector([-2.0, -1.0, 0.0]))
+
+        with self.assertRaises(ValueError):
+            z.iadd(Vector([1.0]))
+
     def test_Matrix(self):
         x = Matrix([[1.0, 2.0, 3.0],
                     [4.0, 5.0, 6.0],
@@ -85,9 +146,9 @@ class TestDatatypes(unittest.TestCase):
 
         # Unary operators
 
-        #self.assertEqual(+w, Matrix([[+1.2, +(-3.4)], [+5.6, +(-7.8)]]))
-        #self.assertEqual(-w, Matrix([[-1.2, -(-3.4)], [-5.6, -(-7.8)]]))
-        #self.assertEqual(abs(w), Matrix([[1.2, 3.4], [5.6, 7.8]]))
+        self.assertEqual(+w, Matrix([[+1.2, +(-3.4)], [+5.6, +(-7.8)]]))
+        self.assertEqual(-w, Matrix([[-1.2, -(-3.4)], [-5.6, -(-7.8)]]))
+        self.assertEqual(abs(w), Matrix([[1.2, 3.4], [5.6, 7.8]]))
 
         # Element-wise comparisons
         self.assertEqual(x < y, Matrix([[False, True, False],
@@ -132,12 +193,44 @@ class TestDatatypes(unittest.TestCase):
         self.assertEqual(x.mul_matrix(y), Matrix([[21.0, 27.0, 27.0],
                                                   [48.0, 63.0, 63.0],
                                                   [75.0, 99.0, 99.0]]))
+        self.assertEqual(list(x.mul_vector(Vector([1.0, 0.0, 2.0]))),
+                         [7.0, 16.0, 25.0])
+        self.assertRaises(ValueError, x.mul_vector, [1.0, 2.0])
 
         # Accessing elements
 
         self.assertEqual(x.get_row(1), [4.0, 5.0, 6.0])
         self.assertEqual(y.get_col(1), [3.0, 3.0, 6.0])
 
+        self.assertEqual(x[1, 2], 6.0)
+        self.assertEqual(x[-1, 0], 7.0)
+        self.assertRaises(IndexError, x.__getitem__, (3, 0))
+
+        # Views share storage with the original Matrix
+
+        block = x[1:, ::2]
+        self.assertEqual(block, Matrix([[4.0, 6.0], [7.0, 9.0]]))
+        self.assertEqual(x[0].tolist(), [[1.0, 2.0, 3.0]])
+        xt = x.transpose()
+        self.assertEqual(xt.get_row(0), [1.0, 4.0, 7.0])
+        self.assertEqual(xt[1:, 1:].transpose(), x[1:, 1:])
+        block[0, 1] = 60.0
+        self.assertEqual(x[1, 2], 60.0)
+        self.assertEqual(xt[2, 1], 60.0)
+        x[1, :] = [[4.0, 5.0, 6.0]]
+        self.assertEqual(block[0, 1], 6.0)
+        c = x.copy()
+        c[0, 0] = 10.0
+        self.assertEqual(x[0, 0], 1.0)
+
+        # Contiguous matrices and views export their buffer
+
+        view = x[1:].buffer()
+        self.assertEqual(view.shape, (2, 3))
+        self.assertEqual(view[1, 0], 7.0)
+        self.assertRaises(ValueError, xt.buffer)
+        self.assertEqual(xt.copy().buffer().tolist(), xt.tolist())
+
         # Adding/removing elements
 
         x.append_row([1.2, 3.4, 5.6])
@@ -163,6 +256,47 @@ class TestDatatypes(unittest.TestCase):
                                     [4.0, 3.0, 7.6],
                                     [4.0, 6.0, 5.4]]))
 
+        y.insert_row([0.0, 1.0, 2.0], 1)
+        y.insert_col([5.0, 6.0, 7.0, 8.0], 0)
+        self.assertEqual(y, Matrix([[5.0, 1.0, 3.0, 9.8],
+                                    [6.0, 0.0, 1.0, 2.0],
+                                    [7.0, 4.0, 3.0, 7.6],
+                                    [8.0, 4.0, 6.0, 5.4]]))
+
+    def test_SparseMatrix(self):
+        # Duplicate entries are summed
+        x = SparseMatrix(3, 4, [2, 0, 1, 0, 2], [3, 1, 0, 1, 0],
+                         [5.0, 1.0, 2.0, 3.0, 6.0])
+        self.assertEqual(x.nnz, 4)
+        self.assertEqual(x.to_dense(), Matrix([[0.0, 4.0, 0.0, 0.0],
+                                               [2.0, 0.0, 0.0, 0.0],
+                                               [6.0, 0.0, 0.0, 5.0]]))
+        self.assertEqual(x[0, 1], 4.0)
+        self.assertEqual(x[-1, -1], 5.0)
+        self.assertEqual(x[1, 1], 0.0)
+        self.assertEqual(list(x.mul_vector([1.0, 2.0, 3.0, 4.0])),
+                         [8.0, 2.0, 26.0])
+        self.assertEqual(x.transpose().to_dense(), x.to_dense().transpose())
+        self.assertEqual(SparseMatrix.from_dense(x.to_dense()).to_coo(),
+                         x.to_coo())
+        with self.assertRaises(IndexError):
+            SparseMatrix(2, 2, [2], [0], [1.0])
+
+    def test_BandedMatrix(self):
+        x = BandedMatrix.from_diagonals([[1.0, 2.0], [3.0, 4.0, 5.0],
+                                         [6.0]], [-1, 0, 2])
+        self.assertEqual((x.n_lower, x.n_upper), (1, 2))
+        self.assertEqual(x.to_dense(), Matrix([[3.0, 0.0, 6.0],
+                                               [1.0, 4.0, 0.0],
+                                               [0.0, 2.0, 5.0]]))
+        self.assertEqual(x.diagonal(-1), [1.0, 2.0])
+        self.assertEqual(x.diagonal(1), [0.0, 0.0])
+        self.assertEqual(x[2, 0], 0.0)
+        self.assertEqual(list(x.mul_vector([1.0, 2.0, 3.0])),
+                         [21.0, 9.0, 19.0])
+        with self.assertRaises(IndexError):
+            x[2, 0] = 1.0
+
 
 if __name__ == '__main__':
     unittest.main(verbosity=2)
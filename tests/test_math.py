@@ -1,8 +1,9 @@
 import math
 import unittest
 
-from souffle.datatypes import Vector, Matrix
-from souffle.math import chaos, derivative, discrete, integral, linalg, lineq, maxmin, misc, nonlineq
+from souffle.datatypes import Vector, Matrix, SparseMatrix, BandedMatrix
+from souffle.math import chaos, derivative, discrete, ensemble, integral, linalg, lineq, maxmin, misc, nonlineq, odeint, sweep
+from souffle.physics import mechanics
 
 class TestMath(unittest.TestCase):
 
@@ -18,6 +19,19 @@ class TestMath(unittest.TestCase):
         #with self.assertRaises(ValueError):
         #    chaos.lorenz_attractor(t, [x, y, z], sigma=sigma, beta=beta)
 
+        lorenz = chaos.make_lorenz_attractor(sigma=sigma, rho=rho, beta=beta)
+        self.assertEqual(lorenz(t, [x, y, z]),
+                         chaos.lorenz_attractor(t, [x, y, z], sigma=sigma,
+                                                beta=beta, rho=rho))
+        # The integrators give it output buffers, with the same results
+        X0 = [1.0, 1.0, 1.0]
+        rk4 = odeint.RK4(chaos.lorenz_attractor, 0.0, X0, sigma=sigma,
+                         rho=rho, beta=beta)
+        rk4.integrate(0.01, 50)
+        rk4_out = odeint.RK4(lorenz, 0.0, X0)
+        rk4_out.integrate(0.01, 50)
+        self.assertEqual(rk4_out.X_cur, rk4.X_cur)
+
     def test_derivative(self):
         f = lambda x: 2 * x**3
         fp = lambda x: 6 * x**2
@@ -28,10 +42,44 @@ class TestMath(unittest.TestCase):
         self.assertTrue(abs(derivative.central_difference(f, x, 1e-6) - fp(x)) < 1e-4)
         self.assertTrue(abs(derivative.central_difference_second(f, x, 1e-3) - fp(x)) < 1e-6)
 
+        g = lambda X: Vector([X[0] * X[1], X[0] + 3.0 * X[1]**2])
+        J = derivative.jacobian(g, Vector([2.0, 5.0]), 1e-7)
+        for J_row, row in zip(J, [[5.0, 2.0], [1.0, 30.0]]):
+            for J_ij, elem in zip(J_row, row):
+                self.assertTrue(abs(J_ij - elem) < 1e-5)
+
     def test_discrete(self):
         self.assertEqual(discrete.factorial(7), 5040)
         self.assertEqual(discrete.binomial_coefficient(7, 3), 35)
 
+    def test_ensemble(self):
+        X0 = [[1.0, 1.0, 1.0], [-2.0, 3.0, 20.0], [5.0, -5.0, 30.0]]
+        rho = [10.0, 28.0, 40.0]
+        # Reference: one integrator per member
+        members = []
+        for X, rho_k in zip(X0, rho):
+            rk4 = odeint.RK4(chaos.lorenz_attractor, 0.0, X, sigma=10.0,
+                             rho=rho_k, beta=8.0 / 3)
+            rk4.integrate(0.01, 50)
+            members.append(rk4)
+
+        backends = [("python", ensemble.vectorize(chaos.lorenz_attractor))]
+        if ensemble.numpy is not None:
+            backends.append(("numpy", chaos.lorenz_attractor))
+        for backend, f in backends:
+            lorenz = ensemble.EnsembleRK4(f, 0.0, X0, backend=backend,
+                                          sigma=10.0, rho=rho, beta=8.0 / 3)
+            lorenz.integrate(0.01, 50)
+            self.assertEqual(lorenz.backend, backend)
+            self.assertEqual(len(lorenz.columns()), 3)
+            for k, rk4 in enumerate(members):
+                for x, x_ref in zip(lorenz.state(k), rk4.X_cur):
+                    self.assertTrue(abs(x - x_ref) < 1e-12)
+                self.assertEqual(len(lorenz.trajectory(k)), 51)
+
+        with self.assertRaises(ValueError):
+            ensemble.EnsembleRK4(f, 0.0, X0, rho=[1.0, 2.0])
+
     def test_integral(self):
         f = lambda x: 9.0 + 8.0*x + 7.0*x**2 + 6.0*x**3
         F = lambda x: 9.0*x + 4.0*x**2 + 7.0/3.0*x**3 + 3.0/2.0*x**4
@@ -53,6 +101,38 @@ class TestMath(unittest.TestCase):
 
         self.assertEqual(linalg.dot_product(A, B), 156)
         self.assertEqual(linalg.determinant_minors(C), 488)
+        self.assertTrue(abs(linalg.determinant(C) - 488) < 1e-9)
+        sign, logdet = linalg.log_determinant(C)
+        self.assertEqual(sign, 1.0)
+        self.assertTrue(abs(logdet - math.log(488)) < 1e-12)
+
+        # A * A^-1 = I
+        P = C.mul_matrix(C.inverse())
+        for i in range(4):
+            for j in range(4):
+                self.assertTrue(abs(P[i, j] - (i == j)) < 1e-12)
+        self.assertRaises(ValueError, linalg.inverse, [[1, 2], [2, 4]])
+
+        # Products computed in column strips agree with the direct sums and
+        # with NumPy (if installed), for strips narrower than every
+        # dimension, straddling the last column, and wider than the product
+        A = [[i - 2 * j for j in range(5)] for i in range(7)]
+        B = [[i * j + 1 for j in range(9)] for i in range(5)]
+        for block_size in (1, 2, 4, 16):
+            P = linalg.matmul(A, B, block_size=block_size, use_numpy=False)
+            self.assertEqual((P.n_rows, P.n_cols), (7, 9))
+            for i in range(7):
+                for j in range(9):
+                    P_ij = sum([A[i][k] * B[k][j] for k in range(5)])
+                    self.assertEqual(P[i, j], P_ij)
+        if linalg.numpy is not None:
+            self.assertEqual(linalg.matmul(A, B, use_numpy=True), P)
+
+        # The log-determinant survives where the determinant overflows
+        D = Matrix([[1e10 if i == j else 0.0 for j in range(40)]
+                    for i in range(40)])
+        sign, logdet = linalg.log_determinant(D)
+        self.assertTrue(abs(logdet - 400 * math.log(10)) < 1e-9)
 
     def test_lineq(self):
         A = Matrix([[2.0,  1.0,  4.0,  1.0],
@@ -67,6 +147,369 @@ class TestMath(unittest.TestCase):
         self.assertTrue(abs(x[2] - -2.0) < 1e-9)
         self.assertTrue(abs(x[3] -  1.0) < 1e-9)
 
+        # The pivot search only looks at the rows not yet eliminated; here
+        # the second pivot is zero, and the row below must be swapped in
+        A = Matrix([[1.0, 10.0, 0.0],
+                    [1.0, 10.0, 1.0],
+                    [0.0,  1.0, 1.0]])
+        x = lineq.gauss_elim(A, [11, 12, 2])
+        for x_i in x:
+            self.assertTrue(abs(x_i - 1.0) < 1e-12)
+
+        # The LU factorisation leaves A intact, and solves a batch of RHS
+        A = Matrix([[2.0,  1.0,  4.0,  1.0],
+                    [3.0,  4.0, -1.0, -1.0],
+                    [1.0, -4.0,  1.0,  5.0],
+                    [2.0, -2.0,  1.0,  3.0]])
+        lu = lineq.lu_factor(A)
+        self.assertEqual(A.get_row(0), [2.0, 1.0, 4.0, 1.0])
+        x, y = lu.solve([b, [8, 5, 3, 4]])
+        for x_i, x_exact in zip(x, [2.0, -1.0, -2.0, 1.0]):
+            self.assertTrue(abs(x_i - x_exact) < 1e-9)
+        for y_i in y:
+            self.assertTrue(abs(y_i - 1.0) < 1e-9)
+        self.assertTrue(abs(lu.det() - linalg.determinant_minors(A)) < 1e-9)
+
+        singular = lineq.lu_factor([[1.0, 2.0], [2.0, 4.0]])
+        self.assertEqual(singular.det(), 0.0)
+        self.assertRaises(ValueError, singular.solve, [1.0, 2.0])
+
+        # Iterative methods on the (sparse) 1-D Poisson equation, with the
+        # exact solution x_i = i (n + 1 - i) / 2
+        n = 50
+        rows = [i for i in range(n) for k in range(3)]
+        cols = [i + k - 1 for i in range(n) for k in range(3)]
+        values = [-1.0, 2.0, -1.0] * n
+        entries = [entry for entry in zip(rows, cols, values)
+                   if 0 <= entry[1] < n]
+        A = SparseMatrix(n, n, *zip(*entries))
+        b = [1.0] * n
+        x_exact = [0.5 * (i + 1) * (n - i) for i in range(n)]
+        for solve in (lineq.conjugate_gradient, lineq.bicgstab,
+                      lambda A, b: lineq.sor(A, b, 1.9, max_iter=100000)):
+            x, n_iter = solve(A, b)
+            for x_i, x_exact_i in zip(x, x_exact):
+                self.assertTrue(abs(x_i - x_exact_i) < 1e-6)
+        # CG converges in at most n iterations (up to rounding)
+        self.assertTrue(lineq.conjugate_gradient(A, b)[1] <= n + 2)
+
+        # Jacobi and Gauss-Seidel, on a dense, diagonally dominant system
+        A = [[4.0, 1.0, 0.0], [1.0, 5.0, 2.0], [0.0, 2.0, 6.0]]
+        for solve in (lineq.jacobi, lineq.gauss_seidel):
+            x, n_iter = solve(A, [5.0, 8.0, 8.0])
+            for x_i in x:
+                self.assertTrue(abs(x_i - 1.0) < 1e-9)
+        self.assertRaises(ValueError, lineq.jacobi, A, [5.0, 8.0, 8.0],
+                          max_iter=3)
+
+        # Band matrices: the 1-D Poisson equation again, by the Thomas
+        # algorithm and by banded LU (with pivoting on a permuted system)
+        lower = [-1.0] * (n - 1)
+        diag = [2.0] * n
+        A = BandedMatrix.from_diagonals([lower, diag, lower], [-1, 0, 1])
+        for x in (lineq.thomas(lower, diag, lower, b),
+                  lineq.solve_banded(A, b), lineq.lu_factor(A).solve(b)):
+            for x_i, x_exact_i in zip(x, x_exact):
+                self.assertTrue(abs(x_i - x_exact_i) < 1e-9)
+        self.assertTrue(abs(lineq.lu_factor(A).det() - (n + 1)) < 1e-9)
+        A = BandedMatrix.from_diagonals([[1.0, 1.0], [0.0, 0.0, 1.0],
+                                         [1.0, 2.0]], [-1, 0, 1])
+        lu = lineq.lu_factor(A)
+        x = lu.solve([1.0, 3.0, 2.0])
+        self.assertEqual(x, [1.0, 1.0, 1.0])
+        self.assertEqual(lu.det(), linalg.determinant(A.to_dense()))
+
+        # Periodic 1-D Poisson equation, shifted to be nonsingular:
+        # x_{i-1} - 3 x_i + x_{i+1} = -1, with x_i = 1
+        x = lineq.cyclic_tridiagonal([1.0] * 9, [-3.0] * 10, [1.0] * 9,
+                                     [-1.0] * 10, 1.0, 1.0)
+        for x_i in x:
+            self.assertTrue(abs(x_i - 1.0) < 1e-12)
+
+    def test_odeint(self):
+        # Exponential decay, dx/dt = -x
+        f = lambda t, X: X.mul_scalar(-1.0)
+        sol = math.exp(-1.0)
+
+        euler = odeint.Euler(f, 0.0, [1.0])
+        euler.integrate(1e-4, 10000)
+        self.assertTrue(abs(euler.X[-1][0] - sol) < 1e-4)
+
+        rk4 = odeint.RK4(f, 0.0, [1.0])
+        rk4.integrate(0.01, 100)
+        self.assertTrue(abs(rk4.X[-1][0] - sol) < 1e-9)
+
+        # The integrators must not be confused by an ODE function that
+        # returns its input
+        rk4_alias = odeint.RK4(lambda t, X: X, 0.0, [1.0])
+        rk4_alias.integrate(0.01, 100)
+        self.assertTrue(abs(rk4_alias.X[-1][0] - math.e) < 1e-8)
+
+        bulsto = odeint.BulSto(f, 0.0, [1.0])
+        bulsto.integrate(0.1, 10, 1e-10)
+        self.assertTrue(abs(bulsto.X[-1][0] - sol) < 1e-9)
+
+        # Non-autonomous systems are integrated at the right times
+        g = lambda t, X: Vector([math.cos(t)])
+        bulsto = odeint.BulSto(g, 0.0, [0.0])
+        bulsto.integrate(0.5, 10, 1e-10)
+        self.assertTrue(abs(bulsto.X_cur[0] - math.sin(5.0)) < 1e-8)
+        bulsto = odeint.BulStoAdaptive(g)
+        bulsto.integrate(5.0, 1e-10, X0=[0.0])
+        self.assertTrue(abs(bulsto.X_cur[0] - math.sin(5.0)) < 1e-8)
+
+        # RK4 integrates x = t^3 exactly; a zero error estimate lets the
+        # adaptive step grow by at most MAX_FACTOR per step
+        h = lambda t, X: Vector([3.0 * t * t])
+        for integrator in (odeint.RK4Adaptive, odeint.DormandPrince):
+            rk = integrator(h, 0.0, [0.0])
+            rk.integrate(1.0, 0.1, 1e-6, [0])
+            self.assertTrue(rk.t_cur >= 1.0)
+            self.assertTrue(abs(rk.X_cur[0] - rk.t_cur**3) < 1e-12)
+            for dt, dt_next in zip(rk.dt_all, rk.dt_all[1:]):
+                self.assertTrue(dt_next <= rk.MAX_FACTOR * dt * (1 + 1e-12))
+
+    def test_odeint_trajectory(self):
+        traj = odeint.Trajectory(2, capacity=2)
+        for i in range(5):
+            traj.append(float(i), Vector([i, 10.0 * i]))
+        self.assertEqual(len(traj), 5)
+        self.assertEqual(traj.times().tolist(), [0.0, 1.0, 2.0, 3.0, 4.0])
+        self.assertEqual(traj.column(1).tolist(), [0.0, 10.0, 20.0, 30.0, 40.0])
+        self.assertEqual(traj.state(-1), Vector([4.0, 40.0]))
+
+        # Decimation keeps every other sample once the store is full
+        traj = odeint.Trajectory(1, max_samples=4)
+        for i in range(9):
+            traj.append(float(i), Vector([i]))
+        self.assertEqual(traj.times().tolist(), [0.0, 4.0, 8.0])
+        self.assertEqual(traj.stride, 4)
+        # The last sample offered is kept even if the stride skips it
+        traj.append(9.0, Vector([9]))
+        self.assertEqual(traj.times().tolist(), [0.0, 4.0, 8.0, 9.0])
+        self.assertEqual(traj.state(-1), Vector([9.0]))
+        traj.append(10.0, Vector([10]))
+        self.assertEqual(traj.times().tolist(), [0.0, 4.0, 8.0, 10.0])
+
+        # Each step is stored exactly once
+        f = lambda t, X: X.mul_scalar(-1.0)
+        rk4 = odeint.RK4(f, 0.0, [1.0], max_samples=16)
+        rk4.integrate(0.01, 100)
+        self.assertTrue(len(rk4.t) <= 16)
+        self.assertTrue(abs(rk4.t_cur - 1.0) < 1e-12)
+        x, = rk4.unpack()
+        self.assertEqual(x[0], 1.0)
+        # Decimated runs end at the end of the integration
+        for n_steps in (11, 13, 17):
+            rk4 = odeint.RK4(f, 0.0, [1.0, 0.0], max_samples=8)
+            rk4.integrate(0.1, n_steps)
+            self.assertTrue(len(rk4.t) <= 8)
+            self.assertEqual(rk4.t[-1], rk4.t_cur)
+            self.assertEqual(rk4.X[-1], rk4.X_cur)
+
+    def test_odeint_iterate(self):
+        f = lambda t, X: X.mul_scalar(-1.0)
+
+        rk4 = odeint.RK4(f, 0.0, [1.0])
+        states = rk4.iterate(0.1, 10, store=False)
+        t, X = next(states)
+        self.assertTrue(abs(t - 0.1) < 1e-12)
+        self.assertEqual(len(list(states)), 9)
+        # Only the initial state was stored
+        self.assertEqual(len(rk4.t), 1)
+        self.assertTrue(abs(rk4.X_cur[0] - math.exp(-1.0)) < 1e-6)
+
+        bulsto = odeint.BulStoAdaptive(f)
+        final = None
+        for t, X in bulsto.iterate(1.0, 1e-8, X0=[1.0], store=False):
+            final = X
+        self.assertTrue(abs(final[0] - math.exp(-1.0)) < 1e-8)
+        self.assertEqual(len(bulsto.t), 0)
+
+    def test_odeint_dormand_prince(self):
+        # Simple harmonic oscillator, counting the derivative evaluations
+        n_evals = [0]
+        def f(t, X):
+            n_evals[0] += 1
+            return Vector([X[1], -X[0]])
+
+        dopri = odeint.DormandPrince(f, 0.0, [1.0, 0.0])
+        dopri.integrate(10.0, 0.1, 1e-8)
+        self.assertEqual(dopri.t_cur, 10.0)
+        self.assertTrue(abs(dopri.X_cur[0] - math.cos(10.0)) < 1e-6)
+        self.assertTrue(abs(dopri.X_cur[1] + math.sin(10.0)) < 1e-6)
+        # First same as last: six new evaluations per attempted step
+        n_steps = len(dopri.dt_all)
+        self.assertTrue(n_evals[0] < 7 * n_steps)
+
+    def test_odeint_dense_output(self):
+        f = lambda t, X: Vector([X[1], -X[0]])
+        t_eval = [0.1 * i for i in range(101)]
+
+        dopri = odeint.DormandPrince(f, 0.0, [1.0, 0.0])
+        dopri.integrate(10.0, 0.1, 1e-6, t_eval=t_eval)
+        # Far fewer steps than output times are needed
+        self.assertTrue(len(dopri.dt_all) < len(t_eval))
+        self.assertEqual(dopri.t.tolist(), t_eval)
+        for t, x in zip(dopri.t, dopri.unpack()[0]):
+            self.assertTrue(abs(x - math.cos(t)) < 1e-6)
+
+        rk4 = odeint.RK4Adaptive(f, 0.0, [1.0, 0.0])
+        outputs = list(rk4.iterate(10.0, 0.1, 1e-6, [0, 1],
+                                   t_eval=t_eval[1:]))
+        self.assertEqual([t for t, X in outputs], t_eval[1:])
+        for t, X in outputs:
+            self.assertTrue(abs(X[0] - math.cos(t)) < 1e-4)
+
+    def test_odeint_events(self):
+        f = lambda t, X: Vector([X[1], -X[0]])
+        # x = cos(t) crosses zero at pi/2 (falling) and 3pi/2 (rising)
+        position = lambda t, X: X[0]
+        rising = lambda t, X: X[0]
+        rising.direction = 1
+        # v = -sin(t) crosses zero from below at pi
+        stop = lambda t, X: X[1]
+        stop.terminal = True
+        stop.direction = 1
+
+        rk4 = odeint.RK4(f, 0.0, [1.0, 0.0])
+        rk4.integrate(0.01, 700, events=[position, rising])
+        self.assertEqual(len(rk4.t_events[0]), 2)
+        self.assertTrue(abs(rk4.t_events[0][0] - math.pi / 2) < 1e-8)
+        self.assertTrue(abs(rk4.t_events[0][1] - 3 * math.pi / 2) < 1e-8)
+        self.assertEqual(len(rk4.t_events[1]), 1)
+        self.assertTrue(abs(rk4.X_events[1][0][0]) < 1e-8)
+
+        dopri = odeint.DormandPrince(f, 0.0, [1.0, 0.0])
+        dopri.integrate(10.0, 0.1, 1e-8, events=[stop])
+        self.assertTrue(abs(dopri.t_cur - math.pi) < 1e-6)
+        self.assertTrue(abs(dopri.X_cur[0] + 1.0) < 1e-6)
+        self.assertEqual(dopri.t[-1], dopri.t_cur)
+
+        bulsto = odeint.BulStoAdaptive(f)
+        bulsto.integrate(10.0, 1e-8, X0=[1.0, 0.0], events=[stop])
+        self.assertTrue(abs(bulsto.t_cur - math.pi) < 1e-6)
+
+    def test_odeint_bulsto_iterative(self):
+        f = lambda t, X: Vector([X[1], -X[0]])
+        bulsto = odeint.BulStoIterative(f, 0.0, [1.0, 0.0])
+        bulsto.integrate(50.0, 0.1, 1e-8)
+        self.assertEqual(bulsto.t_cur, 50.0)
+        self.assertTrue(abs(bulsto.X_cur[0] - math.cos(50.0)) < 1e-6)
+        # Only the accepted steps are stored, and the step size grows from
+        # the initial guess
+        self.assertEqual(len(bulsto.t), len(bulsto.dt_all) + 1)
+        self.assertTrue(max(bulsto.dt_all) > 0.5)
+        # The step size carries over to the next integration, and the steps
+        # end on the output times
+        n_steps = len(bulsto.dt_all)
+        bulsto.integrate(10.0, 0.1, 1e-8, t_eval=[55.0, 60.0])
+        self.assertTrue(bulsto.dt_all[n_steps] > 0.1)
+        self.assertEqual(bulsto.t[-2:].tolist(), [55.0, 60.0])
+        self.assertTrue(abs(bulsto.X[-1][0] - math.cos(60.0)) < 1e-6)
+
+        # Non-autonomous systems are integrated at the right times
+        g = lambda t, X: Vector([math.cos(t)])
+        bulsto = odeint.BulStoIterative(g, 0.0, [0.0])
+        bulsto.integrate(5.0, 0.1, 1e-10)
+        self.assertTrue(abs(bulsto.X_cur[0] - math.sin(5.0)) < 1e-9)
+
+    def test_odeint_stiff(self):
+        # Stiff system relaxing quickly onto x = cos(t)
+        f = lambda t, X: Vector([-1000.0 * (X[0] - math.cos(t))
+                                 - math.sin(t)])
+
+        euler = odeint.BackwardEuler(f, 0.0, [1.0])
+        euler.integrate(0.01, 1000)
+        self.assertTrue(abs(euler.X_cur[0] - math.cos(10.0)) < 1e-5)
+        # The system is linear, so the first Jacobian is never replaced
+        self.assertEqual(euler.n_jac, 1)
+        # ... and with a fixed step, neither is the iteration matrix
+        self.assertEqual(euler.n_lu, 1)
+
+        bdf = odeint.BDF2(f, 0.0, [1.0], jac=lambda t, X: [[-1000.0]])
+        bdf.integrate(0.01, 1000)
+        self.assertTrue(abs(bdf.X_cur[0] - math.cos(10.0)) < 1e-7)
+
+        # Van der Pol oscillator with strong damping, whose limit cycle
+        # alternates slow drifts with fast jumps
+        g = lambda t, X, mu: Vector([X[1],
+                                     mu * (1 - X[0]**2) * X[1] - X[0]])
+        rosen = odeint.Rosenbrock(g, 0.0, [2.0, 0.0], mu=1000.0)
+        rosen.integrate(300.0, 1e-4, 1e-3)
+        self.assertEqual(rosen.t_cur, 300.0)
+        # An explicit method would need hundreds of thousands of steps
+        self.assertTrue(len(rosen.dt_all) < 100)
+        self.assertTrue(abs(rosen.X_cur[0] - 1.78) < 0.01)
+
+        # The Jacobian is evaluated at every step, which the accuracy of the
+        # method relies on
+        rosen = odeint.Rosenbrock(g, 0.0, [2.0, 0.0], mu=100.0)
+        rosen.integrate(50.0, 1e-4, 1e-3)
+        self.assertTrue(rosen.n_jac >= len(rosen.dt_all))
+        ref = odeint.Rosenbrock(g, 0.0, [2.0, 0.0], mu=100.0)
+        ref.integrate(50.0, 1e-5, 1e-8)
+        self.assertTrue(abs(rosen.X_cur[0] - ref.X_cur[0]) < 0.005)
+
+    def test_odeint_stats(self):
+        f = lambda t, X: Vector([X[1], -X[0]])
+
+        rk4 = odeint.RK4(f, 0.0, [1.0, 0.0])
+        self.assertEqual(rk4.stats, None)
+        rk4.instrument()
+        stats = rk4.instrument(timing=False)
+        rk4.integrate(0.1, 10)
+        self.assertEqual(stats.n_evals, 40)
+        self.assertEqual(stats.n_accepted, 10)
+        self.assertEqual(list(stats.evals_per_step), [4] * 10)
+        self.assertEqual(stats.time["rhs"], 0.0)
+        self.assertTrue(stats.time["total"] >= stats.time["output"] > 0.0)
+
+        accepted = []
+        rejected = []
+        dopri = odeint.DormandPrince(f, 0.0, [1.0, 0.0])
+        stats = dopri.instrument(
+            on_accept=lambda t, X, dt: accepted.append(t),
+            on_reject=lambda t, dt: rejected.append(dt))
+        dopri.integrate(10.0, 1.0, 1e-8)
+        self.assertEqual(stats.n_accepted, len(dopri.dt_all))
+        for dt, dt_ref in zip(stats.dt_accepted, dopri.dt_all):
+            self.assertTrue(abs(dt - dt_ref) < 1e-12)
+        self.assertEqual(accepted[-1], 10.0)
+        # The initial step is too long
+        self.assertTrue(stats.n_rejected > 0)
+        self.assertEqual(list(stats.dt_rejected), rejected)
+        self.assertEqual(sum(stats.evals_per_step), stats.n_evals)
+
+    def test_odeint_symplectic(self):
+        # Simple harmonic oscillator: the error falls with the order of the
+        # method
+        accel = lambda t, Q: Vector([-Q[0]])
+        orders = [(odeint.Leapfrog, 2), (odeint.Yoshida4, 4),
+                  (odeint.ForestRuth, 4), (odeint.Yoshida6, 6)]
+        for integrator, order in orders:
+            errors = []
+            for n_steps in (20, 40):
+                sho = integrator(accel, 0.0, [1.0, 0.0])
+                sho.integrate(2.0 / n_steps, n_steps)
+                errors.append(abs(sho.X_cur[0] - math.cos(2.0)))
+            self.assertTrue(abs(math.log(errors[0] / errors[1], 2) - order)
+                            < 0.1)
+
+        # Nonlinear pendulum: the energy error stays bounded
+        l = 0.1
+        energy = lambda X: 0.5 * X[1]**2 - 9.80665 / l * math.cos(X[0])
+        pend = odeint.Leapfrog(mechanics.nonlinear_pendulum_accel, 0.0,
+                               [2.0, 0.0], l=l)
+        pend.integrate(0.01, 10000, store=False)
+        self.assertTrue(abs(energy(pend.X_cur) / energy([2.0, 0.0]) - 1)
+                        < 1e-2)
+
+        # The first-order form is used to locate events
+        sho = odeint.Yoshida4(accel, 0.0, [1.0, 0.0])
+        sho.integrate(0.1, 20, events=[lambda t, X: X[0]])
+        self.assertTrue(abs(sho.t_events[0][0] - math.pi / 2) < 1e-4)
+
     def test_maxmin(self):
         f1 = lambda x: (x - 3)**2
         f2 = lambda x: -(x - 3)**2
@@ -92,6 +535,29 @@ class TestMath(unittest.TestCase):
         self.assertTrue(abs(nonlineq.newton(f, f_deriv, x1, delta)[0] - math.sqrt(7)) < delta)
         self.assertTrue(abs(nonlineq.secant(f, x1, x2, delta)[0] - math.sqrt(7)) < delta)
 
+    def test_sweep(self):
+        params = sweep.grid(rho=[10.0, 28.0], sigma=[10.0])
+        X0 = [[1.0, 1.0, 1.0], [-2.0, 3.0, 20.0]]
+        serial = sweep.sweep(odeint.RK4, chaos.lorenz_attractor, params, X0,
+                             args=(0.01, 20), max_workers=1)
+        pooled = sweep.sweep(odeint.RK4, chaos.lorenz_attractor, params, X0,
+                             args=(0.01, 20), max_workers=2, chunksize=1)
+        self.assertEqual(len(serial), 4)
+        self.assertEqual(list(serial.params["rho"]), [10.0, 10.0, 28.0, 28.0])
+        for result in (serial, pooled):
+            for i in range(4):
+                row = result.row(i)
+                rk4 = odeint.RK4(chaos.lorenz_attractor, 0.0, row["X0"],
+                                 rho=row["rho"], sigma=row["sigma"])
+                rk4.integrate(0.01, 20)
+                self.assertEqual(row["X"], list(rk4.X_cur))
+                self.assertTrue(abs(row["t"] - 0.2) < 1e-12)
+
+        result = sweep.sweep(odeint.RK4, chaos.lorenz_attractor, params,
+                             X0[0], args=(0.01, 20), max_workers=1,
+                             measure=lambda ode: len(ode.t))
+        self.assertEqual(result.values, [21, 21])
+
 
 if __name__ == '__main__':
     unittest.main(verbosity=2)
@@ -0,0 +1,221 @@
+import itertools
+import math
+import random
+import unittest
+
+from souffle.math import odeint
+from souffle.physics import astro, elecstat, mechanics, oscillators
+
+class TestPhysics(unittest.TestCase):
+
+    def test_astro_nbody(self):
+        rng = random.Random(1)
+        n = 200
+        x = [rng.gauss(0.0, 1.0) for i in range(n)]
+        y = [rng.gauss(0.0, 1.0) for i in range(n)]
+        z = [rng.gauss(0.0, 1.0) for i in range(n)]
+        m = [rng.random() for i in range(n)]
+
+        direct = astro.accel_direct(x, y, z, m, G=1.0)
+        # With theta=0 the tree opens every node, giving the direct sum
+        exact = astro.accel_tree(x, y, z, m, G=1.0, theta=0.0)
+        approx = astro.accel_tree(x, y, z, m, G=1.0, theta=0.5)
+        errors = []
+        for i in range(n):
+            norm = math.sqrt(sum(a[i]**2 for a in direct))
+            for a, a_ref in zip(exact, direct):
+                self.assertTrue(abs(a[i] - a_ref[i]) < 1e-12 * norm)
+            errors.append(math.sqrt(sum((a[i] - a_ref[i])**2 for a, a_ref
+                                        in zip(approx, direct))) / norm)
+        self.assertTrue(sorted(errors)[n // 2] < 1e-2)
+
+        # Coincident particles share a leaf
+        ax, ay, az = astro.accel_tree([0.0, 0.0, 1.0], [0.0] * 3, [0.0] * 3,
+                                      [1.0] * 3, G=1.0, softening=0.1)
+        self.assertEqual(ax[0], ax[1])
+
+        # Binary on a circular orbit
+        binary = astro.Particles()
+        v = math.sqrt(0.5)
+        binary.add(1.0, (-0.5, 0.0, 0.0), (0.0, -v, 0.0))
+        binary.add(1.0, (0.5, 0.0, 0.0), (0.0, v, 0.0))
+        self.assertEqual(len(binary), 2)
+        E0 = binary.energy(G=1.0)
+        for method in ("direct", "tree"):
+            orbit = odeint.Yoshida4(astro.nbody_accel, 0.0, binary.state(),
+                                    masses=binary.m, G=1.0, method=method)
+            orbit.integrate(0.05, 2 * int(math.pi / 0.05), store=False)
+            final = astro.Particles()
+            final.m = binary.m
+            final.set_state(orbit.X_cur)
+            self.assertTrue(abs(final.energy(G=1.0) / E0 - 1) < 1e-6)
+            self.assertTrue(abs(math.hypot(final.x[0], final.y[0]) - 0.5)
+                            < 1e-4)
+
+        rk4 = odeint.RK4(astro.nbody, 0.0, binary.state(), masses=binary.m,
+                         G=1.0)
+        rk4.integrate(0.01, 100)
+        final.set_state(rk4.X_cur)
+        self.assertTrue(abs(final.energy(G=1.0) / E0 - 1) < 1e-8)
+
+        with self.assertRaises(ValueError):
+            astro.nbody_accel(0.0, binary.state(), G=1.0)
+
+    def test_factories(self):
+        X = [0.3, -1.2]
+        pairs = [(oscillators.make_brusselator(a=1.5, b=2.5),
+                  oscillators.brusselator(0.0, X, a=1.5, b=2.5)),
+                 (oscillators.make_lotka_volterra(1.0, 2.0, 3.0, 4.0),
+                  oscillators.lotka_volterra(0.0, X, alpha=1.0, beta=2.0,
+                                             gamma=3.0, delta=4.0)),
+                 (oscillators.make_vanderpol(mu=3.0, omega=2.0),
+                  oscillators.vanderpol(0.0, X, mu=3.0, omega=2.0)),
+                 (mechanics.make_nonlinear_pendulum(l=0.5),
+                  mechanics.nonlinear_pendulum(0.0, X, l=0.5)),
+                 (mechanics.make_driven_pendulum(l=0.5, a=2.0, omegad=3.0),
+                  mechanics.driven_pendulum(0.0, X, l=0.5, a=2.0,
+                                            omegad=3.0))]
+        for f, F in pairs:
+            self.assertTrue(f.accepts_out)
+            for x, x_ref in zip(f(0.0, X), F):
+                self.assertTrue(abs(x - x_ref) < 1e-12)
+
+        # Integrating with output buffers gives the same results
+        vdp = odeint.BulStoIterative(oscillators.vanderpol, 0.0, [1.0, 0.0],
+                                     mu=3.0, omega=2.0)
+        vdp.integrate(5.0, 0.1, 1e-8)
+        vdp_out = odeint.BulStoIterative(oscillators.make_vanderpol(3.0, 2.0),
+                                         0.0, [1.0, 0.0])
+        vdp_out.integrate(5.0, 0.1, 1e-8)
+        for x, x_ref in zip(vdp_out.X_cur, vdp.X_cur):
+            self.assertTrue(abs(x - x_ref) < 1e-12)
+
+    def test_elecstat_poisson(self):
+        # Quadratic potential V = (x - 0.3)^2 + y^2 (+ z^2), for which the
+        # finite differences are exact: uniform charge density, potential
+        # fixed on all faces but x-, where dV/dn = 0.6
+        for shape, method in (((17, 9), "multigrid"), ((9, 9), "sor"),
+                              ((9, 9, 9), "multigrid")):
+            h = 1.0 / (shape[0] - 1)
+            exact = lambda p: (p[0] - 0.3)**2 + sum([x * x for x in p[1:]])
+            grid = elecstat.PoissonGrid(shape, h, eps=2.0)
+            nodes = list(itertools.product(*[range(n) for n in shape]))
+            for idx in nodes:
+                pos = grid.index(*idx)
+                grid.rho[pos] = -2.0 * len(shape) * 2.0
+                if any([i in (0, n - 1) for i, n in zip(idx, shape)]):
+                    grid.V[pos] = exact([i * h for i in idx])
+            for face in ("x+", "y-", "y+", "z-", "z+")[:2 * len(shape) - 1]:
+                grid.set_boundary(face, "dirichlet", None)
+            grid.set_boundary("x-", "neumann", 0.6)
+            getattr(grid, method)(delta=1e-12)
+
+            E = grid.field()
+            for idx in nodes:
+                p = [i * h for i in idx]
+                pos = grid.index(*idx)
+                self.assertTrue(abs(grid.V[pos] - exact(p)) < 1e-9)
+                E_exact = [-2.0 * (p[0] - 0.3)] + [-2.0 * x for x in p[1:]]
+                for E_i, E_exact_i in zip(E, E_exact):
+                    self.assertTrue(abs(E_i[pos] - E_exact_i) < 1e-8)
+
+        # Multigrid reduces the residual by a factor independent of the grid
+        cycles = []
+        for n in (17, 65):
+            grid = elecstat.PoissonGrid((n, n), 1.0 / (n - 1))
+            grid.add_point_charge(1e-9, (n // 2, n // 4))
+            cycles.append(grid.multigrid(delta=1e-8))
+        self.assertTrue(cycles[1] <= cycles[0] + 1)
+
+        # Grids that do not coarsen enough are rejected rather than solved
+        # by SOR on the coarsest level
+        grid = elecstat.PoissonGrid((128, 128), 1.0 / 127)
+        self.assertRaises(ValueError, grid.multigrid)
+
+        grid = elecstat.PoissonGrid((5, 5), 0.1)
+        for face in ("x-", "x+", "y-", "y+"):
+            grid.set_boundary(face, "neumann")
+        self.assertRaises(ValueError, grid.multigrid)
+
+    def test_elecstat_batch(self):
+        rng = random.Random(7)
+        backends = ["python"] + (["numpy"] if elecstat.numpy else [])
+        for dim in (2, 3):
+            q = [rng.uniform(-1e-9, 1e-9) for i in range(5)]
+            sources = [[rng.uniform(-1, 1) for i in range(5)]
+                       for j in range(dim)]
+            # The last target coincides with the first source
+            targets = [[rng.uniform(-1, 1) for i in range(7)] + [col[0]]
+                       for col in sources]
+            for backend in backends:
+                V = elecstat.potential_batch(q, sources, targets,
+                                             backend=backend, chunk_size=3)
+                E = elecstat.field_batch(q, sources, targets,
+                                         backend=backend, chunk_size=3)
+                self.assertEqual(len(V), 8)
+                self.assertEqual(len(E), dim)
+                for i, t in enumerate(zip(*targets)):
+                    V_i = 0.0
+                    E_i = [0.0] * dim
+                    for q_k, s in zip(q, zip(*sources)):
+                        d = [a - b for a, b in zip(t, s)]
+                        r = math.sqrt(sum([x * x for x in d]))
+                        if r == 0.0:
+                            continue
+                        V_i += elecstat.potential(q_k, r)
+                        for j in range(dim):
+                            E_i[j] += elecstat.field(q_k, r) * d[j] / r
+                    self.assertTrue(abs(V[i] - V_i) < 1e-9 * abs(V_i))
+                    for j in range(dim):
+                        self.assertTrue(abs(E[j][i] - E_i[j])
+                                        < 1e-9 * abs(E_i[j]))
+
+        self.assertRaises(ValueError, elecstat.potential_batch, [1.0],
+                          ([0.0], [0.0]), ([0.0], [0.0], [0.0]))
+        self.assertRaises(ValueError, elecstat.field_batch, [1.0, 2.0],
+                          ([0.0], [0.0]), ([0.0], [0.0]))
+
+    def test_elecstat_tree(self):
+        rng = random.Random(11)
+        backends = ["python"] + (["numpy"] if elecstat.numpy else [])
+        for dim in (2, 3):
+            q = [rng.uniform(-1e-9, 1e-9) for i in range(300)]
+            sources = [[rng.uniform(-1, 1) for i in range(300)]
+                       for j in range(dim)]
+            targets = [[rng.uniform(-3, 3) for i in range(100)]
+                       for j in range(dim)]
+            tree = elecstat.ChargeTree(q, sources, leaf_size=4)
+            for backend in backends:
+                # theta=0 is the direct sum
+                V = tree.potential(targets, theta=0.0, backend=backend)
+                V_direct = elecstat.potential_batch(q, sources, targets,
+                                                    backend=backend)
+                for a, b in zip(V, V_direct):
+                    self.assertTrue(abs(a - b) < 1e-9 * abs(b))
+                E = elecstat.field_tree(q, sources, targets, theta=0.5,
+                                        backend=backend)
+                self.assertEqual(len(E), dim)
+                # Higher orders and smaller opening angles are more accurate
+                for kind in ("potential", "field"):
+                    errors = [tree.error(targets, kind, theta, order,
+                                         backend=backend,
+                                         group_size=4)["rms"]
+                              for theta, order in ((0.5, 0), (0.5, 1),
+                                                   (0.5, 2), (0.25, 2))]
+                    self.assertTrue(errors[0] > errors[1] > errors[2]
+                                    > errors[3])
+                    self.assertTrue(errors[2] < 1e-2)
+
+        self.assertRaises(ValueError, elecstat.ChargeTree, [], ([], []))
+        tree = elecstat.ChargeTree([1.0], ([0.0], [0.0]))
+        self.assertRaises(ValueError, tree.potential, ([1.0], [1.0]),
+                          order=3)
+        # No targets give empty results, like the batch functions
+        self.assertEqual(len(tree.potential(([], []))), 0)
+        self.assertEqual([len(E_i) for E_i in tree.field(([], []))], [0, 0])
+        self.assertRaises(ValueError, tree.error, ([1.0], [1.0]), sample=0)
+
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)